@@ -1,5 +1,28 @@
 import streamlit as st
-from src.run_agent import load_system_prompt, ask_agent, memory
+# memory và các tool được tạo một lần khi import src.run_agent; Streamlit không import lại module khi rerun
+from src.run_agent import load_system_prompt, ask_agent_stream, memory
+
+CONVERSATIONS_PAGE_SIZE = 20
+MESSAGES_PAGE_SIZE = 50
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_system_prompt() -> str:
+    return load_system_prompt()
+
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def get_conversations(user_id: int, version: int, limit: int):
+    # version = memory.data_version(user_id): cache chỉ hết hạn khi user có ghi mới
+    return memory.get_conversations(user_id, limit=limit)
+
+
+def load_messages(conversation_id: int, before_id: int = None) -> list:
+    """Tải một trang tin nhắn (mới nhất trước) và nhớ id cũ nhất để tải tiếp."""
+    msgs = memory.get_conversation_messages(conversation_id, limit=MESSAGES_PAGE_SIZE, before_id=before_id)
+    st.session_state.oldest_message_id = msgs[0]["id"] if msgs else None
+    st.session_state.has_older_messages = len(msgs) == MESSAGES_PAGE_SIZE
+    return [{"role": m["role"], "content": m["content"]} for m in msgs]
 
 # ------------------ INIT SESSION ------------------
 if "is_logged_in" not in st.session_state:
@@ -27,6 +50,13 @@ if "messages" not in st.session_state:
 if "active_conversation_id" not in st.session_state:
     st.session_state.active_conversation_id = None
 
+if "conversation_pages" not in st.session_state:
+    st.session_state.conversation_pages = 1
+
+if "has_older_messages" not in st.session_state:
+    st.session_state.has_older_messages = False
+    st.session_state.oldest_message_id = None
+
 # ---------- AUTH UI (sidebar) ----------
 st.sidebar.title("👤 Tài khoản")
 if not st.session_state.is_logged_in:
@@ -70,7 +100,8 @@ else:
     st.sidebar.markdown(f"**Xin chào:** `{st.session_state.username}`")
     if st.sidebar.button("🚪 Đăng xuất"):
         # clear only keys we want (tránh xóa config quan trọng)
-        for k in ["is_logged_in","user_id","username","messages","active_conversation_id"]:
+        for k in ["is_logged_in","user_id","username","messages","active_conversation_id",
+                  "conversation_pages","has_older_messages","oldest_message_id"]:
             if k in st.session_state:
                 del st.session_state[k]
         st.rerun()
@@ -89,6 +120,7 @@ else:
     if st.sidebar.button("➕ Cuộc trò chuyện mới"):
         # Xóa session messages
         st.session_state.messages = []
+        st.session_state.has_older_messages = False
         # # Tạo conversation mới trong DB
         new_conv_id = memory.create_conversation(
             st.session_state.user_id,
@@ -97,25 +129,34 @@ else:
         st.session_state.active_conversation_id = new_conv_id
         st.rerun()
 
-    convs = memory.get_conversations(st.session_state.user_id)  # now safe: user_id exists\
+    page_limit = CONVERSATIONS_PAGE_SIZE * st.session_state.conversation_pages
+    convs = get_conversations(st.session_state.user_id, memory.data_version(st.session_state.user_id), page_limit)
     if not convs:
         st.sidebar.info("Chưa có lịch sử")
     else:
         for conv in convs:
             label = conv['title'] if not conv['created_at'] else f"{conv['title']} ({conv['created_at']:%d/%m %H:%M})"
             if st.sidebar.button(label, key=f"load_{conv['id']}"):
-                msgs = memory.get_conversation_messages(conv['id'])
-                st.session_state.messages = [{"role": m["role"], "content": m["content"]} for m in msgs]
+                # chỉ tải trang tin nhắn mới nhất, phần cũ hơn tải khi người dùng yêu cầu
+                st.session_state.messages = load_messages(conv['id'])
                 st.session_state.active_conversation_id = conv['id']
                 st.rerun()
+        if len(convs) == page_limit and st.sidebar.button("Xem thêm"):
+            st.session_state.conversation_pages += 1
+            st.rerun()
 
 # --- Chat mode ---
 if "user_id" not in st.session_state or st.session_state.user_id is None:
     st.warning("Vui lòng đăng nhập để sử dụng chat.")   
 else:
-    system_prompt = load_system_prompt()
+    system_prompt = get_system_prompt()
     st.subheader("💬 Chat với AI Agent")
-    
+
+    if st.session_state.has_older_messages and st.button("⬆️ Tải tin nhắn cũ hơn"):
+        older = load_messages(st.session_state.active_conversation_id, before_id=st.session_state.oldest_message_id)
+        st.session_state.messages = older + st.session_state.messages
+        st.rerun()
+
     for msg in st.session_state.messages:
         with st.chat_message("user" if msg["role"] == "user" else "assistant"):
             st.markdown(msg["content"])
@@ -130,12 +171,35 @@ else:
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Đang xử lý..."):
-                if st.session_state.active_conversation_id is None:
-                    # Nếu không có, tạo một cuộc hội thoại mới
-                    st.session_state.active_conversation_id = memory.create_conversation(st.session_state.user_id, title="")
-                answer, observations, trace, conv_id = ask_agent(st.session_state.user_id, prompt, system_prompt=system_prompt, conversation_id=st.session_state.active_conversation_id)
-                # st.session_state.active_conversation_id = conv_id
+            if st.session_state.active_conversation_id is None:
+                # Nếu không có, tạo một cuộc hội thoại mới
+                st.session_state.active_conversation_id = memory.create_conversation(st.session_state.user_id, title="")
+
+            # Thought/Action hiện dần trong khung trạng thái, Answer stream ngay bên dưới
+            status = st.status("Đang xử lý...", expanded=True)
+            result = {}
+
+            def answer_stream():
+                step_box, step_text = None, ""
+                for event in ask_agent_stream(st.session_state.user_id, prompt, system_prompt=system_prompt,
+                                              conversation_id=st.session_state.active_conversation_id):
+                    if event["type"] == "step_token":
+                        if step_box is None:
+                            step_box = status.empty()
+                        step_text += event["text"]
+                        step_box.markdown(step_text)
+                    elif event["type"] == "observation":
+                        status.caption(event["text"][:500] + ("..." if len(event["text"]) > 500 else ""))
+                        step_box, step_text = None, ""
+                    elif event["type"] == "answer_token":
+                        yield event["text"]
+                    elif event["type"] == "done":
+                        result.update(event)
+
+            answer = st.write_stream(answer_stream())
+            status.update(label="Hoàn tất", state="complete", expanded=False)
+            if not isinstance(answer, str) or not answer:
+                answer = result.get("final_answer") or "Xin lỗi, tôi chưa tìm được câu trả lời."
                 st.markdown(answer)
                 
         st.session_state.messages.append({"role": "assistant", "content": answer})
@@ -0,0 +1,116 @@
+import multiprocessing as mp
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from migrate_db import PRICE_INSERT_SQL
+from parquet_store import write_prices_parquet, import_prices_parquet
+
+CREATE_PRICES_SQL = """
+CREATE TABLE vnstock_prices (
+    time TEXT, open REAL, high REAL, low REAL, close REAL, volume INTEGER, ticker TEXT
+)
+"""
+
+
+def make_prices(n_tickers: int, n_days: int) -> pd.DataFrame:
+    """Synthetic daily prices shaped like the vnstock download."""
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range('2015-01-01', periods=n_days).strftime('%Y-%m-%d')
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    close = rng.uniform(5, 100, n_tickers * n_days).round(2)
+    return pd.DataFrame({
+        'time': np.tile(days, n_tickers),
+        'open': close,
+        'high': (close * 1.02).round(2),
+        'low': (close * 0.98).round(2),
+        'close': close,
+        'volume': rng.integers(0, 5_000_000, n_tickers * n_days),
+        'ticker': np.repeat(tickers, n_days),
+    })
+
+
+def _import_csv(csv_file, db_file):
+    conn = sqlite3.connect(db_file)
+    conn.execute(CREATE_PRICES_SQL)
+    df = pd.read_csv(csv_file)
+    with conn:
+        conn.executemany(PRICE_INSERT_SQL, df.itertuples(index=False, name=None))
+    conn.close()
+
+
+def _import_parquet(parquet_root, db_file):
+    conn = sqlite3.connect(db_file)
+    conn.execute(CREATE_PRICES_SQL)
+    with conn:
+        import_prices_parquet(conn, parquet_root, PRICE_INSERT_SQL)
+    conn.close()
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident memory of this process. VmHWM is reset on exec, unlike
+    ru_maxrss which a spawned child inherits from its parent on Linux.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss: KiB trên Linux, byte trên macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def _measure(target, args, results):
+    start = time.perf_counter()
+    target(*args)
+    elapsed = time.perf_counter() - start
+    results.put((elapsed, peak_rss_mb()))
+
+
+def run_isolated(target, *args) -> tuple:
+    """Run one import in a fresh process so peak RSS is measured per format."""
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(target, args, results))
+    proc.start()
+    elapsed, peak_mb = results.get()
+    proc.join()
+    return elapsed, peak_mb
+
+
+def folder_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in Path(path).rglob('*') if p.is_file())
+
+
+def benchmark(n_tickers: int = 1600, n_days: int = 500) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        df = make_prices(n_tickers, n_days)
+        csv_file = tmp / 'prices.csv'
+        parquet_root = tmp / 'prices_parquet'
+        df.to_csv(csv_file, index=False)
+        write_prices_parquet(df, parquet_root, partition_by='ticker')
+        del df
+
+        csv_time, csv_mem = run_isolated(_import_csv, csv_file, tmp / 'csv.db')
+        pq_time, pq_mem = run_isolated(_import_parquet, parquet_root, tmp / 'parquet.db')
+
+        print(f"{n_tickers * n_days} rows ({n_tickers} tickers x {n_days} days)")
+        print(f"{'format':<10}{'size (MB)':>12}{'import (s)':>12}{'peak RSS (MB)':>16}")
+        print(f"{'csv':<10}{csv_file.stat().st_size / 2**20:>12.1f}{csv_time:>12.2f}{csv_mem:>16.1f}")
+        print(f"{'parquet':<10}{folder_size(parquet_root) / 2**20:>12.1f}{pq_time:>12.2f}{pq_mem:>16.1f}")
+
+# Main execution
+if __name__ == "__main__":
+    n_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else 1600
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    benchmark(n_tickers, n_days)
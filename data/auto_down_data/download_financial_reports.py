@@ -1,18 +1,187 @@
 import vnstock as vs
 from pathlib import Path
 import pandas as pd
+import argparse
+import csv
+import json
+import os
+import shutil
 import time
 from download_symbol_screener import get_symbol
 
-def download_vnstock_financial_reports(symbols, period, output_dir, lang: str = 'en', batch_size: int = 10):
-    start_time = time.time()
+# Loại báo cáo -> file CSV đầu ra
+REPORT_FILES = {
+    'income_statement': 'income_statements.csv',
+    'balance_sheet': 'balance_sheets.csv',
+    'cash_flow': 'cash_flows.csv',
+    'ratio': 'ratios.csv',
+}
+PROGRESS_FILE = 'financial_reports.progress'
+
+
+def flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Flatten MultiIndex report columns (e.g. the ratio report) to one header row,
+    using the last non-empty level unless that name is ambiguous.
+    """
+    if not isinstance(df.columns, pd.MultiIndex):
+        return df
+    # cột thêm sau như df['ticker'] có dạng ('ticker', '')
+    last = [next((str(part) for part in reversed(col) if str(part)), '') for col in df.columns]
+    df = df.copy()
+    df.columns = [
+        name if last.count(name) == 1 else '_'.join(str(part) for part in col if str(part))
+        for name, col in zip(last, df.columns)
+    ]
+    return df
+
+
+def _read_header(path: Path) -> list:
+    with open(path, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+
+def _load_progress(progress_path: Path) -> list:
+    if not progress_path.exists():
+        return []
+    with open(progress_path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _rewrite_csv(path: Path, header: list, rows: int = None) -> None:
+    """
+    Stream `path` into a copy under `header`, padding old rows with empty
+    cells for columns added at the end and keeping at most `rows` data rows,
+    then swap it in atomically.
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(path, newline='', encoding='utf-8') as src, \
+            open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst, lineterminator='\n')
+        padding = [''] * (len(header) - len(next(reader, [])))
+        writer.writerow(header)
+        for i, row in enumerate(reader):
+            if rows is not None and i >= rows:
+                break
+            writer.writerow(row + padding)
+    os.replace(tmp_path, path)
+
+
+def _restore_offsets(output_dir: Path, progress: list) -> None:
+    """
+    Cut each CSV back to the last completed symbol, dropping rows of a symbol
+    that was only partly written before a crash.
+
+    The recorded byte offset only holds while the header is unchanged; if the
+    header was widened after the last completed symbol every row has moved,
+    so the file is cut by the recorded row count instead.
+    """
+    offsets = progress[-1]['offsets'] if progress else {}
+    rows = progress[-1]['rows'] if progress else {}
+    for file_name in REPORT_FILES.values():
+        path = output_dir / file_name
+        if not path.exists():
+            continue
+        size = offsets.get(file_name, 0)
+        if path.stat().st_size == size:
+            continue
+        print(f"Truncating {file_name} to last completed symbol ({rows.get(file_name, 0)} rows)")
+        if size == 0:
+            with open(path, 'r+b') as f:
+                f.truncate(0)
+        else:
+            _rewrite_csv(path, _read_header(path), rows.get(file_name, 0))
+
+
+def _append_report(df: pd.DataFrame, path: Path) -> int:
+    """
+    Append one symbol's report to `path` exactly once.
+
+    Report layouts differ between symbols (banks and non-banks have different
+    line items), so the CSV header is the union of every column seen so far:
+    cells of columns a report lacks stay empty, and new columns widen the
+    header and pad the rows already written.
+    """
+    df = flatten_columns(df)
+    df.columns = [str(c) for c in df.columns]
+    duplicated = df.columns[df.columns.duplicated()].tolist()
+    if duplicated:
+        raise ValueError(f"Report for {path.name} has duplicate columns: {duplicated}")
+    if df.empty:
+        # Không ghi gì cho báo cáo rỗng, tránh tạo header chỉ có vài cột
+        return 0
+    exists = path.exists() and path.stat().st_size > 0
+    if exists:
+        header = _read_header(path)
+        extra = [c for c in df.columns if c not in header]
+        if extra:
+            print(f"Adding {len(extra)} new columns to {path.name}")
+            header = header + extra
+            _rewrite_csv(path, header)
+        df = df.reindex(columns=header)
+    df.to_csv(path, mode='a', header=not exists, index=False, lineterminator='\n')
+    return len(df)
+
+
+def download_vnstock_financial_reports(symbols, period, output_dir, lang: str = 'en', batch_size: int = 10,
+                                       resume: bool = True, output_format: str = 'csv',
+                                       parquet_dir=None) -> dict:
+    """
+    Download the four financial reports per symbol and stream them to CSV.
 
-    # Khởi tạo các DataFrame để lưu trữ dữ liệu cho từng loại báo cáo
-    all_income_statements = pd.DataFrame()
-    all_balance_sheets = pd.DataFrame()
-    all_cash_flows = pd.DataFrame()
-    all_ratios = pd.DataFrame()
+    Each symbol's reports are appended once, so memory stays constant and
+    the work is linear in the number of symbols; a file is only rewritten
+    when a symbol brings columns it has not seen (see `_append_report`). After every symbol a line
+    with the CSV sizes and row totals is appended to a progress file; with
+    `resume` the next run skips completed symbols and cuts away anything
+    written after the last completed one.
 
+    With `output_format='parquet'` each report is written to
+    `parquet_dir/<report>/ticker=XXX/part-0.parquet` instead; a symbol
+    rewritten after a crash simply replaces its own file.
+
+    Args:
+        symbols (list): Stock symbols to download.
+        period (str): Report period passed to vnstock ('year', 'quarter', ...).
+        output_dir (str): Folder for the CSV files.
+        lang (str): Report language.
+        batch_size (int): Symbols per batch before waiting for the rate limit.
+        resume (bool): Continue from the progress file instead of starting over.
+        output_format (str): 'csv' or 'parquet'.
+        parquet_dir (str): Root of the Parquet datasets, defaults to `output_dir/parquet`.
+
+    Returns:
+        dict: Rows written per report file (including earlier runs when resuming).
+    """
+    if output_format not in ('csv', 'parquet'):
+        raise ValueError(f"Invalid output format: {output_format}. Must be 'csv' or 'parquet'")
+    if output_format == 'parquet':
+        from parquet_store import write_report_parquet
+
+    output_dir = Path(output_dir)
+    parquet_dir = Path(parquet_dir) if parquet_dir else output_dir / 'parquet'
+    progress_path = output_dir / PROGRESS_FILE
+
+    if resume:
+        progress = _load_progress(progress_path)
+    else:
+        progress = []
+        for file_name in list(REPORT_FILES.values()) + [PROGRESS_FILE]:
+            if (output_dir / file_name).exists():
+                os.remove(output_dir / file_name)
+        for file_name in REPORT_FILES.values():
+            shutil.rmtree(parquet_dir / Path(file_name).stem, ignore_errors=True)
+    if output_format == 'csv':
+        _restore_offsets(output_dir, progress)
+
+    completed = {entry['symbol'] for entry in progress}
+    totals = dict(progress[-1]['rows']) if progress else {name: 0 for name in REPORT_FILES.values()}
+    symbols = [s for s in symbols if s not in completed]
+    if completed:
+        print(f"Resuming: {len(completed)} symbols already done, {len(symbols)} left")
+
+    start_time = time.time()
     while symbols:
         # Xử lý một batch tối đa batch_size mã chứng khoán
         batch = symbols[:batch_size]
@@ -22,50 +191,36 @@ def download_vnstock_financial_reports(symbols, period, output_dir, lang: str =
             try:
                 # Lấy dữ liệu chứng khoán
                 finance = vs.Finance(symbol=symbol, source='VCI')
-                
-                # Lấy các báo cáo tài chính
-                income_statement = finance.income_statement(period=period, lang=lang)
-                balance_sheet = finance.balance_sheet(period=period, lang=lang)
-                cash_flow = finance.cash_flow(period=period, lang=lang)
-                ratios = finance.ratio(period=period, lang=lang)
-
-                # Thêm cột ticker vào mỗi báo cáo
-                income_statement['ticker'] = symbol
-                balance_sheet['ticker'] = symbol
-                cash_flow['ticker'] = symbol
-                ratios['ticker'] = symbol
-                
-                # Lọc dữ liệu cho năm 2024 và 2025
-                # income_statement = income_statement[income_statement['yearReport'].isin([2024, 2025])]
-                # balance_sheet = balance_sheet[balance_sheet['yearReport'].isin([2024, 2025])]
-                # cash_flow = cash_flow[cash_flow['yearReport'].isin([2024, 2025])]
-                # ratios = ratios[ratios['yearReport'].isin([2024, 2025])]
-                
-                # Gộp dữ liệu vào các DataFrame chung
-                all_income_statements = pd.concat([all_income_statements, income_statement], ignore_index=True)
-                all_balance_sheets = pd.concat([all_balance_sheets, balance_sheet], ignore_index=True)
-                all_cash_flows = pd.concat([all_cash_flows, cash_flow], ignore_index=True)
-                all_ratios = pd.concat([all_ratios, ratios], ignore_index=True)
-                              
-                income_statements_path = Path(output_dir) / 'income_statements.csv'
-                balance_sheets_path = Path(output_dir) / 'balance_sheets.csv'
-                cash_flows_path = Path(output_dir) / 'cash_flows.csv'
-                ratios_path = Path(output_dir) / 'ratios.csv'
-                
-                # Lưu tất cả dữ liệu vào các file CSV riêng biệt
-                all_income_statements.to_csv(income_statements_path, mode='a',
-                                            header=not pd.io.common.file_exists(income_statements_path), index=False)
-                all_balance_sheets.to_csv(balance_sheets_path, mode='a',
-                                            header=not pd.io.common.file_exists(balance_sheets_path), index=False)
-                all_cash_flows.to_csv(cash_flows_path, mode='a',
-                                            header=not pd.io.common.file_exists(cash_flows_path), index=False)
-                all_ratios.to_csv(ratios_path, mode='a',
-                                            header=not pd.io.common.file_exists(ratios_path), index=False)
-
-                print(f"Data for {symbol} processed.")
-
+                reports = {
+                    'income_statement': finance.income_statement(period=period, lang=lang),
+                    'balance_sheet': finance.balance_sheet(period=period, lang=lang),
+                    'cash_flow': finance.cash_flow(period=period, lang=lang),
+                    'ratio': finance.ratio(period=period, lang=lang),
+                }
             except Exception as e:
                 print(f"Failed to fetch data for {symbol}: {e}")
+                continue
+
+            # Ghi mỗi báo cáo của mã này đúng một lần
+            offsets = {}
+            for report, df in reports.items():
+                df['ticker'] = symbol
+                file_name = REPORT_FILES[report]
+                if output_format == 'parquet':
+                    df = flatten_columns(df)
+                    write_report_parquet(df, parquet_dir / Path(file_name).stem, symbol)
+                    totals[file_name] += len(df)
+                    continue
+                path = output_dir / file_name
+                totals[file_name] += _append_report(df, path)
+                offsets[file_name] = path.stat().st_size if path.exists() else 0
+
+            with open(progress_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'symbol': symbol, 'offsets': offsets, 'rows': totals}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            print(f"Data for {symbol} processed.")
 
         # Chờ sau khi xử lý một batch nếu còn mã chứng khoán
         if symbols:
@@ -76,23 +231,60 @@ def download_vnstock_financial_reports(symbols, period, output_dir, lang: str =
             start_time = time.time()
 
     print("All financial reports have been saved successfully.")
+    return totals
+
+
+def verify_financial_reports(output_dir, parquet_dir=None) -> bool:
+    """
+    Check that every report CSV holds exactly the number of rows recorded in
+    the progress file, i.e. nothing was lost or written twice.
+    """
+    output_dir = Path(output_dir)
+    parquet_dir = Path(parquet_dir) if parquet_dir else output_dir / 'parquet'
+    progress = _load_progress(output_dir / PROGRESS_FILE)
+    expected = progress[-1]['rows'] if progress else {}
+    ok = True
+    for file_name in REPORT_FILES.values():
+        path = output_dir / file_name
+        parquet_root = parquet_dir / Path(file_name).stem
+        if parquet_root.exists():
+            import pyarrow.dataset as ds
+            actual = ds.dataset(parquet_root, format='parquet').count_rows()
+        else:
+            actual = len(pd.read_csv(path)) if path.exists() and path.stat().st_size else 0
+        if actual != expected.get(file_name, 0):
+            print(f"{file_name}: expected {expected.get(file_name, 0)} rows, found {actual}")
+            ok = False
+    return ok
 
 # Main execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download vnstock financial reports")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="Write CSV files or per-ticker Parquet datasets")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress and start over")
+    args = parser.parse_args()
+
     # Khởi tạo tham số
     period = 'month'
     lang = 'en'
-    
+
     # Định nghĩa đường dẫn đầu ra
     output_dir = 'csv_file'
+    parquet_dir = 'parquet'
     symbol_path = 'csv_file/vnstock_symbols.csv'
-    
+
     current_dir = Path(__file__).parent.resolve()
-    symbol_file = current_dir.parent.resolve() / symbol_path 
+    symbol_file = current_dir.parent.resolve() / symbol_path
     output_dir = current_dir.parent.resolve() / output_dir
+    parquet_dir = current_dir.parent.resolve() / parquet_dir
 
     # Lấy mã chứng khoán từ file CSV
-    symbols = get_symbol(symbol_file) 
-    download_vnstock_financial_reports(symbols[:2], period, output_dir, lang, batch_size=10)
+    symbols = get_symbol(symbol_file)
+    download_vnstock_financial_reports(symbols[:2], period, output_dir, lang, batch_size=10,
+                                       resume=not args.restart, output_format=args.format,
+                                       parquet_dir=parquet_dir)
+    if verify_financial_reports(output_dir, parquet_dir):
+        print("Row counts match.")
 
     print("Completed !!!")
@@ -1,70 +1,264 @@
 import vnstock as vs
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import pandas as pd
+import argparse
+import asyncio
+import random
+import sqlite3
 import time
 from pathlib import Path
 from download_symbol_screener import get_symbol
+from migrate_db import migrate, upsert_prices
+from indicators import update_indicators
+from rollups import update_rollups
 
-def download_vnstock_prices(symbols, start_date, end_date, csv_file, batch_size: int = 10):
+# Nhịp của vòng lặp batch cũ (30 mã rồi chờ đủ 70 giây), đã chạy ổn với nguồn VCI.
+# VCI không công bố quota chính xác nên giữ nguyên nhịp này, không tăng tốc
+VCI_RATE_LIMIT = 30
+VCI_RATE_PERIOD = 70.0
+
+PRICE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume', 'ticker']
+
+
+class TokenBucket:
     """
-    Fetch stock data for given symbols and save to CSV, respecting rate limits.
-    
+    Async token bucket that never lets more than `limit` requests start in
+    any window of `period` seconds.
+
+    A bucket holding `burst` tokens that refills at r tokens/s admits at most
+    burst + r * period requests per window, so the refill rate is
+    (limit - burst) / period.
+    """
+
+    def __init__(self, limit: int = VCI_RATE_LIMIT, period: float = VCI_RATE_PERIOD, burst: int = 1):
+        if not 0 < burst < limit:
+            raise ValueError("burst must be between 1 and limit - 1")
+        self.capacity = burst
+        self.rate = (limit - burst) / period
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def fetch_history(quote_factory, symbol, start_date, end_date) -> pd.DataFrame:
+    """Blocking fetch of daily prices for one symbol."""
+    stock = quote_factory(symbol=symbol, source='VCI')
+    df = stock.history(start=start_date, end=end_date, interval='1D')
+    df['ticker'] = symbol
+    return df
+
+
+async def _fetch_with_retry(symbol, start_date, end_date, bucket, executor, quote_factory,
+                            max_retries: int, backoff: float):
+    loop = asyncio.get_running_loop()
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            return await loop.run_in_executor(executor, fetch_history, quote_factory, symbol, start_date, end_date)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            # Full jitter: chờ ngẫu nhiên trong [0, backoff * 2^attempt]
+            delay = random.uniform(0, backoff * 2 ** attempt)
+            print(f"Retry {attempt + 1}/{max_retries} for {symbol} in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+
+
+async def download_vnstock_prices_async(symbols, start_date, end_date, csv_file, max_workers: int = 4,
+                                        rate_limit: int = VCI_RATE_LIMIT, rate_period: float = VCI_RATE_PERIOD,
+                                        max_retries: int = 3, backoff: float = 2.0, quote_factory=None,
+                                        sink=None) -> dict:
+    """
+    Fetch prices for many symbols concurrently under a shared rate limit and
+    append them to a CSV file (or hand them to `sink`).
+
     Args:
-        symbols (list): List of stock symbols to fetch data for.
-        start_date (str): Start date for historical data (YYYY-MM-DD).
+        symbols (list): Stock symbols to fetch.
+        start_date (str | dict): Start date (YYYY-MM-DD), or a mapping symbol -> start date.
         end_date (str): End date for historical data (YYYY-MM-DD).
         csv_file (str): Path to the output CSV file.
-        batch_size (int): Number of symbols to process per minute.
-        request_limit (int): API request limit per minute.
+        max_workers (int): Number of fetches in flight at once.
+        rate_limit (int): Requests allowed per `rate_period` seconds.
+        rate_period (float): Length of the quota window in seconds.
+        max_retries (int): Retries per symbol after the first failure.
+        backoff (float): Base delay in seconds for jittered exponential backoff.
+        quote_factory: Callable with the `vs.Quote` signature, defaults to `vs.Quote`.
+        sink: Callable taking each symbol's DataFrame; defaults to appending to `csv_file`.
+
+    Returns:
+        dict: `saved` and `failed` symbol lists, `rows` written and `elapsed` seconds.
     """
-    start_time = time.time()
+    quote_factory = quote_factory or vs.Quote
+    if sink is None:
+        def sink(df):
+            df.to_csv(csv_file, mode='a', columns=PRICE_COLUMNS,
+                      header=not pd.io.common.file_exists(csv_file), index=False)
+    bucket = TokenBucket(rate_limit, rate_period, burst=min(max_workers, rate_limit - 1))
+    queue = asyncio.Queue()
+    for symbol in symbols:
+        queue.put_nowait(symbol)
 
-    while symbols:
-        # Process a batch of up to batch_size symbols
-        batch = symbols[:batch_size]
-        symbols = symbols[batch_size:]  # Remove processed symbols from the list
+    total = len(symbols)
+    summary = {"saved": [], "failed": [], "rows": 0}
+    started = time.monotonic()
 
-        for symbol in batch:
+    async def worker(executor):
+        while True:
             try:
-                # Fetch stock data
-                stock = vs.Quote(symbol=symbol, source='VCI')
-                df = stock.history(start=start_date, end=end_date, interval='1D')
-                df['ticker'] = symbol
-
-                # Append data to CSV
-                df.to_csv(csv_file, mode='a', 
-                          columns=['time', 'open', 'high', 'low', 'close', 'volume', 'ticker'],
-                          header=not pd.io.common.file_exists(csv_file), index=False)
-                
-                print(f"Data for {symbol} saved to {csv_file}.")
-
+                symbol = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = start_date[symbol] if isinstance(start_date, dict) else start_date
+            try:
+                df = await _fetch_with_retry(symbol, start, end_date, bucket, executor, quote_factory,
+                                             max_retries, backoff)
+                # Ghi trong event loop nên không có hai worker ghi cùng lúc
+                sink(df)
+                summary["saved"].append(symbol)
+                summary["rows"] += len(df)
             except Exception as e:
-                print(f"Failed to fetch data for {symbol}: {e}")
+                summary["failed"].append(symbol)
+                print(f"Failed to fetch data for {symbol} after {max_retries} retries: {e}")
+
+            done = len(summary["saved"]) + len(summary["failed"])
+            elapsed = time.monotonic() - started
+            print(f"[{done}/{total}] {symbol} done - {done / elapsed:.2f} symbols/s, "
+                  f"{summary['rows']} rows, ETA {(total - done) * elapsed / done:.0f}s")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        await asyncio.gather(*(worker(executor) for _ in range(max_workers)))
+
+    summary["elapsed"] = time.monotonic() - started
+    print(f"Saved {len(summary['saved'])}/{total} symbols ({summary['rows']} rows) "
+          f"in {summary['elapsed']:.1f}s; failed: {summary['failed'] or 'none'}")
+    return summary
+
 
-        # Wait after processing a batch if more symbols remain
-        if symbols:
-            wait_time = max(70 - (time.time() - start_time), 0)
-            if wait_time > 0:
-                print(f"Waiting {wait_time:.2f} seconds before processing next batch.")
-                time.sleep(wait_time)
-            start_time = time.time()
+def download_vnstock_prices(symbols, start_date, end_date, csv_file, **kwargs) -> dict:
+    """
+    Fetch stock data for given symbols and save to CSV, respecting rate limits.
+
+    Synchronous wrapper around `download_vnstock_prices_async`; see it for arguments.
+    """
+    return asyncio.run(download_vnstock_prices_async(symbols, start_date, end_date, csv_file, **kwargs))
+
+
+def get_last_price_dates(conn: sqlite3.Connection) -> dict:
+    """Return ticker -> latest `time` already stored in vnstock_prices."""
+    rows = conn.execute("SELECT ticker, MAX(time) FROM vnstock_prices GROUP BY ticker").fetchall()
+    return {ticker: last_time for ticker, last_time in rows}
+
+
+def price_rows(df: pd.DataFrame) -> list:
+    """Convert a downloaded price DataFrame into rows for `upsert_prices`."""
+    df = df.copy()
+    df['time'] = pd.to_datetime(df['time']).dt.strftime('%Y-%m-%d')
+    df = df[PRICE_COLUMNS].astype(object).where(df[PRICE_COLUMNS].notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+def refresh_vnstock_prices(symbols, db_file, end_date, default_start: str = '2024-01-01', **kwargs) -> dict:
+    """
+    Incrementally refresh vnstock_prices in `db_file`.
+
+    Only the days after each ticker's latest stored date are fetched; tickers
+    not in the table yet start from `default_start`. Rows are upserted on
+    (ticker, time), so running it twice never duplicates history.
+
+    Args:
+        symbols (list): Stock symbols to refresh.
+        db_file (str): Path to vnstock_data.db.
+        end_date (str): Last day to fetch (YYYY-MM-DD).
+        default_start (str): Start date for tickers without any stored prices.
+        **kwargs: Passed to `download_vnstock_prices_async`.
+
+    Returns:
+        dict: Download summary, plus `skipped` symbols that were already up to date.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        migrate(conn)
+        last_dates = get_last_price_dates(conn)
+
+        start_dates = {}
+        skipped = []
+        for symbol in symbols:
+            last_time = last_dates.get(symbol)
+            if last_time is None:
+                start_dates[symbol] = default_start
+                continue
+            start = (datetime.strptime(last_time[:10], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            if start > end_date:
+                skipped.append(symbol)
+            else:
+                start_dates[symbol] = start
+        print(f"{len(start_dates)} symbols to refresh, {len(skipped)} already up to date")
+
+        def upsert(df):
+            if df.empty:
+                return
+            with conn:
+                upsert_prices(conn, price_rows(df))
+
+        summary = asyncio.run(download_vnstock_prices_async(
+            list(start_dates), start_dates, end_date, None, sink=upsert, **kwargs))
+        # chỉ tính chỉ báo và bảng tổng hợp cho các phiên mới
+        summary["indicators"] = update_indicators(conn)
+        summary["rollups"] = update_rollups(conn)
+        with conn:
+            conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    summary["skipped"] = skipped
+    return summary
 
 # Main execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download daily vnstock prices")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Fetch only days missing from vnstock_data.db and upsert them")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="Write one CSV file or a partitioned Parquet dataset")
+    parser.add_argument("--partition-by", choices=["ticker", "year"], default="ticker",
+                        help="Parquet partition column")
+    args = parser.parse_args()
+
     # Initialize vnstock Listing
     start_date = '2024-01-01'
     end_date = datetime.now().strftime("%Y-%m-%d")
-    # number_stop = 10
-        
+
     file_path = 'csv_file/vnstock_data_prices.csv'
     symbol_path = 'csv_file/vnstock_symbols.csv'
-    
+    db_path = 'vnstock_data.db'
+    parquet_path = 'parquet/vnstock_prices'
+
     current_dir = Path(__file__).parent.resolve()
     symbol_file = current_dir.parent.resolve() / symbol_path
-    prices_file = current_dir.parent.resolve() / file_path 
+    prices_file = current_dir.parent.resolve() / file_path
+    db_file = current_dir.parent.resolve() / db_path
+    parquet_root = current_dir.parent.resolve() / parquet_path
 
-    symbols = get_symbol(symbol_file) 
-    download_vnstock_prices(symbols, start_date, end_date, prices_file, batch_size=30)
-    # download_vnstock_prices(symbols, number_stop, start_date, end_date, prices_file, batch_size=30)
+    symbols = get_symbol(symbol_file)
+    if args.incremental:
+        refresh_vnstock_prices(symbols, db_file, end_date, default_start=start_date, max_workers=4)
+    elif args.format == "parquet":
+        from parquet_store import write_prices_parquet
+        download_vnstock_prices(symbols, start_date, end_date, None, max_workers=4,
+                                sink=lambda df: write_prices_parquet(df, parquet_root, args.partition_by))
+    else:
+        download_vnstock_prices(symbols, start_date, end_date, prices_file, max_workers=4)
 
-    print("Completed !!!")
\ No newline at end of file
+    print("Completed !!!")
@@ -0,0 +1,158 @@
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from migrate_db import migrate
+
+# Loại báo cáo -> tên file/thư mục do download_financial_reports.py ghi ra
+REPORT_SOURCES = {
+    'income_statement': 'income_statements',
+    'balance_sheet': 'balance_sheets',
+    'cash_flow': 'cash_flows',
+    'ratio': 'ratios',
+}
+# Cột khóa -> các tên có thể gặp (tiếng Anh / tiếng Việt của vnstock)
+KEY_ALIASES = {
+    'ticker': ('ticker', 'CP'),
+    'year_report': ('yearReport', 'Năm'),
+    'length_report': ('lengthReport', 'Kỳ'),
+}
+VALUE_UPSERT_SQL = """
+    INSERT OR REPLACE INTO vnstock_financial_values (ticker, year_report, length_report, item_id, value)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def _key_columns(columns) -> dict:
+    """Map each key column of a report to its name in `columns`."""
+    keys = {}
+    for key, aliases in KEY_ALIASES.items():
+        found = [c for c in columns if c in aliases]
+        if not found:
+            raise ValueError(f"Report has no {key} column (expected one of {', '.join(aliases)})")
+        keys[key] = found[0]
+    return keys
+
+
+def to_long(report_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turn a wide report chunk into (ticker, year_report, length_report, item, value) rows.
+
+    Non-numeric and empty cells are dropped, so columns that never hold a
+    number cost nothing.
+    """
+    keys = _key_columns(report_df.columns)
+    df = report_df.rename(columns={name: key for key, name in keys.items()})
+    df = df.dropna(subset=list(keys))
+    long = df.melt(id_vars=list(keys), var_name='item', value_name='value')
+    long['value'] = pd.to_numeric(long['value'], errors='coerce')
+    long = long.dropna(subset=['value'])
+    long['year_report'] = long['year_report'].astype('int64')
+    long['length_report'] = long['length_report'].astype('int64')
+    return long
+
+
+class _ItemIds:
+    """item name -> item_id for one report, inserting unseen names on the fly."""
+
+    def __init__(self, conn: sqlite3.Connection, report: str):
+        self.conn = conn
+        self.report = report
+        self.ids = dict(conn.execute("SELECT item, item_id FROM vnstock_financial_items WHERE report = ?", (report,)))
+
+    def lookup(self, items: pd.Series) -> pd.Series:
+        missing = [item for item in items.unique() if item not in self.ids]
+        for item in missing:
+            self.conn.execute("INSERT OR IGNORE INTO vnstock_financial_items (report, item) VALUES (?, ?)",
+                              (self.report, item))
+            self.ids[item] = self.conn.execute(
+                "SELECT item_id FROM vnstock_financial_items WHERE report = ? AND item = ?",
+                (self.report, item)).fetchone()[0]
+        return items.map(self.ids)
+
+
+def _iter_chunks(source_dir: Path, name: str, source: str, chunksize: int):
+    if source == 'parquet':
+        root = source_dir / name
+        if not root.exists():
+            return
+        from parquet_store import iter_parquet_batches
+        for batch in iter_parquet_batches(root, batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+    path = source_dir / f"{name}.csv"
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def import_financial_reports(conn: sqlite3.Connection, source_dir, source: str = 'csv',
+                             chunksize: int = 20000) -> dict:
+    """
+    Load the four financial reports into vnstock_financial_items / vnstock_financial_values.
+
+    Every numeric report cell becomes one row keyed by (ticker, year_report,
+    length_report, item_id); item names are stored once per report in
+    vnstock_financial_items. Re-importing a period replaces its values. The
+    `vnstock_financials` view joins the two back into readable rows.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection.
+        source_dir (str): Folder with the report CSVs, or the Parquet root when `source='parquet'`.
+        source (str): 'csv' or 'parquet'.
+        chunksize (int): Report rows read per chunk.
+
+    Returns:
+        dict: Values written per report.
+    """
+    if source not in ('csv', 'parquet'):
+        raise ValueError(f"Invalid source: {source}. Must be 'csv' or 'parquet'")
+    migrate(conn)
+    started = time.perf_counter()
+    source_dir = Path(source_dir)
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+
+    written = {}
+    for report, name in REPORT_SOURCES.items():
+        item_ids = _ItemIds(conn, report)
+        total = 0
+        for chunk in _iter_chunks(source_dir, name, source, chunksize):
+            try:
+                long = to_long(chunk)
+            except ValueError as e:
+                print(f"Skipping {name}: {e}")
+                break
+            long['item_id'] = item_ids.lookup(long['item'])
+            rows = long[['ticker', 'year_report', 'length_report', 'item_id', 'value']]
+            conn.executemany(VALUE_UPSERT_SQL, rows.itertuples(index=False, name=None))
+            total += len(rows)
+        written[report] = total
+    conn.commit()
+
+    print("Financial reports: " + ", ".join(f"{n} {report} values" for report, n in written.items())
+          + f" in {time.perf_counter() - started:.1f}s")
+    return written
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load financial report CSVs or Parquet into vnstock_data.db")
+    parser.add_argument("db", nargs="?", help="Database file, defaults to data/vnstock_data.db")
+    parser.add_argument("--source", choices=["csv", "parquet"], default="csv",
+                        help="Read the CSV files or the per-ticker Parquet datasets")
+    args = parser.parse_args()
+
+    current_dir = Path(__file__).parent.resolve()
+    db_file = Path(args.db) if args.db else current_dir.parent.resolve() / "vnstock_data.db"
+    if not db_file.exists():
+        print(f"Database file not found: {db_file}")
+        sys.exit(1)
+    source_dir = current_dir.parent.resolve() / ("parquet" if args.source == "parquet" else "csv_file")
+
+    conn = sqlite3.connect(db_file)
+    import_financial_reports(conn, source_dir, args.source)
+    conn.execute("ANALYZE vnstock_financial_values")
+    conn.close()
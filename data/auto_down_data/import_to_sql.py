@@ -1,41 +1,25 @@
 import pandas as pd
+import argparse
+import os
 import sqlite3
+import time
 from pathlib import Path
+from migrate_db import migrate, benchmark_queries, print_benchmark, PRICE_INSERT_SQL
+from indicators import update_indicators
+from rollups import update_rollups
+from financials import import_financial_reports
 
-# Đọc dữ liệu từ CSV
-symbols_path = "csv_file/vnstock_symbols.csv"
-prices_path = "csv_file/vnstock_data_prices.csv"
-screener_path = "csv_file/vnstock_screeners.csv"
-db_path = "vnstock_data.db"
-
-current_dir = Path(__file__).parent.resolve()
-symbols_file = current_dir.parent.resolve() / symbols_path 
-prices_file = current_dir.parent.resolve() / prices_path
-screener_file = current_dir.parent.resolve() / screener_path
-db_file = current_dir.parent.resolve() / db_path
-
-symbols_df = pd.read_csv(symbols_file)
-prices_df = pd.read_csv(prices_file)
-screener_df = pd.read_csv(screener_file)
-
-# Tạo file SQLite mới
-conn = sqlite3.connect(db_file)
-cursor = conn.cursor()
-
-# Bật hỗ trợ khóa ngoại (bắt buộc trong SQLite)
-cursor.execute("PRAGMA foreign_keys = ON;")
-
-# Tạo bảng symbols
-cursor.execute("""
+# Bảng symbols
+SYMBOLS_SQL = """
 CREATE TABLE IF NOT EXISTS vnstock_symbols (
     symbol TEXT PRIMARY KEY,
     organ_short_name TEXT,
     organ_name TEXT
 );
-""")
+"""
 
-# Tạo bảng screener
-cursor.execute("""
+# Bảng screener
+SCREENERS_SQL = """
 CREATE TABLE IF NOT EXISTS vnstock_screeners (
     ticker TEXT PRIMARY KEY,
     exchange TEXT,
@@ -148,10 +132,10 @@ CREATE TABLE IF NOT EXISTS vnstock_screeners (
     percent_price_vs_ma100 REAL,
     FOREIGN KEY (ticker) REFERENCES vnstock_symbols(symbol) ON DELETE CASCADE ON UPDATE CASCADE
 );
-""")
+"""
 
-# Tạo bảng prices với ràng buộc khóa ngoại tới symbols
-cursor.execute("""
+# Bảng prices với ràng buộc khóa ngoại tới symbols
+PRICES_SQL = """
 CREATE TABLE IF NOT EXISTS vnstock_prices (
     time TEXT,
     open REAL,
@@ -162,21 +146,164 @@ CREATE TABLE IF NOT EXISTS vnstock_prices (
     ticker TEXT,
     FOREIGN KEY (ticker) REFERENCES vnstock_symbols(symbol) ON DELETE CASCADE ON UPDATE CASCADE
 );
-""")
+"""
+
+
+def _insert_sql(table: str, columns: list) -> str:
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    return f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})'
+
+
+def load_csv(conn: sqlite3.Connection, table: str, csv_file, chunksize: int = 100000, columns: list = None) -> int:
+    """
+    Stream a CSV file into `table` chunk by chunk with one prepared INSERT.
+
+    Args:
+        conn (sqlite3.Connection): Connection with an open transaction.
+        table (str): Target table.
+        csv_file (str): Source CSV file.
+        chunksize (int): Rows read and inserted per chunk.
+        columns (list): Columns to load, defaults to the CSV header.
+
+    Returns:
+        int: Number of rows inserted.
+    """
+    total = 0
+    sql = None
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize, usecols=columns):
+        if columns:
+            chunk = chunk[columns]
+        if sql is None:
+            sql = _insert_sql(table, list(chunk.columns))
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        conn.executemany(sql, chunk.itertuples(index=False, name=None))
+        total += len(chunk)
+    return total
+
+
+def _remove_database_files(path: Path) -> None:
+    """Delete a SQLite file together with its -wal and -shm sidecars, if present."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(f"{path}{suffix}"):
+            os.remove(f"{path}{suffix}")
+
+
+def build_database(db_file, symbols_file, screener_file, prices_file=None, prices_parquet_root=None,
+                   reports_dir=None, reports_source: str = 'csv', chunksize: int = 100000) -> Path:
+    """
+    Build vnstock_data.db next to the live file and swap it in atomically.
+
+    The new database is written to `<db_file>.building` with WAL and
+    `synchronous=OFF`. All rows go in through one transaction, foreign keys
+    are checked once at the end, and indexes are created after the load.
+    The journal is switched back to DELETE, so the read-only connections of
+    the chatbot need no -wal/-shm files. Finally `os.replace` renames the new
+    file over the old one. Readers see either the old file or the complete
+    new one, never a half-built database.
+
+    Args:
+        db_file (str): Final database path.
+        symbols_file (str): vnstock_symbols.csv.
+        screener_file (str): vnstock_screeners.csv.
+        prices_file (str): Prices CSV, used when `prices_parquet_root` is None.
+        prices_parquet_root (str): Partitioned Parquet prices dataset.
+        reports_dir (str): Folder with the financial report CSVs (or Parquet datasets); skipped if None.
+        reports_source (str): 'csv' or 'parquet' for `reports_dir`.
+        chunksize (int): Rows per insert chunk.
+
+    Returns:
+        Path: Path of the installed database.
+    """
+    db_file = Path(db_file)
+    tmp_file = db_file.with_name(db_file.name + ".building")
+    _remove_database_files(tmp_file)
+
+    started = time.perf_counter()
+    # isolation_level=None: tự quản lý transaction bằng BEGIN/COMMIT
+    conn = sqlite3.connect(tmp_file, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("PRAGMA cache_size = -262144")
+        for sql in (SYMBOLS_SQL, SCREENERS_SQL, PRICES_SQL):
+            conn.execute(sql)
+
+        conn.execute("BEGIN")
+        n_symbols = load_csv(conn, "vnstock_symbols", symbols_file, chunksize)
+        if prices_parquet_root is not None:
+            # Đọc từng chunk có kiểu cố định, bộ nhớ không tăng theo kích thước dữ liệu
+            from parquet_store import import_prices_parquet
+            n_prices = import_prices_parquet(conn, prices_parquet_root, PRICE_INSERT_SQL, chunksize)
+        else:
+            n_prices = load_csv(conn, "vnstock_prices", prices_file, chunksize,
+                                columns=['time', 'open', 'high', 'low', 'close', 'volume', 'ticker'])
+        n_screeners = load_csv(conn, "vnstock_screeners", screener_file, chunksize)
+        conn.execute("COMMIT")
+        print(f"Loaded {n_symbols} symbols, {n_prices} prices, {n_screeners} screener rows "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        # Kiểm tra ràng buộc FK một lần sau khi nạp
+        fk_issues = conn.execute("PRAGMA foreign_key_check").fetchall()
+        if fk_issues:
+            print(f"Foreign key constraint issues ({len(fk_issues)}):", fk_issues[:20])
+        else:
+            print("Database created successfully with foreign key constraint!")
+
+        # Tạo index sau khi đã nạp dữ liệu, đo độ trễ truy vấn trước và sau
+        before = benchmark_queries(conn)
+        version = migrate(conn)
+        after = benchmark_queries(conn)
+        print(f"Schema version {version}, indexes created and statistics analyzed.")
+        if before:
+            print_benchmark(before, after)
+
+        # Chỉ báo kỹ thuật và bảng tổng hợp tính một lần khi nạp, agent chỉ việc đọc
+        update_indicators(conn, full=True)
+        update_rollups(conn, full=True)
+        if reports_dir is not None:
+            import_financial_reports(conn, reports_dir, reports_source)
+        for table in ("vnstock_indicators", "vnstock_prices_weekly", "vnstock_prices_monthly", "vnstock_ticker_stats",
+                      "vnstock_financial_values"):
+            conn.execute(f"ANALYZE {table}")
+
+        conn.execute("PRAGMA journal_mode = DELETE")
+    except BaseException:
+        conn.close()
+        # Bản build dở dang chạy ở chế độ WAL: xóa cả -wal và -shm
+        _remove_database_files(tmp_file)
+        raise
+    conn.close()
+
+    os.replace(tmp_file, db_file)
+    print(f"Installed {db_file} in {time.perf_counter() - started:.1f}s")
+    return db_file
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build vnstock_data.db from the downloaded data")
+    parser.add_argument("--source", choices=["csv", "parquet"], default="csv",
+                        help="Read prices and financial reports from the CSV files or the partitioned Parquet datasets")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Rows per insert chunk")
+    args = parser.parse_args()
 
-# Ghi dữ liệu vào bảng
-symbols_df.to_sql("vnstock_symbols", conn, if_exists="append", index=False)
-prices_df.to_sql("vnstock_prices", conn, if_exists="append", index=False)
-screener_df.to_sql("vnstock_screeners", conn, if_exists="append", index=False)
+    # Đọc dữ liệu từ CSV
+    symbols_path = "csv_file/vnstock_symbols.csv"
+    prices_path = "csv_file/vnstock_data_prices.csv"
+    prices_parquet_path = "parquet/vnstock_prices"
+    screener_path = "csv_file/vnstock_screeners.csv"
+    db_path = "vnstock_data.db"
 
-# Kiểm tra ràng buộc FK có hoạt động
-cursor.execute("PRAGMA foreign_key_check;")
-fk_issues = cursor.fetchall()
+    current_dir = Path(__file__).parent.resolve()
+    symbols_file = current_dir.parent.resolve() / symbols_path
+    prices_file = current_dir.parent.resolve() / prices_path
+    prices_parquet_root = current_dir.parent.resolve() / prices_parquet_path
+    screener_file = current_dir.parent.resolve() / screener_path
+    db_file = current_dir.parent.resolve() / db_path
 
-if fk_issues:
-    print("Foreign key constraint issues:", fk_issues)
-else:
-    print("Database created successfully with foreign key constraint!")
+    reports_dir = current_dir.parent.resolve() / ("parquet" if args.source == "parquet" else "csv_file")
 
-conn.commit()
-conn.close()
\ No newline at end of file
+    build_database(db_file, symbols_file, screener_file, prices_file=prices_file,
+                   prices_parquet_root=prices_parquet_root if args.source == "parquet" else None,
+                   reports_dir=reports_dir, reports_source=args.source, chunksize=args.chunksize)
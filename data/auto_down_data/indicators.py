@@ -0,0 +1,227 @@
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from migrate_db import migrate
+
+SMA_WINDOWS = (5, 20, 50, 200)
+EMA_SPANS = (5, 12, 20, 26, 50, 200)
+RSI_PERIOD = 14
+MACD_SIGNAL_SPAN = 9
+BB_WINDOW = 20
+BB_WIDTH = 2
+# Số phiên trước phần đuôi cần nạp lại để các cửa sổ SMA/Bollinger tính đúng
+HISTORY_ROWS = max(SMA_WINDOWS + (BB_WINDOW,)) - 1
+
+# Trạng thái của các đường trung bình mũ, đọc lại từ ngày cuối đã lưu khi tính tiếp
+STATE_COLUMNS = [f"ema_{span}" for span in EMA_SPANS] + ["avg_gain_14", "avg_loss_14", "macd_signal"]
+
+INDICATOR_COLUMNS = (
+    ["ticker", "time", "close", "return_1d"]
+    + [f"sma_{w}" for w in SMA_WINDOWS]
+    + [f"ema_{span}" for span in EMA_SPANS]
+    + ["avg_gain_14", "avg_loss_14", "rsi_14", "macd", "macd_signal", "macd_hist",
+       "bb_middle", "bb_upper", "bb_lower"]
+)
+
+INDICATOR_UPSERT_SQL = (
+    f"INSERT OR REPLACE INTO vnstock_indicators ({', '.join(INDICATOR_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in INDICATOR_COLUMNS)})"
+)
+
+
+def _ewm(values: pd.Series, groups: pd.Series, alpha: float) -> pd.Series:
+    """EMA with adjust=False per ticker, aligned back to the input index."""
+    return values.groupby(groups, sort=False).ewm(alpha=alpha, adjust=False).mean().reset_index(level=0, drop=True)
+
+
+def _rolling(values: pd.Series, groups: pd.Series, window: int, how: str) -> pd.Series:
+    rolled = values.groupby(groups, sort=False).rolling(window, min_periods=window)
+    result = rolled.mean() if how == "mean" else rolled.std(ddof=0)
+    return result.reset_index(level=0, drop=True)
+
+
+def compute_indicators(prices: pd.DataFrame, seeds: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Compute the indicator rows for `prices`, vectorized over all tickers.
+
+    Without a seed a ticker is computed from its first day. With a seed (the
+    last stored indicator row of that ticker) `prices` holds the seed day,
+    up to HISTORY_ROWS days before it and the new days after it: rolling
+    windows use the history, while the exponential averages (EMA, Wilder's
+    RSI averages, MACD signal) continue from the stored state, so only the
+    new days are returned and they match a full recomputation.
+
+    Args:
+        prices (pd.DataFrame): ticker, time, close sorted by ticker then time.
+        seeds (pd.DataFrame): Indexed by ticker with `time` and STATE_COLUMNS.
+
+    Returns:
+        pd.DataFrame: INDICATOR_COLUMNS for the days to store.
+    """
+    df = prices.reset_index(drop=True)
+    df["close"] = df["close"].astype(float)
+    if seeds is not None and len(seeds):
+        seed_cols = seeds[["time"] + STATE_COLUMNS].rename(columns=lambda c: f"seed_{c}")
+        df = df.join(seed_cols, on="ticker")
+        unseeded = df["seed_time"].isna()
+        is_seed = ~unseeded & (df["time"] == df["seed_time"])
+        new = unseeded | (~unseeded & (df["time"] > df["seed_time"]))
+    else:
+        for col in STATE_COLUMNS:
+            df[f"seed_{col}"] = np.nan
+        unseeded = pd.Series(True, index=df.index)
+        is_seed = ~unseeded
+        new = unseeded
+    active = new | is_seed
+    ticker = df["ticker"]
+
+    prev_close = df.groupby("ticker", sort=False)["close"].shift(1)
+    df["return_1d"] = df["close"] / prev_close - 1
+    for window in SMA_WINDOWS:
+        df[f"sma_{window}"] = _rolling(df["close"], ticker, window, "mean")
+    std = _rolling(df["close"], ticker, BB_WINDOW, "std")
+    df["bb_middle"] = df[f"sma_{BB_WINDOW}"] if BB_WINDOW in SMA_WINDOWS else _rolling(df["close"], ticker, BB_WINDOW, "mean")
+    df["bb_upper"] = df["bb_middle"] + BB_WIDTH * std
+    df["bb_lower"] = df["bb_middle"] - BB_WIDTH * std
+
+    # Các chuỗi mũ chỉ chạy trên hàng seed + hàng mới; hàng seed mang giá trị trạng thái đã lưu
+    act = df[active]
+    act_ticker = act["ticker"]
+
+    def seeded(values: pd.Series, state: str, alpha: float) -> pd.Series:
+        inputs = values[active].where(~is_seed[active], act[f"seed_{state}"])
+        return _ewm(inputs, act_ticker, alpha)
+
+    for span in EMA_SPANS:
+        df.loc[active, f"ema_{span}"] = seeded(df["close"], f"ema_{span}", 2 / (span + 1))
+
+    diff = df["close"] - prev_close
+    df.loc[active, "avg_gain_14"] = seeded(diff.clip(lower=0), "avg_gain_14", 1 / RSI_PERIOD)
+    df.loc[active, "avg_loss_14"] = seeded((-diff).clip(lower=0), "avg_loss_14", 1 / RSI_PERIOD)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = df["avg_gain_14"] / df["avg_loss_14"]
+    df["rsi_14"] = np.where(df["avg_loss_14"] == 0, 100.0, 100 - 100 / (1 + rs))
+    # giai đoạn khởi động: chưa đủ RSI_PERIOD phiên thì chưa có RSI
+    warmup = unseeded & (df.groupby("ticker", sort=False).cumcount() < RSI_PERIOD)
+    df.loc[warmup | df["avg_loss_14"].isna(), "rsi_14"] = np.nan
+
+    df["macd"] = df["ema_12"] - df["ema_26"]
+    df.loc[active, "macd_signal"] = seeded(df["macd"], "macd_signal", 2 / (MACD_SIGNAL_SPAN + 1))
+    df["macd_hist"] = df["macd"] - df["macd_signal"]
+
+    return df.loc[new, INDICATOR_COLUMNS]
+
+
+def _load_seeds(conn: sqlite3.Connection) -> pd.DataFrame:
+    """Last stored indicator row of every ticker."""
+    return pd.read_sql_query(f"""
+        SELECT i.ticker, i.time, {', '.join('i.' + c for c in STATE_COLUMNS)}
+        FROM vnstock_indicators i
+        JOIN (SELECT ticker, MAX(time) AS time FROM vnstock_indicators GROUP BY ticker) last
+          ON last.ticker = i.ticker AND last.time = i.time
+    """, conn).set_index("ticker")
+
+
+def _load_full(conn: sqlite3.Connection, tickers: list) -> pd.DataFrame:
+    placeholders = ", ".join("?" for _ in tickers)
+    return pd.read_sql_query(f"""
+        SELECT ticker, time, close FROM vnstock_prices
+        WHERE ticker IN ({placeholders})
+        ORDER BY ticker, time
+    """, conn, params=tickers)
+
+
+def _load_tails(conn: sqlite3.Connection, seeds: pd.DataFrame) -> pd.DataFrame:
+    """Seed day, HISTORY_ROWS days before it and every later day, for tickers with new days."""
+    rows = []
+    for ticker, seed_time in seeds["time"].items():
+        tail = conn.execute("""
+            SELECT ticker, time, close FROM vnstock_prices
+            WHERE ticker = ? AND time >= ? ORDER BY time
+        """, (ticker, seed_time)).fetchall()
+        if len(tail) <= 1:
+            continue
+        history = conn.execute("""
+            SELECT ticker, time, close FROM vnstock_prices
+            WHERE ticker = ? AND time < ? ORDER BY time DESC LIMIT ?
+        """, (ticker, seed_time, HISTORY_ROWS)).fetchall()
+        rows.extend(reversed(history))
+        rows.extend(tail)
+    return pd.DataFrame(rows, columns=["ticker", "time", "close"])
+
+
+def _write(conn: sqlite3.Connection, frame: pd.DataFrame) -> int:
+    frame = frame.astype(object).where(frame.notna(), None)
+    conn.executemany(INDICATOR_UPSERT_SQL, frame.itertuples(index=False, name=None))
+    return len(frame)
+
+
+def update_indicators(conn: sqlite3.Connection, full: bool = False, chunk_tickers: int = 200) -> dict:
+    """
+    Bring vnstock_indicators up to date with vnstock_prices.
+
+    Tickers without stored indicators are computed in full, `chunk_tickers`
+    at a time. Tickers that already have indicators only get their new days,
+    seeded from the last stored row (see `compute_indicators`). With `full`
+    the table is emptied and rebuilt.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection.
+        full (bool): Recompute everything.
+        chunk_tickers (int): Tickers loaded per batch for full computation.
+
+    Returns:
+        dict: Number of tickers computed in full, tickers extended and rows written.
+    """
+    migrate(conn)
+    started = time.perf_counter()
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    if full:
+        conn.execute("DELETE FROM vnstock_indicators")
+
+    seeds = _load_seeds(conn)
+    tickers = [r[0] for r in conn.execute("SELECT DISTINCT ticker FROM vnstock_prices ORDER BY ticker")]
+    fresh = [t for t in tickers if t not in seeds.index]
+
+    written = 0
+    for i in range(0, len(fresh), chunk_tickers):
+        prices = _load_full(conn, fresh[i:i + chunk_tickers])
+        written += _write(conn, compute_indicators(prices))
+
+    extended = 0
+    if len(seeds):
+        tails = _load_tails(conn, seeds)
+        if not tails.empty:
+            extended = tails["ticker"].nunique()
+            written += _write(conn, compute_indicators(tails, seeds))
+    conn.commit()
+
+    summary = {"full": len(fresh), "extended": extended, "rows": written,
+               "elapsed": time.perf_counter() - started}
+    print(f"Indicators: {summary['full']} tickers computed in full, {extended} extended, "
+          f"{written} rows in {summary['elapsed']:.1f}s")
+    return summary
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute technical indicators into vnstock_indicators")
+    parser.add_argument("db", nargs="?", help="Database file, defaults to data/vnstock_data.db")
+    parser.add_argument("--full", action="store_true", help="Recompute every ticker from the first day")
+    args = parser.parse_args()
+
+    current_dir = Path(__file__).parent.resolve()
+    db_file = Path(args.db) if args.db else current_dir.parent.resolve() / "vnstock_data.db"
+    if not db_file.exists():
+        print(f"Database file not found: {db_file}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(db_file)
+    update_indicators(conn, full=args.full)
+    conn.execute("ANALYZE vnstock_indicators")
+    conn.close()
@@ -0,0 +1,296 @@
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# Các bước migration theo thứ tự; PRAGMA user_version lưu bước cuối đã chạy
+SCHEMA_VERSION = 4
+
+
+def _dedupe_prices(conn: sqlite3.Connection) -> int:
+    """
+    Remove duplicated (ticker, time) rows left by earlier append-only imports,
+    keeping the most recently inserted row.
+
+    Returns:
+        int: Number of deleted rows.
+    """
+    cursor = conn.execute("""
+        DELETE FROM vnstock_prices
+        WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM vnstock_prices GROUP BY ticker, time
+        )
+    """)
+    return cursor.rowcount
+
+
+def create_price_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Create the lookup indexes on vnstock_prices and refresh planner statistics.
+
+    - (ticker, time) UNIQUE: one row per ticker per day, used by upserts.
+    - (ticker, time, open, high, low, close, volume): covering index so
+      ticker/date-range queries never touch the table itself.
+    - (time): cross-sectional queries on a single day.
+    """
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vnstock_prices_ticker_time
+        ON vnstock_prices (ticker, time)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vnstock_prices_covering
+        ON vnstock_prices (ticker, time, open, high, low, close, volume)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vnstock_prices_time
+        ON vnstock_prices (time)
+    """)
+    conn.execute("ANALYZE")
+
+
+PRICE_INSERT_SQL = """
+    INSERT INTO vnstock_prices (time, open, high, low, close, volume, ticker)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+PRICE_UPSERT_SQL = PRICE_INSERT_SQL + """
+    ON CONFLICT (ticker, time) DO UPDATE SET
+        open = excluded.open,
+        high = excluded.high,
+        low = excluded.low,
+        close = excluded.close,
+        volume = excluded.volume
+"""
+
+
+def upsert_prices(conn: sqlite3.Connection, rows) -> int:
+    """
+    Insert or update price rows keyed by (ticker, time).
+
+    Args:
+        conn (sqlite3.Connection): Writable connection; the unique
+            (ticker, time) index must exist (see `migrate`).
+        rows (iterable): Tuples of (time, open, high, low, close, volume, ticker).
+
+    Returns:
+        int: Number of rows written.
+    """
+    cursor = conn.executemany(PRICE_UPSERT_SQL, rows)
+    return cursor.rowcount
+
+
+def _migration_1(conn: sqlite3.Connection) -> None:
+    deleted = _dedupe_prices(conn)
+    if deleted:
+        print(f"Removed {deleted} duplicated rows from vnstock_prices")
+    create_price_indexes(conn)
+
+
+def _migration_2(conn: sqlite3.Connection) -> None:
+    # Chỉ báo kỹ thuật theo ticker/ngày; các cột ema_* / avg_* là trạng thái để tính tiếp phần đuôi
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vnstock_indicators (
+            ticker TEXT NOT NULL,
+            time TEXT NOT NULL,
+            close REAL,
+            return_1d REAL,
+            sma_5 REAL,
+            sma_20 REAL,
+            sma_50 REAL,
+            sma_200 REAL,
+            ema_5 REAL,
+            ema_12 REAL,
+            ema_20 REAL,
+            ema_26 REAL,
+            ema_50 REAL,
+            ema_200 REAL,
+            avg_gain_14 REAL,
+            avg_loss_14 REAL,
+            rsi_14 REAL,
+            macd REAL,
+            macd_signal REAL,
+            macd_hist REAL,
+            bb_middle REAL,
+            bb_upper REAL,
+            bb_lower REAL,
+            PRIMARY KEY (ticker, time)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vnstock_indicators_time
+        ON vnstock_indicators (time)
+    """)
+
+
+def _migration_3(conn: sqlite3.Connection) -> None:
+    # Bảng tổng hợp tuần/tháng và thống kê theo mã, duy trì bởi rollups.py
+    for table, period in (("vnstock_prices_weekly", "week_start"), ("vnstock_prices_monthly", "month")):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                ticker TEXT NOT NULL,
+                {period} TEXT NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume REAL,
+                trading_days INTEGER,
+                PRIMARY KEY (ticker, {period})
+            ) WITHOUT ROWID
+        """)
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_{period}
+            ON {table} ({period})
+        """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vnstock_ticker_stats (
+            ticker TEXT PRIMARY KEY,
+            as_of TEXT,
+            close REAL,
+            high_52w REAL,
+            high_52w_date TEXT,
+            low_52w REAL,
+            low_52w_date TEXT,
+            ytd_return REAL,
+            avg_volume_20d REAL,
+            avg_volume_52w REAL
+        ) WITHOUT ROWID
+    """)
+
+
+def _migration_4(conn: sqlite3.Connection) -> None:
+    # Báo cáo tài chính dạng dài (EAV): tên chỉ tiêu lưu một lần, giá trị tham chiếu bằng item_id
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vnstock_financial_items (
+            item_id INTEGER PRIMARY KEY,
+            report TEXT NOT NULL,
+            item TEXT NOT NULL,
+            UNIQUE (report, item)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vnstock_financial_values (
+            ticker TEXT NOT NULL,
+            year_report INTEGER NOT NULL,
+            length_report INTEGER NOT NULL,
+            item_id INTEGER NOT NULL REFERENCES vnstock_financial_items (item_id),
+            value REAL NOT NULL,
+            PRIMARY KEY (ticker, year_report, length_report, item_id)
+        ) WITHOUT ROWID
+    """)
+    # So sánh một chỉ tiêu giữa các mã trong cùng kỳ
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vnstock_financial_values_item
+        ON vnstock_financial_values (item_id, year_report, length_report)
+    """)
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS vnstock_financials AS
+        SELECT v.ticker, i.report, v.year_report, v.length_report, i.item, v.value
+        FROM vnstock_financial_values v
+        JOIN vnstock_financial_items i ON i.item_id = v.item_id
+    """)
+
+
+MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+    (4, _migration_4),
+]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Bring an existing database up to SCHEMA_VERSION. Safe to run repeatedly.
+
+    Returns:
+        int: Schema version after migration.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, step in MIGRATIONS:
+        if version >= target:
+            continue
+        print(f"Applying migration {target}...")
+        with conn:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        version = target
+    return version
+
+
+def _sample_params(conn: sqlite3.Connection) -> dict:
+    row = conn.execute("""
+        SELECT ticker, time FROM vnstock_prices
+        WHERE ticker = (SELECT ticker FROM vnstock_prices LIMIT 1)
+        ORDER BY time DESC LIMIT 1
+    """).fetchone()
+    if row is None:
+        return {}
+    ticker, last_time = row
+    return {"ticker": ticker, "time": last_time, "start": f"{last_time[:4]}-01-01"}
+
+
+# Bộ truy vấn chuẩn, giống các câu SQL mà agent hay sinh ra
+BENCHMARK_QUERIES = [
+    ("point lookup",
+     "SELECT ticker, open, time FROM vnstock_prices WHERE ticker = :ticker AND time = :time"),
+    ("ticker range max",
+     "SELECT MAX(close) FROM vnstock_prices WHERE ticker = :ticker AND time >= :start AND time <= :time"),
+    ("ticker history",
+     "SELECT time, close, volume FROM vnstock_prices WHERE ticker = :ticker ORDER BY time DESC LIMIT 20"),
+    ("top volume on day",
+     "SELECT ticker, volume FROM vnstock_prices WHERE time = :time ORDER BY volume DESC LIMIT 10"),
+    ("join by company",
+     "SELECT s.organ_short_name, MAX(p.close) FROM vnstock_prices p "
+     "JOIN vnstock_symbols s ON s.symbol = p.ticker "
+     "WHERE s.symbol = :ticker AND p.time >= :start AND p.time <= :time"),
+]
+
+
+def benchmark_queries(conn: sqlite3.Connection, repeat: int = 5) -> dict:
+    """
+    Time BENCHMARK_QUERIES on `conn`.
+
+    Returns:
+        dict: Query name -> best-of-`repeat` latency in milliseconds.
+    """
+    params = _sample_params(conn)
+    if not params:
+        return {}
+    timings = {}
+    for name, sql in BENCHMARK_QUERIES:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best * 1000
+    return timings
+
+
+def print_benchmark(before: dict, after: dict) -> None:
+    print(f"{'query':<20}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in before:
+        b, a = before[name], after.get(name, float("nan"))
+        speedup = b / a if a else float("inf")
+        print(f"{name:<20}{b:>14.3f}{a:>14.3f}{speedup:>9.1f}x")
+
+
+# Main execution
+if __name__ == "__main__":
+    current_dir = Path(__file__).parent.resolve()
+    db_file = Path(sys.argv[1]) if len(sys.argv) > 1 else current_dir.parent.resolve() / "vnstock_data.db"
+
+    if not db_file.exists():
+        print(f"Database file not found: {db_file}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(db_file)
+    before = benchmark_queries(conn)
+    version = migrate(conn)
+    after = benchmark_queries(conn)
+    conn.close()
+
+    print(f"Database {db_file} is at schema version {version}")
+    if before:
+        print_benchmark(before, after)
@@ -0,0 +1,131 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Kiểu cột cố định cho bảng giá, tránh để pandas tự đoán kiểu khi đọc
+PRICE_SCHEMA = pa.schema([
+    ('time', pa.string()),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.int64()),
+    ('ticker', pa.string()),
+])
+
+PARTITION_KEYS = ('ticker', 'year')
+
+
+def write_prices_parquet(df: pd.DataFrame, root, partition_by: str = 'ticker') -> list:
+    """
+    Write one download batch of prices into a Hive-partitioned Parquet folder.
+
+    Files land in `root/ticker=XXX/` or `root/year=YYYY/`. Every call uses a
+    new file name, so later downloads never rewrite earlier data.
+
+    Args:
+        df (pd.DataFrame): Prices with the PRICE_SCHEMA columns.
+        root (str): Dataset folder, e.g. `parquet/vnstock_prices`.
+        partition_by (str): 'ticker' or 'year'.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    if partition_by not in PARTITION_KEYS:
+        raise ValueError(f"Invalid partition key: {partition_by}. Must be one of: {', '.join(PARTITION_KEYS)}")
+    if df.empty:
+        return []
+
+    df = df.copy()
+    df['time'] = pd.to_datetime(df['time']).dt.strftime('%Y-%m-%d')
+    df['volume'] = df['volume'].astype('Int64')
+    keys = df['ticker'] if partition_by == 'ticker' else df['time'].str[:4]
+
+    # Cột ticker nằm trong tên thư mục khi phân vùng theo ticker
+    schema = pa.schema([f for f in PRICE_SCHEMA if f.name != partition_by])
+    stamp = time.time_ns()
+    paths = []
+    for key, part in df.groupby(keys, sort=False):
+        folder = Path(root) / f"{partition_by}={key}"
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"part-{stamp}.parquet"
+        table = pa.Table.from_pandas(part[schema.names], schema=schema, preserve_index=False)
+        pq.write_table(table, path)
+        paths.append(path)
+    return paths
+
+
+def write_report_parquet(df: pd.DataFrame, root, ticker: str) -> Path:
+    """
+    Write one symbol's financial report to `root/ticker=XXX/part-0.parquet`,
+    replacing the previous file so reruns stay idempotent.
+    """
+    folder = Path(root) / f"ticker={ticker}"
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / "part-0.parquet"
+    df.drop(columns=['ticker'], errors='ignore').to_parquet(path, index=False)
+    return path
+
+
+def _partitioning(root) -> ds.Partitioning:
+    """Hive partitioning for `root`, typed as string whatever the folder values look like."""
+    keys = {p.name.split('=', 1)[0] for p in Path(root).iterdir() if p.is_dir() and '=' in p.name}
+    return ds.partitioning(pa.schema([(key, pa.string()) for key in sorted(keys)]), flavor='hive')
+
+
+def _unified_schema(dataset: ds.Dataset) -> pa.Schema:
+    """
+    Union of the schemas of every file in `dataset`, plus its partition columns.
+
+    `ds.dataset` takes the schema of the first file it finds, which drops the
+    columns other files add (banks and other companies report different line
+    items). Types that differ between files are widened, e.g. int64 and double.
+    """
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    if not schemas:
+        return dataset.schema
+    schema = pa.unify_schemas(schemas, promote_options='permissive')
+    for field in dataset.partitioning.schema:
+        if field.name not in schema.names:
+            schema = schema.append(field)
+    return schema
+
+
+def iter_parquet_batches(root, columns=None, batch_size: int = 50000):
+    """
+    Yield record batches from a partitioned Parquet folder without loading
+    the whole dataset, so memory stays bounded by `batch_size`. Columns
+    missing from some files come back as nulls for their rows.
+    """
+    partitioning = _partitioning(root)
+    dataset = ds.dataset(root, format='parquet', partitioning=partitioning)
+    dataset = ds.dataset(root, format='parquet', partitioning=partitioning, schema=_unified_schema(dataset))
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        if batch.num_rows:
+            yield batch
+
+
+def import_prices_parquet(conn: sqlite3.Connection, root, insert_sql: str, batch_size: int = 50000) -> int:
+    """
+    Stream a prices Parquet dataset into SQLite in typed chunks.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection.
+        root (str): Dataset folder written by `write_prices_parquet`.
+        insert_sql (str): INSERT statement taking (time, open, high, low, close, volume, ticker).
+        batch_size (int): Rows per chunk.
+
+    Returns:
+        int: Number of rows imported.
+    """
+    total = 0
+    for batch in iter_parquet_batches(root, columns=PRICE_SCHEMA.names, batch_size=batch_size):
+        table = pa.Table.from_batches([batch]).cast(PRICE_SCHEMA)
+        conn.executemany(insert_sql, zip(*(table.column(name).to_pylist() for name in PRICE_SCHEMA.names)))
+        total += table.num_rows
+    return total
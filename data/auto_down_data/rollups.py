@@ -0,0 +1,225 @@
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from migrate_db import migrate
+
+PERIOD_TABLES = {"week_start": "vnstock_prices_weekly", "month": "vnstock_prices_monthly"}
+STATS_COLUMNS = ["ticker", "as_of", "close", "high_52w", "high_52w_date", "low_52w", "low_52w_date",
+                 "ytd_return", "avg_volume_20d", "avg_volume_52w"]
+
+
+def _upsert_sql(table: str, columns: list) -> str:
+    return (f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})")
+
+
+def compute_periods(prices: pd.DataFrame) -> dict:
+    """
+    Weekly (Monday-based) and monthly OHLCV bars per ticker.
+
+    Args:
+        prices (pd.DataFrame): ticker, time, open, high, low, close, volume sorted by ticker then time.
+
+    Returns:
+        dict: Period column (`week_start`, `month`) -> DataFrame of bars.
+    """
+    day = pd.to_datetime(prices["time"].str[:10])
+    keys = {
+        "week_start": (day - pd.to_timedelta(day.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d"),
+        "month": day.dt.strftime("%Y-%m"),
+    }
+    bars = {}
+    for period, key in keys.items():
+        grouped = prices.assign(**{period: key}).groupby(["ticker", period], sort=False)
+        bars[period] = grouped.agg(
+            open=("open", "first"), high=("high", "max"), low=("low", "min"),
+            close=("close", "last"), volume=("volume", "sum"), trading_days=("time", "size"),
+        ).reset_index()
+    return bars
+
+
+def compute_stats(daily: pd.DataFrame, year_base: pd.Series) -> pd.DataFrame:
+    """
+    Per-ticker snapshot as of each ticker's last trading day.
+
+    Args:
+        daily (pd.DataFrame): ticker, time, high, low, close, volume for the
+            last 52 weeks of each ticker, sorted by ticker then time.
+        year_base (pd.Series): Close at the end of the previous year, by ticker.
+
+    Returns:
+        pd.DataFrame: STATS_COLUMNS.
+    """
+    g = daily.groupby("ticker", sort=False)
+    last = g.tail(1).set_index("ticker")
+    high_at = daily.loc[g["high"].idxmax().dropna(), ["ticker", "time", "high"]].set_index("ticker")
+    low_at = daily.loc[g["low"].idxmin().dropna(), ["ticker", "time", "low"]].set_index("ticker")
+    stats = pd.DataFrame({
+        "as_of": last["time"],
+        "close": last["close"],
+        "high_52w": high_at["high"],
+        "high_52w_date": high_at["time"],
+        "low_52w": low_at["low"],
+        "low_52w_date": low_at["time"],
+        "avg_volume_20d": g.tail(20).groupby("ticker", sort=False)["volume"].mean(),
+        "avg_volume_52w": g["volume"].mean(),
+    })
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stats["ytd_return"] = stats["close"] / year_base.reindex(stats.index) - 1
+    return stats.rename_axis("ticker").reset_index()[STATS_COLUMNS]
+
+
+def _write(conn: sqlite3.Connection, table: str, frame: pd.DataFrame) -> int:
+    frame = frame.astype(object).where(frame.notna(), None)
+    conn.executemany(_upsert_sql(table, list(frame.columns)), frame.itertuples(index=False, name=None))
+    return len(frame)
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _changed_tickers(conn: sqlite3.Connection) -> dict:
+    """Tickers whose latest price day differs from the stored stats, with the day to rebuild bars from."""
+    last_price = dict(conn.execute("SELECT ticker, MAX(time) FROM vnstock_prices GROUP BY ticker"))
+    as_of = dict(conn.execute("SELECT ticker, as_of FROM vnstock_ticker_stats"))
+    week = dict(conn.execute("SELECT ticker, MAX(week_start) FROM vnstock_prices_weekly GROUP BY ticker"))
+    month = dict(conn.execute("SELECT ticker, MAX(month) FROM vnstock_prices_monthly GROUP BY ticker"))
+    changed = {}
+    for ticker, last_time in last_price.items():
+        if as_of.get(ticker) == last_time:
+            continue
+        if ticker in week and ticker in month:
+            # kỳ cuối cùng có thể chưa trọn -> tính lại từ đầu kỳ đó
+            changed[ticker] = min(week[ticker], f"{month[ticker]}-01")
+        else:
+            changed[ticker] = None
+    return changed
+
+
+def _load_prices(conn: sqlite3.Connection, starts: dict, chunk_tickers: int) -> pd.DataFrame:
+    """Daily rows from each ticker's start day (all days when the start is None)."""
+    columns = "ticker, time, open, high, low, close, volume"
+    frames = []
+    fresh = [t for t, start in starts.items() if start is None]
+    for chunk in _chunks(fresh, chunk_tickers):
+        frames.append(pd.read_sql_query(f"""
+            SELECT {columns} FROM vnstock_prices
+            WHERE ticker IN ({', '.join('?' for _ in chunk)})
+            ORDER BY ticker, time
+        """, conn, params=chunk))
+    rows = []
+    for ticker, start in starts.items():
+        if start is not None:
+            rows.extend(conn.execute(f"""
+                SELECT {columns} FROM vnstock_prices
+                WHERE ticker = ? AND time >= ? ORDER BY time
+            """, (ticker, start)).fetchall())
+    if rows:
+        frames.append(pd.DataFrame(rows, columns=columns.split(", ")))
+    if not frames:
+        return pd.DataFrame(columns=columns.split(", "))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _load_last_year(conn: sqlite3.Connection, tickers: list) -> pd.DataFrame:
+    placeholders = ", ".join("?" for _ in tickers)
+    return pd.read_sql_query(f"""
+        SELECT p.ticker, p.time, p.high, p.low, p.close, p.volume
+        FROM vnstock_prices p
+        JOIN (SELECT ticker, MAX(time) AS as_of FROM vnstock_prices
+              WHERE ticker IN ({placeholders}) GROUP BY ticker) last
+          ON last.ticker = p.ticker
+        WHERE p.time > date(substr(last.as_of, 1, 10), '-1 year')
+        ORDER BY p.ticker, p.time
+    """, conn, params=tickers)
+
+
+def _load_year_base(conn: sqlite3.Connection, tickers: list) -> pd.Series:
+    """Close of the last month before the year of each ticker's latest month, from the monthly bars."""
+    placeholders = ", ".join("?" for _ in tickers)
+    rows = conn.execute(f"""
+        SELECT m.ticker, m.close
+        FROM vnstock_prices_monthly m
+        JOIN (SELECT ticker, MAX(month) AS month FROM vnstock_prices_monthly
+              WHERE ticker IN ({placeholders}) GROUP BY ticker) last
+          ON last.ticker = m.ticker
+        WHERE m.month = (SELECT MAX(month) FROM vnstock_prices_monthly
+                         WHERE ticker = m.ticker AND month < substr(last.month, 1, 4) || '-01')
+    """, tickers).fetchall()
+    return pd.Series(dict(rows), dtype=float)
+
+
+def update_rollups(conn: sqlite3.Connection, full: bool = False, chunk_tickers: int = 200) -> dict:
+    """
+    Bring the weekly/monthly bars and vnstock_ticker_stats up to date with vnstock_prices.
+
+    Only tickers whose latest price day differs from `vnstock_ticker_stats.as_of`
+    are touched. Their bars are rebuilt from the start of the last stored week
+    or month (whichever is earlier), since that period may have been partial,
+    and only periods starting on or after that day are rewritten; tickers
+    without bars are rebuilt from their first day. With `full` every
+    table is emptied and rebuilt.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection.
+        full (bool): Recompute everything.
+        chunk_tickers (int): Tickers loaded per batch.
+
+    Returns:
+        dict: Number of tickers updated and rows written per table.
+    """
+    migrate(conn)
+    started = time.perf_counter()
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    if full:
+        for table in list(PERIOD_TABLES.values()) + ["vnstock_ticker_stats"]:
+            conn.execute(f"DELETE FROM {table}")
+
+    changed = _changed_tickers(conn)
+    written = {table: 0 for table in list(PERIOD_TABLES.values()) + ["vnstock_ticker_stats"]}
+    tickers = list(changed)
+    for chunk in _chunks(tickers, chunk_tickers):
+        starts = {t: changed[t] for t in chunk}
+        prices = _load_prices(conn, starts, chunk_tickers)
+        for period, bars in compute_periods(prices).items():
+            # kỳ bắt đầu trước ngày nạp lại chỉ có một phần dữ liệu -> giữ nguyên bản đã lưu
+            since = bars["ticker"].map(starts).fillna("")
+            first_day = bars[period] + "-01" if period == "month" else bars[period]
+            bars = bars[first_day >= since]
+            written[PERIOD_TABLES[period]] += _write(conn, PERIOD_TABLES[period], bars)
+        stats = compute_stats(_load_last_year(conn, chunk), _load_year_base(conn, chunk))
+        written["vnstock_ticker_stats"] += _write(conn, "vnstock_ticker_stats", stats)
+    conn.commit()
+
+    summary = {"tickers": len(tickers), "rows": written, "elapsed": time.perf_counter() - started}
+    print(f"Rollups: {len(tickers)} tickers updated, "
+          + ", ".join(f"{n} rows in {table}" for table, n in written.items())
+          + f" in {summary['elapsed']:.1f}s")
+    return summary
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build weekly/monthly bars and per-ticker stats")
+    parser.add_argument("db", nargs="?", help="Database file, defaults to data/vnstock_data.db")
+    parser.add_argument("--full", action="store_true", help="Rebuild every ticker from the first day")
+    args = parser.parse_args()
+
+    current_dir = Path(__file__).parent.resolve()
+    db_file = Path(args.db) if args.db else current_dir.parent.resolve() / "vnstock_data.db"
+    if not db_file.exists():
+        print(f"Database file not found: {db_file}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(db_file)
+    update_rollups(conn, full=args.full)
+    for table in list(PERIOD_TABLES.values()) + ["vnstock_ticker_stats"]:
+        conn.execute(f"ANALYZE {table}")
+    conn.close()
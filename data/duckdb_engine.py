@@ -0,0 +1,287 @@
+# duckdb_engine.py
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+from data.stock import get_connection_pool
+
+logger = logging.getLogger(__name__)
+
+# Kiểu khai báo của SQLite -> kiểu DuckDB khi phải tự sao chép bảng
+_TYPE_MAP = {"INTEGER": "BIGINT", "INT": "BIGINT", "REAL": "DOUBLE", "FLOAT": "DOUBLE", "NUMERIC": "DOUBLE", "TEXT": "VARCHAR"}
+_STRING_OR_LIKE_RE = re.compile(r"'(?:[^']|'')*'|\bLIKE\b", re.IGNORECASE)
+
+
+def sqlite_dialect(query: str) -> str:
+    """
+    Adapt agent SQL written for SQLite to DuckDB: LIKE is case-insensitive in
+    SQLite, so it becomes ILIKE (string literals are left untouched).
+    """
+    return _STRING_OR_LIKE_RE.sub(lambda m: m.group(0) if m.group(0).startswith("'") else "ILIKE", query)
+
+
+class DuckDBNotReady(RuntimeError):
+    """Raised while the first DuckDB copy is still loading."""
+
+
+class _Copy:
+    """One loaded DuckDB database and the cursors currently reading it."""
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+        self.active = 0
+        self.retired = False
+
+
+class DuckDBEngine:
+    """
+    Columnar, multi-threaded copy of vnstock_data.db for scans and aggregations.
+
+    The SQLite tables are loaded into an in-memory DuckDB database, through
+    the `sqlite` extension when it is available and through a plain sqlite3
+    read otherwise; with `parquet_root`, `vnstock_prices` is instead a view
+    over the partitioned Parquet dataset. Loading starts when the engine is
+    created and runs again in the background whenever the SQLite file (or the
+    Parquet dataset) changes, using the same generation check as the
+    connection pool. Queries keep reading the previous copy until the new one
+    is swapped in; the previous copy is closed once its last cursor is done.
+    """
+
+    def __init__(self, db_path: str = 'vnstock_data.db', parquet_root: Optional[str] = None,
+                 threads: Optional[int] = None, memory_limit: Optional[str] = None, fetch_size: int = 100000):
+        """
+        Args:
+            db_path (str): Database file, relative to the `data` folder.
+            parquet_root (str): Parquet prices dataset, relative to the `data` folder; None to copy SQLite.
+            threads (int): DuckDB worker threads, defaults to every core.
+            memory_limit (str): DuckDB memory limit, e.g. '2GB'.
+            fetch_size (int): Rows per batch when copying without the sqlite extension.
+        """
+        import duckdb  # phụ thuộc tùy chọn, chỉ cần khi chọn backend duckdb
+
+        self._duckdb = duckdb
+        self.pool = get_connection_pool(db_path)
+        self.parquet_root = Path(__file__).parent.resolve() / parquet_root if parquet_root else None
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.fetch_size = fetch_size
+        self._lock = threading.Lock()
+        self._copy: Optional[_Copy] = None
+        self._loader: Optional[threading.Thread] = None
+        self._closed = False
+        generation = self.data_generation()
+        if generation is not None:
+            with self._lock:
+                self._start_load(generation)
+
+    def _parquet_generation(self) -> tuple:
+        latest, count = 0, 0
+        for folder, _, files in os.walk(self.parquet_root):
+            for name in files:
+                if name.endswith(".parquet"):
+                    latest = max(latest, os.stat(os.path.join(folder, name)).st_mtime_ns)
+                    count += 1
+        return (count, latest)
+
+    def data_generation(self) -> Optional[tuple]:
+        """Generation of the SQLite file, plus the Parquet dataset when one is used."""
+        generation = self.pool.data_generation()
+        if generation is None or self.parquet_root is None:
+            return generation
+        return generation + self._parquet_generation()
+
+    def _open(self):
+        config = {}
+        if self.threads:
+            config["threads"] = self.threads
+        if self.memory_limit:
+            config["memory_limit"] = self.memory_limit
+        return self._duckdb.connect(":memory:", config=config)
+
+    def _copy_sqlite(self, conn, skip: set) -> Dict[str, str]:
+        """Load every table and view of the SQLite file; returns the view definitions."""
+        source = str(self.pool.db_path)
+        try:
+            conn.execute("LOAD sqlite")
+            conn.execute(f"ATTACH '{source}' AS src (TYPE sqlite, READ_ONLY)")
+            attached = True
+        except self._duckdb.Error as e:
+            logger.info(f"DuckDB sqlite extension unavailable ({e}); copying tables through sqlite3")
+            attached = False
+
+        lite = sqlite3.connect(f"{Path(source).as_uri()}?mode=ro", uri=True)
+        try:
+            objects = lite.execute("""
+                SELECT type, name, sql FROM sqlite_master
+                WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'
+            """).fetchall()
+            views = {}
+            for kind, name, sql in objects:
+                if kind == "view":
+                    views[name] = sql
+                elif name in skip:
+                    continue
+                elif attached:
+                    conn.execute(f'CREATE TABLE "{name}" AS SELECT * FROM src."{name}"')
+                else:
+                    self._copy_table(conn, lite, name)
+        finally:
+            lite.close()
+        if attached:
+            conn.execute("DETACH src")
+        return views
+
+    def _copy_table(self, conn, lite: sqlite3.Connection, name: str) -> None:
+        columns = lite.execute(f'PRAGMA table_info("{name}")').fetchall()
+        definitions = ", ".join(
+            f'"{col[1]}" {_TYPE_MAP.get((col[2] or "").split("(")[0].upper(), "VARCHAR")}' for col in columns
+        )
+        conn.execute(f'CREATE TABLE "{name}" ({definitions})')
+        # Chèn theo khối DataFrame (quét vector hóa), nhanh hơn nhiều so với executemany từng dòng
+        for chunk in pd.read_sql_query(f'SELECT * FROM "{name}"', lite, chunksize=self.fetch_size):
+            conn.register("_chunk", chunk)
+            conn.execute(f'INSERT INTO "{name}" SELECT * FROM _chunk')
+            conn.unregister("_chunk")
+
+    def _load(self):
+        """Build a fresh in-memory copy of the data; returns its connection."""
+        conn = self._open()
+        skip = set()
+        if self.parquet_root is not None:
+            pattern = str(self.parquet_root / "**" / "*.parquet")
+            conn.execute(f"""
+                CREATE VIEW vnstock_prices AS
+                SELECT time, open, high, low, close, volume, ticker
+                FROM read_parquet('{pattern}', hive_partitioning = true)
+            """)
+            skip.add("vnstock_prices")
+        views = self._copy_sqlite(conn, skip)
+        for name, sql in views.items():
+            try:
+                conn.execute(sql)
+            except self._duckdb.Error as e:
+                logger.warning(f"Skipping view {name} in DuckDB: {e}")
+
+        # Khóa truy cập file ngoài thư mục dữ liệu (không bật lại được trong phiên)
+        if self.parquet_root is not None:
+            conn.execute(f"SET allowed_directories = ['{self.parquet_root}']")
+        conn.execute("SET enable_external_access = false")
+        return conn
+
+    def _start_load(self, generation) -> None:
+        """Load `generation` on a daemon thread unless a load is already running (caller holds the lock)."""
+        if self._closed or (self._loader is not None and self._loader.is_alive()):
+            return
+        self._loader = threading.Thread(target=self._load_in_background, args=(generation,),
+                                        name="duckdb-load", daemon=True)
+        self._loader.start()
+
+    def _load_in_background(self, generation) -> None:
+        started = time.perf_counter()
+        try:
+            conn = self._load()
+        except Exception as e:
+            logger.error(f"Loading {self.pool.db_path} into DuckDB failed: {e}")
+            return
+        with self._lock:
+            if self._closed:
+                conn.close()
+                return
+            old, self._copy = self._copy, _Copy(conn, generation)
+            if old is not None:
+                old.retired = True
+                if old.active == 0:
+                    old.conn.close()
+        logger.info(f"Loaded {self.pool.db_path} into DuckDB in {time.perf_counter() - started:.1f}s")
+
+    def _release(self, copy: _Copy) -> None:
+        with self._lock:
+            copy.active -= 1
+            if copy.retired and copy.active == 0:
+                copy.conn.close()
+
+    def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+        """Block until the copy matches the current data (for scripts and benchmarks)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            generation = self.data_generation()
+            with self._lock:
+                if self._copy is not None and self._copy.generation == generation:
+                    return True
+                if self._closed or generation is None:
+                    return False
+                self._start_load(generation)
+                loader = self._loader
+            # Một lần nạp thế hệ cũ có thể đang chạy: chờ nó xong rồi nạp lại
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            loader.join(remaining)
+
+    @contextmanager
+    def cursor(self):
+        """
+        A DuckDB cursor on the loaded copy, with the generation of the data it holds.
+
+        If the data changed, a reload starts in the background and this
+        cursor still reads the previous copy.
+
+        Raises:
+            DuckDBNotReady: The first copy has not finished loading yet.
+        """
+        generation = self.data_generation()
+        if generation is None:
+            raise FileNotFoundError(f"Database file not found at {self.pool.db_path}")
+        with self._lock:
+            if self._copy is None or self._copy.generation != generation:
+                self._start_load(generation)
+            copy = self._copy
+            if copy is None:
+                raise DuckDBNotReady(f"{self.pool.db_path} is still loading into DuckDB")
+            cursor = copy.conn.cursor()
+            copy.active += 1
+        try:
+            # Khớp ngữ nghĩa SQLite (5/2 = 2); thiết lập theo phiên nên đặt cho từng cursor
+            cursor.execute("SET integer_division = true")
+            yield cursor, copy.generation
+        finally:
+            cursor.close()
+            self._release(copy)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            copy, self._copy = self._copy, None
+            if copy is not None:
+                copy.retired = True
+                if copy.active == 0:
+                    copy.conn.close()
+
+
+_engines: Dict[tuple, DuckDBEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_duckdb_engine(db_path: str = 'vnstock_data.db', parquet_root: Optional[str] = None,
+                      **kwargs) -> DuckDBEngine:
+    """
+    Return the process-wide DuckDB engine for `db_path`, creating it on first use.
+
+    Keyword arguments are only applied when the engine is created.
+    """
+    key = (db_path, parquet_root)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = DuckDBEngine(db_path, parquet_root, **kwargs)
+            _engines[key] = engine
+        return engine
@@ -0,0 +1,295 @@
+# price_matrix.py
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from data.stock import get_connection_pool
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ("open", "high", "low", "close", "volume")
+FIELD_DTYPES = {"open": "float32", "high": "float32", "low": "float32", "close": "float32", "volume": "float64"}
+META_FILE = "meta.json"
+
+
+def build_price_matrix(db_path: str = 'vnstock_data.db', out_dir: str = 'price_matrix',
+                       fetch_size: int = 100000) -> Path:
+    """
+    Turn `vnstock_prices` into one ticker x trading-day memmap per OHLCV field.
+
+    Days without a row for a ticker (suspended, not yet listed) carry the last
+    known open/high/low/close forward and get volume 0; days before the first
+    trade stay NaN. The matrices are written to a temporary folder and moved
+    into place, then `meta.json` records tickers, dates and the database
+    generation they were built from.
+
+    Args:
+        db_path (str): Database file, relative to the `data` folder.
+        out_dir (str): Output folder, relative to the `data` folder.
+        fetch_size (int): Rows fetched from SQLite per batch.
+
+    Returns:
+        Path: The output folder.
+    """
+    pool = get_connection_pool(db_path)
+    out_dir = Path(__file__).parent.resolve() / out_dir
+    tmp_dir = out_dir.with_name(out_dir.name + ".building")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    started = time.perf_counter()
+    generation = pool.data_generation()
+    with pool.connection() as conn:
+        tickers = [r[0] for r in conn.execute("SELECT DISTINCT ticker FROM vnstock_prices ORDER BY ticker")]
+        dates = [r[0] for r in conn.execute("SELECT DISTINCT time FROM vnstock_prices ORDER BY time")]
+        ticker_index = {t: i for i, t in enumerate(tickers)}
+        date_index = {d: i for i, d in enumerate(dates)}
+        shape = (len(tickers), len(dates))
+
+        matrices = {
+            field: np.lib.format.open_memmap(tmp_dir / f"{field}.npy", mode="w+", dtype=FIELD_DTYPES[field], shape=shape)
+            for field in PRICE_FIELDS
+        }
+        for matrix in matrices.values():
+            matrix[:] = np.nan
+
+        cursor = conn.execute("SELECT ticker, time, open, high, low, close, volume FROM vnstock_prices")
+        while True:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                break
+            columns = list(zip(*batch))
+            rows = np.fromiter((ticker_index[t] for t in columns[0]), dtype=np.int64, count=len(batch))
+            cols = np.fromiter((date_index[d] for d in columns[1]), dtype=np.int64, count=len(batch))
+            for k, field in enumerate(PRICE_FIELDS):
+                values = np.array([np.nan if v is None else v for v in columns[k + 2]], dtype=np.float64)
+                matrices[field][rows, cols] = values
+        cursor.close()
+
+    # Ngày không giao dịch: giữ giá gần nhất, khối lượng = 0
+    for field in ("open", "high", "low", "close"):
+        _forward_fill(matrices[field])
+    volume = matrices["volume"]
+    volume[np.isnan(volume) & ~np.isnan(matrices["close"])] = 0
+    for matrix in matrices.values():
+        matrix.flush()
+    del matrices
+
+    with open(tmp_dir / META_FILE, "w", encoding="utf-8") as f:
+        json.dump({"tickers": tickers, "dates": dates, "generation": list(generation or []),
+                   "built_at": time.time()}, f)
+
+    old_dir = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"Built price matrix {shape[0]} tickers x {shape[1]} days in {time.perf_counter() - started:.1f}s")
+    return out_dir
+
+
+def _forward_fill(matrix: np.ndarray) -> None:
+    """Forward-fill NaN along the day axis, in place."""
+    valid = ~np.isnan(matrix)
+    idx = np.where(valid, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    filled = matrix[np.arange(matrix.shape[0])[:, None], idx]
+    # trước phiên đầu tiên vẫn là NaN
+    filled[~np.maximum.accumulate(valid, axis=1)] = np.nan
+    matrix[:] = filled
+
+
+class PriceMatrix:
+    """
+    Read-only view of the memory-mapped OHLCV matrices with vectorized
+    cross-sectional primitives. Rows are tickers, columns are trading days.
+    """
+
+    def __init__(self, folder: Path):
+        with open(folder / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.folder = folder
+        self.tickers: List[str] = meta["tickers"]
+        self.dates: List[str] = meta["dates"]
+        self.generation = tuple(meta["generation"]) or None
+        self.ticker_index: Dict[str, int] = {t: i for i, t in enumerate(self.tickers)}
+        self._dates = np.array(self.dates)
+        self.fields = {field: np.load(folder / f"{field}.npy", mmap_mode="r") for field in PRICE_FIELDS}
+
+    def field(self, name: str) -> np.ndarray:
+        if name not in self.fields:
+            raise ValueError(f"Unknown field: {name}. Must be one of: {', '.join(PRICE_FIELDS)}")
+        return self.fields[name]
+
+    def day_index(self, date: Optional[str] = None) -> int:
+        """Index of the last trading day on or before `date` (the latest day if None)."""
+        if date is None:
+            return len(self.dates) - 1
+        i = int(np.searchsorted(self._dates, date, side="right")) - 1
+        if i < 0:
+            raise ValueError(f"No trading data on or before {date}")
+        return i
+
+    def rows(self, tickers: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Row indexes for `tickers` (all tickers if None); unknown tickers raise."""
+        if tickers is None:
+            return np.arange(len(self.tickers))
+        missing = [t for t in tickers if t not in self.ticker_index]
+        if missing:
+            raise ValueError(f"Unknown tickers: {', '.join(missing)}")
+        return np.array([self.ticker_index[t] for t in tickers], dtype=np.int64)
+
+    def returns(self, days: int, end: Optional[str] = None, rows: np.ndarray = None) -> np.ndarray:
+        """Close-to-close return over the last `days` trading days ending at `end`."""
+        e = self.day_index(end)
+        s = e - days
+        if s < 0:
+            raise ValueError(f"Not enough history for a {days}-day return")
+        close = self.fields["close"]
+        rows = self.rows() if rows is None else rows
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return close[rows, e] / close[rows, s] - 1
+
+    def rolling_max(self, field: str, window: int, end: Optional[str] = None, rows: np.ndarray = None) -> np.ndarray:
+        """Maximum of `field` over the last `window` trading days ending at `end`."""
+        return self._window_reduce(np.nanmax, field, window, end, rows)
+
+    def rolling_min(self, field: str, window: int, end: Optional[str] = None, rows: np.ndarray = None) -> np.ndarray:
+        """Minimum of `field` over the last `window` trading days ending at `end`."""
+        return self._window_reduce(np.nanmin, field, window, end, rows)
+
+    def _window_reduce(self, fn, field, window, end, rows):
+        e = self.day_index(end)
+        rows = self.rows() if rows is None else rows
+        block = self.field(field)[rows, max(0, e - window + 1):e + 1]
+        out = np.full(len(rows), np.nan)
+        has_data = ~np.all(np.isnan(block), axis=1)
+        out[has_data] = fn(block[has_data], axis=1)
+        return out
+
+    def streaks(self, direction: str = "up", end: Optional[str] = None, lookback: int = 60,
+                rows: np.ndarray = None) -> np.ndarray:
+        """
+        Consecutive sessions with a rising ("up") or falling ("down") close,
+        ending at `end`, counted up to `lookback`.
+        """
+        if direction not in ("up", "down"):
+            raise ValueError("direction must be 'up' or 'down'")
+        e = self.day_index(end)
+        rows = self.rows() if rows is None else rows
+        close = self.fields["close"][rows, max(0, e - lookback):e + 1]
+        diff = np.diff(close, axis=1)
+        moved = diff > 0 if direction == "up" else diff < 0
+        # đếm số True liên tiếp tính từ cuối
+        broken = ~moved[:, ::-1]
+        return np.where(broken.any(axis=1), broken.argmax(axis=1), moved.shape[1])
+
+    def correlation(self, rows: np.ndarray, days: int, end: Optional[str] = None) -> np.ndarray:
+        """
+        Pairwise correlation of daily returns over the last `days` sessions,
+        using only the days every ticker traded on.
+        """
+        e = self.day_index(end)
+        start = max(0, e - days)
+        close = self.fields["close"][rows, start:e + 1].astype(np.float64)
+        volume = self.fields["volume"][rows, start + 1:e + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            daily = close[:, 1:] / close[:, :-1] - 1
+        # Ngày nghỉ giao dịch được điền giá cũ (volume 0) sẽ thành lợi nhuận 0% giả: bỏ như ngày NaN
+        daily[volume == 0] = np.nan
+        daily = daily[:, ~np.isnan(daily).any(axis=0)]
+        if daily.shape[1] < 2:
+            raise ValueError("Not enough overlapping history to compute correlation")
+        return np.corrcoef(daily)
+
+    @staticmethod
+    def rank(values: np.ndarray, top: int, ascending: bool = False) -> np.ndarray:
+        """Positions of the `top` best values, NaN excluded."""
+        valid = np.flatnonzero(~np.isnan(values))
+        if len(valid) == 0:
+            return valid
+        keys = values[valid] if ascending else -values[valid]
+        top = min(top, len(valid))
+        best = np.argpartition(keys, top - 1)[:top]
+        return valid[best[np.argsort(keys[best], kind="stable")]]
+
+
+class PriceMatrixNotReady(RuntimeError):
+    """Raised while the first price matrix of the process is still being built."""
+
+
+_matrix: Optional[PriceMatrix] = None
+_matrix_lock = threading.Lock()
+_build_thread: Optional[threading.Thread] = None
+
+
+def _start_build(db_path: str, out_dir: str, folder: Path) -> None:
+    """Rebuild the matrices on a daemon thread and swap them in when done (caller holds _matrix_lock)."""
+    global _build_thread
+
+    def run():
+        global _matrix
+        try:
+            build_price_matrix(db_path, out_dir)
+            matrix = PriceMatrix(folder)
+        except Exception as e:
+            logger.error(f"Building price matrix failed: {e}")
+            return
+        with _matrix_lock:
+            _matrix = matrix
+
+    _build_thread = threading.Thread(target=run, name="price-matrix-build", daemon=True)
+    _build_thread.start()
+
+
+def get_price_matrix(db_path: str = 'vnstock_data.db', out_dir: str = 'price_matrix',
+                     auto_build: bool = True) -> PriceMatrix:
+    """
+    Return the process-wide price matrix without ever building it on the
+    caller's thread.
+
+    When the database generation differs from the one the matrices were
+    built from, a rebuild starts in the background and the previous matrix
+    (in memory, or the stale one on disk) keeps being served until the new
+    one is ready.
+
+    Raises:
+        PriceMatrixNotReady: No matrix exists yet; the first build is running.
+        FileNotFoundError: The database is missing, or the matrix is missing
+            or out of date and `auto_build` is False.
+    """
+    global _matrix
+    folder = Path(__file__).parent.resolve() / out_dir
+    generation = get_connection_pool(db_path).data_generation()
+    if generation is None:
+        raise FileNotFoundError(f"Database file not found for {db_path}")
+    with _matrix_lock:
+        if _matrix is not None and _matrix.generation == generation:
+            return _matrix
+        building = _build_thread is not None and _build_thread.is_alive()
+        # Không đọc thư mục khi đang build: builder có thể đang thay thư mục đó
+        if not building and (folder / META_FILE).exists():
+            on_disk = PriceMatrix(folder)
+            if _matrix is None or on_disk.generation == generation:
+                _matrix = on_disk
+        if _matrix is None or _matrix.generation != generation:
+            if not auto_build:
+                raise FileNotFoundError(f"Price matrix at {folder} is missing or out of date")
+            if not building:
+                logger.info("Price matrix out of date, rebuilding in the background")
+                _start_build(db_path, out_dir, folder)
+        if _matrix is None:
+            raise PriceMatrixNotReady("The price matrix is being built for the first time")
+        return _matrix
+
+# Main execution
+if __name__ == "__main__":
+    build_price_matrix()
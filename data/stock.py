@@ -1,7 +1,11 @@
 # stock.py
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict, Optional
 import logging
+import queue
 import sqlite3
+import threading
 import os
 
 # Configure logging
@@ -20,13 +24,13 @@ class VNStockData:
     def __init__(self, db_path: str = 'vnstock_data.db'):
         try:
             current_dir = Path(__file__).parent.resolve()
-            self.db_path = current_dir / db_path  
+            self.db_path = current_dir / db_path
             logger.info(f"Using database path: {self.db_path}")
             self.conn = self.connect_db()
         except Exception as e:
             logger.error(f"Error in StockData initialization: {e}")
             self.conn = None
-        
+
     def connect_db(self) -> sqlite3.Connection:
         if not os.path.exists(self.db_path):
             logger.error(f"Database file not found at {self.db_path}")
@@ -43,3 +47,200 @@ class VNStockData:
         if hasattr(self, 'conn') and self.conn:
             self.conn.close()
             logger.info(f"Closed database connection {self.db_path}")
+
+
+class VNStockConnectionPool:
+    """
+    Thread-safe pool of read-only SQLite connections to the vnstock database.
+
+    Connections are opened lazily with a `mode=ro` URI and `query_only`, so
+    nothing executed through the pool can modify the file. Idle connections
+    are kept and handed out again instead of reconnecting on every query.
+    """
+
+    def __init__(self, db_path: str = 'vnstock_data.db', max_size: int = 8,
+                 mmap_size: int = 256 * 1024 * 1024, cache_size_kb: int = 64 * 1024,
+                 acquire_timeout: float = 30.0):
+        """
+        Args:
+            db_path (str): Database file, relative to the `data` folder.
+            max_size (int): Maximum number of open connections.
+            mmap_size (int): Bytes of the file to memory-map (PRAGMA mmap_size).
+            cache_size_kb (int): Page cache per connection in KiB (PRAGMA cache_size).
+            acquire_timeout (float): Seconds to wait for a free connection.
+        """
+        current_dir = Path(__file__).parent.resolve()
+        self.db_path = current_dir / db_path
+        self.max_size = max_size
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open_count = 0
+        # inode of the file each connection was opened on, to spot a swapped-in rebuild
+        self._conn_inodes: Dict[int, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "waits": 0, "timeouts": 0, "errors": 0, "recycled": 0}
+
+    def _open_connection(self) -> sqlite3.Connection:
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"Database file not found at {self.db_path}")
+        uri = f"{self.db_path.as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        with self._lock:
+            self._conn_inodes[id(conn)] = os.stat(self.db_path).st_ino
+        logger.info(f"Opened pooled read-only connection to {self.db_path}")
+        return conn
+
+    def _is_stale(self, conn: sqlite3.Connection) -> bool:
+        """True if the database file was replaced since `conn` was opened."""
+        try:
+            current = os.stat(self.db_path).st_ino
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            return self._conn_inodes.get(id(conn)) != current
+
+    def acquire(self) -> sqlite3.Connection:
+        """
+        Take a connection from the pool, opening a new one if the pool is not full.
+
+        Raises:
+            FileNotFoundError: If the database file does not exist.
+            TimeoutError: If no connection became free within `acquire_timeout`.
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_stale(conn):
+                # import_to_sql đã thay file mới: đóng kết nối tới file cũ
+                self._close(conn)
+                with self._lock:
+                    self._stats["recycled"] += 1
+                continue
+            with self._lock:
+                self._stats["hits"] += 1
+            return conn
+
+        with self._lock:
+            can_open = self._open_count < self.max_size
+            if can_open:
+                self._open_count += 1
+                self._stats["misses"] += 1
+            else:
+                self._stats["waits"] += 1
+
+        if can_open:
+            try:
+                return self._open_connection()
+            except Exception:
+                with self._lock:
+                    self._open_count -= 1
+                    self._stats["errors"] += 1
+                raise
+
+        try:
+            conn = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise TimeoutError(f"No free database connection after {self.acquire_timeout}s")
+        if self._is_stale(conn):
+            self._close(conn)
+            with self._lock:
+                self._stats["recycled"] += 1
+            return self.acquire()
+        return conn
+
+    def release(self, conn: sqlite3.Connection, discard: bool = False) -> None:
+        """Return a connection to the pool, or close it if `discard` is set."""
+        if discard:
+            self._close(conn)
+            return
+        self._idle.put(conn)
+
+    def _close(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+        with self._lock:
+            self._open_count -= 1
+            self._conn_inodes.pop(id(conn), None)
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection and returning it afterwards."""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            # Bad SQL leaves the connection usable; anything else (corrupt or
+            # replaced file, internal error) may not, so don't hand it out again
+            discard = not isinstance(e, (sqlite3.OperationalError, sqlite3.ProgrammingError))
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self) -> None:
+        """Close every idle connection. Connections in use are closed on release."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+
+    def data_generation(self) -> Optional[tuple]:
+        """
+        Identify the current contents of the database file.
+
+        Changes whenever an import rewrites or replaces the file (inode, size,
+        mtime of the database and its WAL). Returns None if the file is missing.
+        """
+        try:
+            st = os.stat(self.db_path)
+        except FileNotFoundError:
+            return None
+        generation = (st.st_ino, st.st_size, st.st_mtime_ns)
+        try:
+            wal = os.stat(f"{self.db_path}-wal")
+            generation += (wal.st_size, wal.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return generation
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring: hits, misses, waits, timeouts, errors, recycled, open, idle."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open"] = self._open_count
+        stats["idle"] = self._idle.qsize()
+        stats["max_size"] = self.max_size
+        return stats
+
+
+_pools: Dict[Path, VNStockConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_path: str = 'vnstock_data.db', **kwargs) -> VNStockConnectionPool:
+    """
+    Return the process-wide pool for `db_path`, creating it on first use.
+
+    Keyword arguments are only applied when the pool is created.
+    """
+    key = (Path(__file__).parent.resolve() / db_path)
+    with _pools_lock:
+        pool: Optional[VNStockConnectionPool] = _pools.get(key)
+        if pool is None:
+            pool = VNStockConnectionPool(db_path, **kwargs)
+            _pools[key] = pool
+        return pool
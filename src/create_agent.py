@@ -1,4 +1,5 @@
 import logging
+import time
 from dataclasses import dataclass
 
 # Configure logging
@@ -13,15 +14,105 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Ước lượng token: ~4 ký tự / token, cộng chi phí cố định cho mỗi message
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough for budgeting without a tokenizer."""
+    return len(text or "") // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class CallUsage:
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    estimated_prompt_tokens: int
+    latency_ms: float
+
+
 class Agent:
-    def __init__(self, client, system):
+    def __init__(self, client, system, max_context_tokens: int = 6000, keep_observations: int = 1,
+                 observation_preview_chars: int = 600):
+        """
+        Args:
+            client: Groq client.
+            system (str): System prompt.
+            max_context_tokens (int): Prompt budget; older observations are trimmed beyond it.
+            keep_observations (int): Most recent observations that are never trimmed.
+            observation_preview_chars (int): Characters kept from a trimmed observation.
+        """
         self.client = client
         self.system = system
         self.messages = []
+        self.max_context_tokens = max_context_tokens
+        self.keep_observations = keep_observations
+        self.observation_preview_chars = observation_preview_chars
+        self.usage = []
 
         if self.system is not None:
             self.messages.append({"role": "system", "content": self.system})
 
+    def context_tokens(self) -> int:
+        return sum(estimate_tokens(m["content"]) for m in self.messages)
+
+    def compact(self) -> int:
+        """
+        Trim old observations, oldest first, until the prompt fits the budget.
+
+        The system prompt, the question and the assistant turns are kept; a
+        trimmed observation keeps its head and a note of how much was dropped.
+
+        Returns:
+            int: Estimated tokens removed.
+        """
+        total = self.context_tokens()
+        if total <= self.max_context_tokens:
+            return 0
+        observations = [i for i, m in enumerate(self.messages)
+                        if m["role"] == "user" and m["content"].startswith("Observation")]
+        trimmable = observations[:-self.keep_observations] if self.keep_observations else observations
+        removed = 0
+        for i in trimmable:
+            if total - removed <= self.max_context_tokens:
+                break
+            content = self.messages[i]["content"]
+            if len(content) <= self.observation_preview_chars or self.messages[i].get("compacted"):
+                continue
+            omitted = estimate_tokens(content[self.observation_preview_chars:])
+            trimmed = (f"{content[:self.observation_preview_chars]}\n"
+                       f"... [observation trimmed: ~{omitted} tokens omitted to save context]")
+            removed += estimate_tokens(content) - estimate_tokens(trimmed)
+            self.messages[i] = {"role": "user", "content": trimmed, "compacted": True}
+        if removed:
+            logger.info(f"Compacted context from ~{total} to ~{total - removed} tokens")
+        return removed
+
+    def _request_messages(self) -> list:
+        # Chỉ gửi role/content, bỏ các khóa nội bộ như "compacted"
+        return [{"role": m["role"], "content": m["content"]} for m in self.messages]
+
+    def _record_usage(self, usage, estimated: int, started: float) -> None:
+        latency_ms = (time.perf_counter() - started) * 1000
+        if usage is not None:
+            call = CallUsage(usage.prompt_tokens, usage.completion_tokens, usage.total_tokens, estimated, latency_ms)
+        else:
+            call = CallUsage(0, 0, 0, estimated, latency_ms)
+        self.usage.append(call)
+        logger.info(f"LLM call {len(self.usage)}: prompt={call.prompt_tokens} completion={call.completion_tokens} "
+                    f"(estimated prompt {estimated}) in {latency_ms:.0f} ms")
+
+    def usage_summary(self) -> dict:
+        """Per-call token usage plus totals for this agent."""
+        return {
+            "calls": [vars(call) for call in self.usage],
+            "prompt_tokens": sum(call.prompt_tokens for call in self.usage),
+            "completion_tokens": sum(call.completion_tokens for call in self.usage),
+            "total_tokens": sum(call.total_tokens for call in self.usage),
+        }
+
     def __call__(self, message=""):
         """
         Execute agent interaction.
@@ -44,14 +135,70 @@ class Agent:
         Returns:
             str: Generated response from the language model
         """
+        self.compact()
+        estimated = self.context_tokens()
+        started = time.perf_counter()
         try:
             completion = self.client.chat.completions.create(
-                messages=self.messages,
+                messages=self._request_messages(),
                 model="llama3-70b-8192",
             )
+            self._record_usage(getattr(completion, "usage", None), estimated, started)
             result = completion.choices[0].message.content
             self.messages.append({"role": "assistant", "content": result})
             return result
         except Exception as e:
             logger.error(f"Error during Groq API call: {e}")
-            return "Error: Unable to process your agent execute request at this time"
\ No newline at end of file
+            return "Error: Unable to process your agent execute request at this time"
+
+    def stream(self, message=""):
+        """
+        Execute agent interaction, yielding the response as it is generated.
+
+        Args:
+            message (str, optional): User message. Defaults to "".
+
+        Yields:
+            str: Pieces of the agent's response
+        """
+        if message:
+            self.messages.append({"role": "user", "content": message})
+        yield from self.execute_stream()
+
+    def execute_stream(self):
+        """
+        Execute a streaming Groq API call (`stream=True`).
+
+        The full response is appended to the message history once the stream ends.
+
+        Yields:
+            str: Content deltas from the language model
+        """
+        parts = []
+        self.compact()
+        estimated = self.context_tokens()
+        started = time.perf_counter()
+        usage = None
+        try:
+            stream = self.client.chat.completions.create(
+                messages=self._request_messages(),
+                model="llama3-70b-8192",
+                stream=True,
+            )
+            for chunk in stream:
+                # Groq gửi usage ở chunk cuối, trong x_groq
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            logger.error(f"Error during Groq API call: {e}")
+            if not parts:
+                error = "Error: Unable to process your agent execute request at this time"
+                parts.append(error)
+                yield error
+        self._record_usage(usage, estimated, started)
+        self.messages.append({"role": "assistant", "content": "".join(parts)})
@@ -0,0 +1,142 @@
+# benchmark_memory.py
+"""
+Micro-benchmark of the memory calls made by ask_agent for one user turn.
+
+Usage: python -m src.history.benchmark_memory [n_messages] [repeat]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from src.history.sqlite_memory import SQLiteAutoSummaryMemory
+
+MESSAGES_PER_CONVERSATION = 100
+CONVERSATIONS_PER_USER = 10
+
+
+def _closing_call(name: str):
+    method = getattr(SQLiteAutoSummaryMemory, name)
+
+    def call(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.close()
+    return call
+
+
+class _PerCallConnectionMemory(SQLiteAutoSummaryMemory):
+    """
+    Old behaviour: every call opens a fresh connection (default journal) and
+    closes it before returning, as the memory code did before connections
+    were kept per thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._opened = []
+        super().__init__(*args, **kwargs)
+        self.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        self._opened.append(conn)
+        return conn
+
+    def close(self):
+        while self._opened:
+            self._opened.pop().close()
+
+    # các lời gọi trong ask_agent_memory_calls
+    add_message = _closing_call("add_message")
+    get_summary = _closing_call("get_summary")
+    get_recent_messages = _closing_call("get_recent_messages")
+    get_conversations = _closing_call("get_conversations")
+
+
+def _no_summary(text: str) -> str:
+    return ""
+
+
+def build_memory_db(db_path: str, n_messages: int) -> int:
+    """Fill a memory database with `n_messages` messages; returns the number of users."""
+    n_conversations = max(1, n_messages // MESSAGES_PER_CONVERSATION)
+    n_users = max(1, n_conversations // CONVERSATIONS_PER_USER)
+    memory = SQLiteAutoSummaryMemory(db_path, _no_summary, async_summary=False)
+    conn = memory._connect()
+    now = datetime.utcnow().isoformat()
+    with conn:
+        conn.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                         ((f"user{u}", "x") for u in range(n_users)))
+        conn.executemany("INSERT INTO conversations (user_id, title, created_at, updated_at, message_count) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         ((c % n_users + 1, f"title {c}", now, now, MESSAGES_PER_CONVERSATION)
+                          for c in range(n_conversations)))
+        # message xen kẽ giữa các conversation như khi nhiều user chat cùng lúc
+        conn.executemany("INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                         ((m % n_conversations + 1, "user" if m % 2 == 0 else "assistant",
+                           f"message {m} " + "x" * 80, now) for m in range(n_messages)))
+    memory.close()
+    return n_users
+
+
+def ask_agent_memory_calls(memory: SQLiteAutoSummaryMemory, user_id: int, conversation_id: int) -> None:
+    """The memory calls of one ask_agent turn plus the sidebar refresh in app.py."""
+    memory.add_message(user_id, "user", "Giá đóng cửa của FPT hôm qua?", conversation_id)
+    memory.get_summary(conversation_id)
+    memory.get_recent_messages(conversation_id, limit=4)
+    memory.add_message(user_id, "assistant", "Giá đóng cửa của FPT là 128.5.", conversation_id)
+    memory.get_conversations(user_id)
+
+
+def time_turns(memory: SQLiteAutoSummaryMemory, n_users: int, repeat: int) -> float:
+    rng = random.Random(0)
+    # kết nối riêng để chọn conversation, không lẫn vào kết nối của memory đang đo
+    lookup = sqlite3.connect(memory.db_path)
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            user_id = rng.randint(1, n_users)
+            conversation_id = lookup.execute("SELECT id FROM conversations WHERE user_id=? LIMIT 1",
+                                             (user_id,)).fetchone()[0]
+            ask_agent_memory_calls(memory, user_id, conversation_id)
+        return (time.perf_counter() - started) / repeat * 1000
+    finally:
+        lookup.close()
+
+
+def benchmark(n_messages: int = 1_000_000, repeat: int = 20) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "chat_memory.db")
+        started = time.perf_counter()
+        n_users = build_memory_db(db_path, n_messages)
+        print(f"Built {n_messages} messages for {n_users} users in {time.perf_counter() - started:.1f}s")
+
+        # max_turns lớn: chỉ đo các lời gọi memory, không đo summarizer
+        old = _PerCallConnectionMemory(db_path, _no_summary, max_turns=10**9, async_summary=False)
+        conn = old._connect()
+        conn.execute("DROP INDEX idx_messages_conversation")
+        conn.execute("DROP INDEX idx_conversations_user")
+        old.close()
+        before = time_turns(old, n_users, max(1, repeat // 4))
+
+        new = SQLiteAutoSummaryMemory(db_path, _no_summary, max_turns=10**9, async_summary=False)
+        new._connect().execute("PRAGMA user_version = 1")
+        new._init_db()
+        after = time_turns(new, n_users, repeat)
+
+        print(f"{'setup':<40}{'ms / turn':>12}")
+        print(f"{'per-call connection, no indexes':<40}{before:>12.2f}")
+        print(f"{'thread-local connection, WAL, indexes':<40}{after:>12.2f}")
+        print(f"speedup: {before / after:.0f}x")
+        new.close()
+
+# Main execution
+if __name__ == "__main__":
+    n_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    benchmark(n_messages, repeat)
@@ -1,21 +1,111 @@
 # sqlite_memory.py
 import sqlite3
+import threading
 from datetime import datetime
 import hashlib
 from typing import List, Dict, Tuple, Optional
 
+from src.history.summary_worker import SummaryWorker
+
+def _migration_1(conn):
+    # DB cũ chưa có cột summarized_upto_message_id
+    columns = [r["name"] for r in conn.execute("PRAGMA table_info(conversations)").fetchall()]
+    if "summarized_upto_message_id" not in columns:
+        conn.execute("ALTER TABLE conversations ADD COLUMN summarized_upto_message_id INTEGER DEFAULT 0")
+
+
+def _migration_2(conn):
+    # Index cho các truy vấn theo conversation / user, tránh quét toàn bảng khi lịch sử lớn dần
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (user_id, id)")
+
+
+def _migration_3(conn):
+    # Lưu sẵn metadata của conversation để sidebar không phải tính lại từ bảng messages
+    columns = [r["name"] for r in conn.execute("PRAGMA table_info(conversations)").fetchall()]
+    for name, ddl in (("title", "TEXT DEFAULT ''"), ("created_at", "TEXT"), ("updated_at", "TEXT"),
+                      ("message_count", "INTEGER DEFAULT 0")):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE conversations ADD COLUMN {name} {ddl}")
+    # Trước đây title nằm trong summary, hoặc lấy từ tin nhắn đầu tiên
+    conn.execute("""
+        UPDATE conversations SET
+            title = substr(trim(COALESCE(NULLIF(summary, ''), (
+                SELECT content FROM messages m WHERE m.conversation_id = conversations.id ORDER BY m.id LIMIT 1
+            ), '')), 1, 50),
+            created_at = (SELECT MIN(created_at) FROM messages m WHERE m.conversation_id = conversations.id),
+            updated_at = (SELECT MAX(created_at) FROM messages m WHERE m.conversation_id = conversations.id),
+            message_count = (SELECT COUNT(1) FROM messages m WHERE m.conversation_id = conversations.id)
+    """)
+
+
+MEMORY_MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+]
+
+
+def migrate_memory(conn: sqlite3.Connection) -> int:
+    """
+    Apply pending memory-schema migrations, tracked in PRAGMA user_version.
+
+    Returns:
+        int: Schema version after migrating.
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, step in MEMORY_MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        current = version
+    return current
+
 class SQLiteAutoSummaryMemory:
-    def __init__(self, db_path: str, summarizer_fn, max_turns: int = 6):
+    def __init__(self, db_path: str, summarizer_fn, max_turns: int = 6, async_summary: bool = True,
+                 summary_debounce: float = 2.0):
         self.db_path = db_path
         self.summarizer_fn = summarizer_fn
         self.max_turns = max_turns
+        # Mỗi thread giữ một kết nối mở lại cho mọi lần gọi
+        self._local = threading.local()
+        # Bộ đếm ghi theo user: UI dùng làm khóa cache, đổi khi có conversation/message mới
+        self._versions: Dict[str, int] = {}
+        self._versions_lock = threading.Lock()
         self._init_db()
+        # Tóm tắt chạy nền, debounce theo conversation -> add_message không chờ Groq
+        self._summary_worker = SummaryWorker(self.auto_summarize, summary_debounce) if async_summary else None
 
     def _connect(self):
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
         return conn
 
+    def _bump_version(self, user_id) -> None:
+        with self._versions_lock:
+            key = str(user_id)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def data_version(self, user_id) -> int:
+        """Số lần ghi (create_conversation/add_message) của user trong process này."""
+        with self._versions_lock:
+            return self._versions.get(str(user_id), 0)
+
+    def close(self):
+        """Đóng kết nối của thread hiện tại."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
     def _init_db(self):
         conn = self._connect()
         c = conn.cursor()
@@ -33,6 +123,7 @@ class SQLiteAutoSummaryMemory:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
                 summary TEXT DEFAULT '',
+                summarized_upto_message_id INTEGER DEFAULT 0,
                 FOREIGN KEY(user_id) REFERENCES users(id)
             )
         """)
@@ -48,7 +139,7 @@ class SQLiteAutoSummaryMemory:
             )
         """)
         conn.commit()
-        conn.close()
+        migrate_memory(conn)
         
     def register_user(self, username: str, password: str) -> bool:
         try:
@@ -57,9 +148,9 @@ class SQLiteAutoSummaryMemory:
             hashed_pw = hashlib.sha256(password.encode()).hexdigest()
             c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_pw))
             conn.commit()
-            conn.close()
             return True
         except sqlite3.IntegrityError:
+            conn.rollback()
             return False
 
     def authenticate_user(self, username: str, password: str) -> Optional[int]:
@@ -68,19 +159,19 @@ class SQLiteAutoSummaryMemory:
         hashed_pw = hashlib.sha256(password.encode()).hexdigest()
         c.execute("SELECT id FROM users WHERE username=? AND password=?", (username, hashed_pw))
         row = c.fetchone()
-        conn.close()
         return row["id"] if row else None
     
     def create_conversation(self, user_id: int, title: str = '') -> int:
         conn = self._connect()
         c = conn.cursor()
+        now = datetime.utcnow().isoformat()
         c.execute(
-            "INSERT INTO conversations (user_id, summary) VALUES (?, ?)",
-            (user_id, title)
+            "INSERT INTO conversations (user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (user_id, (title or '').strip()[:50], now, now)
         )
         conv_id = c.lastrowid
         conn.commit()
-        conn.close()
+        self._bump_version(user_id)
         return conv_id
 
     def _get_or_create_conversation(self, user_id: str, title: str = '') -> int:
@@ -91,10 +182,7 @@ class SQLiteAutoSummaryMemory:
         if row:
             conv_id = row["id"]
         else:
-            c.execute("INSERT INTO conversations (user_id, summary) VALUES (?, ?)", (user_id, title))
-            conv_id = c.lastrowid
-            conn.commit()
-        conn.close()
+            conv_id = self.create_conversation(user_id, title)
         return conv_id
 
     def add_message(self, user_id: str, role: str, content: str, conversation_id: int = None):
@@ -105,35 +193,80 @@ class SQLiteAutoSummaryMemory:
         
         conn = self._connect()
         c = conn.cursor()
+        now = datetime.utcnow().isoformat()
         c.execute("""
             INSERT INTO messages (conversation_id, role, content, created_at)
             VALUES (?, ?, ?, ?)
-        """, (conv_id, role, content, datetime.utcnow().isoformat()))
+        """, (conv_id, role, content, now))
+        # cập nhật metadata trong cùng transaction; title lấy từ tin nhắn user đầu tiên nếu còn trống
+        c.execute("""
+            UPDATE conversations SET
+                message_count = COALESCE(message_count, 0) + 1,
+                updated_at = ?,
+                created_at = COALESCE(created_at, ?),
+                title = CASE WHEN COALESCE(title, '') = '' AND ? = 'user' THEN ? ELSE title END
+            WHERE id=?
+        """, (now, now, role, (content or '').strip()[:50], conv_id))
         conn.commit()
+        self._bump_version(user_id)
 
         # check recent messages count and auto summarize if needed
-        c.execute("""
-            SELECT COUNT(1) as cnt FROM messages WHERE conversation_id=?
-        """, (conv_id,))
-        cnt = c.fetchone()["cnt"]
+        c.execute("SELECT message_count AS cnt FROM conversations WHERE id=?", (conv_id,))
+        row = c.fetchone()
+        cnt = row["cnt"] if row else 0
         if cnt >= self.max_turns:
             # call summarizer on context
-            self.auto_summarize(conv_id)
-        conn.close()
+            if self._summary_worker is None:
+                self.auto_summarize(conv_id)
+            elif role != "user":
+                # Lượt chỉ trọn khi reply của assistant đã lưu -> một lần gọi summarizer mỗi lượt
+                self._summary_worker.schedule(conv_id)
 
     def auto_summarize(self, conversation_id: int):
-        ctx = self.get_context(conversation_id, include_summary=True)
+        """
+        Tóm tắt tăng dần: summary trước đó + chỉ các message mới sau summarized_upto_message_id.
+        """
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("SELECT summary, summarized_upto_message_id FROM conversations WHERE id=?", (conversation_id,))
+        row = c.fetchone()
+        if row is None:
+            return
+        upto = row["summarized_upto_message_id"] or 0
+        c.execute("""
+            SELECT id, role, content FROM messages
+            WHERE conversation_id=? AND id>?
+            ORDER BY id ASC
+        """, (conversation_id, upto))
+        rows = c.fetchall()
+        if not rows:
+            return
+
+        parts = []
+        if row["summary"]:
+            parts.append(f"[Tóm tắt trước đó]: {row['summary']}\n")
+        for r in rows:
+            parts.append(f"{r['role'].capitalize()}: {r['content']}")
         try:
-            summary = self.summarizer_fn(ctx)
-            conn = self._connect()
-            c = conn.cursor()
-            c.execute("UPDATE conversations SET summary=? WHERE id=?", (summary, conversation_id))
+            summary = self.summarizer_fn("\n".join(parts))
+            if not summary:
+                return
+            # chỉ ghi nếu chưa có lần tóm tắt khác chen vào
+            c.execute("""
+                UPDATE conversations SET summary=?, summarized_upto_message_id=?
+                WHERE id=? AND summarized_upto_message_id IS ?
+            """, (summary, rows[-1]["id"], conversation_id, row["summarized_upto_message_id"]))
             conn.commit()
-            conn.close()
         except Exception as e:
             # don't fail whole flow if summarizer fails
             print(f"[Memory] summarizer error: {e}")
 
+    def flush_summaries(self, timeout: float = None) -> bool:
+        """Chờ các tóm tắt đang chờ chạy xong (dùng khi tắt app hoặc khi test)."""
+        if self._summary_worker is None:
+            return True
+        return self._summary_worker.flush(timeout)
+
     def get_context(self, conversation_id: int, include_summary: bool = True) -> str:
         conn = self._connect()
         c = conn.cursor()
@@ -151,7 +284,6 @@ class SQLiteAutoSummaryMemory:
         rows = c.fetchall()
         for r in rows:
             parts.append(f"{r['role'].capitalize()}: {r['content']}")
-        conn.close()
         return "\n".join(parts)
 
     def get_summary(self, conversation_id: int) -> str:
@@ -159,7 +291,6 @@ class SQLiteAutoSummaryMemory:
         c = conn.cursor()
         c.execute("SELECT summary FROM conversations WHERE id=?", (conversation_id,))
         row = c.fetchone()
-        conn.close()
         return row["summary"] if row else ""
 
     def get_recent_messages(self, conversation_id: int, limit: int = 4) -> List[Tuple[str, str]]:
@@ -171,7 +302,6 @@ class SQLiteAutoSummaryMemory:
             ORDER BY id DESC LIMIT ?
         """, (conversation_id, limit))
         rows = c.fetchall()
-        conn.close()
         # return oldest -> newest
         return list(reversed([(r["role"], r["content"]) for r in rows]))
 
@@ -185,53 +315,65 @@ class SQLiteAutoSummaryMemory:
             ORDER BY id ASC
         """, (conv_id,))
         rows = c.fetchall()
-        conn.close()
         return [{"role": r["role"], "content": r["content"], "time": r["created_at"]} for r in rows]
 
-    def get_conversations(self, user_id: str) -> List[Dict]:
-        """Trả về danh sách cuộc trò chuyện của user, nếu chưa có thì tạo mới."""
-        # đảm bảo có ít nhất 1 conversation
-        conv_id = self._get_or_create_conversation(user_id)
+    def get_conversations(self, user_id: str, limit: int = 50, before: int = None) -> List[Dict]:
+        """
+        Trả về danh sách cuộc trò chuyện của user, mới nhất trước, theo trang.
+
+        Chỉ đọc các cột lưu sẵn trên conversations (một lần quét index (user_id, id)),
+        không ghi gì vào DB.
 
+        Args:
+            user_id (str): User id.
+            limit (int): Số cuộc trò chuyện tối đa mỗi trang.
+            before (int): Chỉ lấy các conversation có id nhỏ hơn (id cuối của trang trước).
+
+        Returns:
+            List[Dict]: id, title, created_at, updated_at, message_count.
+        """
         conn = self._connect()
         c = conn.cursor()
         c.execute("""
-            SELECT id, summary, (
-                SELECT content FROM messages 
-                WHERE conversation_id = conversations.id 
-                ORDER BY id ASC LIMIT 1
-            ) AS first_message,
-            (
-                SELECT created_at FROM messages 
-                WHERE conversation_id = conversations.id 
-                ORDER BY id ASC LIMIT 1
-            ) AS created_at
+            SELECT id, title, created_at, updated_at, message_count
             FROM conversations
-            WHERE user_id=?
-            ORDER BY created_at DESC
-        """, (user_id,))
+            WHERE user_id=? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (user_id, before if before is not None else 2**63 - 1, limit))
         rows = c.fetchall()
-        conn.close()
 
         results = []
         for r in rows:
-            title = r["summary"] or (r["first_message"] or "Cuộc trò chuyện mới")
             results.append({
                 "id": r["id"],
-                "title": title.strip()[:50],
-                "created_at": datetime.fromisoformat(r["created_at"]) if r["created_at"] else None
+                "title": (r["title"] or "Cuộc trò chuyện mới").strip()[:50],
+                "created_at": datetime.fromisoformat(r["created_at"]) if r["created_at"] else None,
+                "updated_at": datetime.fromisoformat(r["updated_at"]) if r["updated_at"] else None,
+                "message_count": r["message_count"] or 0,
             })
         return results
 
-    def get_conversation_messages(self, conversation_id: int) -> List[Dict]:
-        """Trả về toàn bộ tin nhắn trong một cuộc trò chuyện"""
+    def get_conversation_messages(self, conversation_id: int, limit: int = None, before_id: int = None) -> List[Dict]:
+        """
+        Trả về tin nhắn trong một cuộc trò chuyện, cũ -> mới.
+
+        Args:
+            conversation_id (int): Conversation id.
+            limit (int): Chỉ lấy `limit` tin nhắn mới nhất; None lấy toàn bộ.
+            before_id (int): Chỉ lấy tin nhắn có id nhỏ hơn (để tải trang cũ hơn).
+
+        Returns:
+            List[Dict]: id, role, content, time.
+        """
         conn = self._connect()
         c = conn.cursor()
         c.execute("""
-            SELECT role, content, created_at FROM messages
-            WHERE conversation_id=?
-            ORDER BY id ASC
-        """, (conversation_id,))
+            SELECT id, role, content, created_at FROM messages
+            WHERE conversation_id=? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (conversation_id, before_id if before_id is not None else 2**63 - 1, limit if limit is not None else -1))
         rows = c.fetchall()
-        conn.close()
-        return [{"role": r["role"], "content": r["content"], "time": r["created_at"]} for r in rows]
+        return [{"id": r["id"], "role": r["role"], "content": r["content"], "time": r["created_at"]}
+                for r in reversed(rows)]
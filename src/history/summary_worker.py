@@ -0,0 +1,93 @@
+# summary_worker.py
+import logging
+import threading
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryWorker:
+    """
+    Background thread that runs conversation summarization off the request path.
+
+    `schedule(conversation_id)` only records a due time; calling it again
+    before that time pushes it back (debounce), so turns that follow each
+    other within `debounce` seconds share one summarizer call. An agent turn
+    takes longer than that, so callers schedule once per turn (after the
+    assistant reply is saved) rather than per message.
+    """
+
+    def __init__(self, summarize_fn: Callable[[int], None], debounce: float = 2.0):
+        """
+        Args:
+            summarize_fn (Callable): Summarizes one conversation id, blocking.
+            debounce (float): Seconds of quiet before a conversation is summarized.
+        """
+        self.summarize_fn = summarize_fn
+        self.debounce = debounce
+        self._pending: Dict[int, float] = {}
+        self._running = set()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="summary-worker", daemon=True)
+        self._thread.start()
+
+    def schedule(self, conversation_id: int) -> None:
+        with self._cond:
+            self._pending[conversation_id] = time.monotonic() + self.debounce
+            self._cond.notify()
+
+    def _next_due(self):
+        conversation_id = min(self._pending, key=self._pending.get)
+        return conversation_id, self._pending[conversation_id] - time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._pending:
+                        conversation_id, wait = self._next_due()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                del self._pending[conversation_id]
+                self._running.add(conversation_id)
+            try:
+                self.summarize_fn(conversation_id)
+            except Exception as e:
+                logger.error(f"Summarizing conversation {conversation_id} failed: {e}")
+            finally:
+                with self._cond:
+                    self._running.discard(conversation_id)
+                    self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Run every pending summary now and wait for them to finish.
+
+        Returns:
+            bool: False if `timeout` expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            now = time.monotonic()
+            for conversation_id in self._pending:
+                self._pending[conversation_id] = now
+            self._cond.notify_all()
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
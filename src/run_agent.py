@@ -4,10 +4,15 @@ import logging
 from typing import Dict, List, Any
 from pathlib import Path
 import json
+import atexit
 import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from src.tools.vnstockquery_tool import VNStockQueryTool
+from src.tools.pricematrix_tool import PriceMatrixTool
 from src.tools.serperdev_tool import SerperDevToolAsync
+from src.tools.search_cache import SearchResultCache
+from src.tools.event_loop import get_background_loop
 
 from src.history.sqlite_memory import SQLiteAutoSummaryMemory
 from src.history.summarizer_groq import summarizer_fn
@@ -20,9 +25,6 @@ import dotenv
 import pandas as pd
 from groq import Groq
 
-import nest_asyncio
-nest_asyncio.apply()
-
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -38,6 +40,36 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 dotenv.load_dotenv()
 
+# Tool dùng chung cho mọi request, kết nối DB lấy từ pool read-only của process.
+# VNSTOCK_QUERY_BACKEND=duckdb chạy truy vấn trên bản sao cột của DuckDB (quét / tổng hợp nhanh hơn)
+vnstockquery_tool = VNStockQueryTool(backend=os.getenv('VNSTOCK_QUERY_BACKEND', 'sqlite'),
+                                     parquet_root=os.getenv('VNSTOCK_PARQUET_PRICES') or None)
+
+# Ma trận giá ticker x ngày (memmap) cho các câu hỏi xếp hạng / chuỗi tăng giảm; build nền khi DB đổi
+pricematrix_tool = PriceMatrixTool()
+
+# Serper tool dùng chung; session aiohttp của nó sống trên event loop nền của process
+serperdev_tool = SerperDevToolAsync(api_key=os.getenv('SERPER_API_KEY'),
+                                    cache=SearchResultCache(db_path="data/memory/search_cache.db"))
+tool_loop = get_background_loop()
+SERPER_TIMEOUT = 20.0
+
+# Truy vấn SQLite chạy trên thread pool, mỗi thread lấy kết nối riêng từ pool read-only
+_sql_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vnstock-sql")
+MAX_ACTIONS_PER_TURN = 4
+# Chỉ nhận "Action:" ở đầu dòng, không khớp "Transaction: x: y" trong Thought
+ACTION_PATTERN = re.compile(r"^[ \t]*Action(?:\s*\d+)?\b\s*:\s*([a-z_]+)\s*:\s*(.+)", re.IGNORECASE | re.MULTILINE)
+
+
+@atexit.register
+def _close_tools():
+    try:
+        tool_loop.submit(serperdev_tool.close(), timeout=5.0)
+    except Exception as e:
+        logger.warning(f"Error closing tool resources: {e}")
+    tool_loop.stop()
+    _sql_executor.shutdown(wait=False)
+
 def load_system_prompt(file_name: str = 'config/system_prompt.txt') -> str:
     """
     Load system prompt from a text file
@@ -62,54 +94,131 @@ def load_system_prompt(file_name: str = 'config/system_prompt.txt') -> str:
         return """You are an Investment Portfolio Analysis Agent..."""
 
 
-def execute_tool_action(chosen_tool, args_str):
-    vnstockquery_tool = VNStockQueryTool()
-    serperdev_tool = SerperDevToolAsync(api_key=os.getenv('SERPER_API_KEY'))
+def _run_vnstock_query(args_str):
+    try:
+        result = vnstockquery_tool.query_vnstock_data(args_str)
+        logger.info(f"Tool result for query '{args_str}': {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error in query_vnstock_data: {e}")
+        return f"Error running VNStock query: {e}"
+
+
+async def _run_serper(search_query):
+    try:
+        result = await asyncio.wait_for(serperdev_tool.run(search_query=search_query, n_results=5),
+                                        timeout=SERPER_TIMEOUT)
+        return json.dumps(result, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.error(f"Error in serperdev_tool: {e}")
+        return f"Error running Serper Tool {e!r}"
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
 
+
+def submit_tool_action(chosen_tool, args_str) -> Future:
+    """
+    Start one tool call without waiting for it.
+
+    SQL queries go to a thread pool, web searches to the background event
+    loop, so several actions of one LLM turn run at the same time.
+
+    Returns:
+        Future: Resolves to the observation string; errors are returned as text.
+    """
     if chosen_tool == "query_vnstock_data":
-        try:
-            result = vnstockquery_tool.query_vnstock_data(args_str)
-            logger.info(f"Tool result for query '{args_str}': {result}")
-            return result
-        except Exception as e:
-            logger.error(f"Error in query_vnstock_data: {e}")
-            return f"Error running VNStock query: {e}"
+        return _sql_executor.submit(_run_vnstock_query, args_str)
+    elif chosen_tool == "query_price_matrix":
+        return _sql_executor.submit(pricematrix_tool.query_price_matrix, args_str)
     elif chosen_tool == "serperdev_tool":
         try:
             # args_str có thể là JSON string như: { "query": "Khái niệm về chỉ số roe" }
             search_params = json.loads(args_str) if isinstance(args_str, str) else args_str
             search_query = search_params.get("query")
-            if not search_query:
-                return "Error: Missing 'query' parameter for serperdev_tool"
-            logger.info(f"Calling SerperDevToolAsync with query: {search_query}")
-
-            # Luôn chạy trong context async an toàn
-            result = asyncio.run(serperdev_tool.run(search_query=search_query, n_results=5))
-            return json.dumps(result, ensure_ascii=False, indent=2)
         except Exception as e:
             logger.error(f"Error in serperdev_tool: {e}")
-            return f"Error running Serper Tool {e}"
+            return _done(f"Error running Serper Tool {e}")
+        if not search_query:
+            return _done("Error: Missing 'query' parameter for serperdev_tool")
+        logger.info(f"Calling SerperDevToolAsync with query: {search_query}")
+        # Gửi sang event loop nền: tái sử dụng session, không tạo loop mới mỗi lần gọi
+        return tool_loop.submit_async(_run_serper(search_query))
     else:
         logger.error(f"Unknown tool: {chosen_tool}")
-        return f"Error: Tool {chosen_tool} not recognized."
+        return _done(f"Error: Tool {chosen_tool} not recognized.")
 
 
-def agent_loop(max_iterations, system_prompt, query):
+def execute_tool_action(chosen_tool, args_str):
+    return submit_tool_action(chosen_tool, args_str).result()
+
+
+def parse_actions(result: str) -> List[tuple]:
+    """All `Action: <tool>: <args>` lines of one LLM turn, in order."""
+    return [(m.group(1), m.group(2).strip()) for m in ACTION_PATTERN.finditer(result)]
+
+
+def execute_tool_actions(actions: List[tuple]) -> str:
     """
-    Execute agent interaction loop for portfolio analysis.
+    Run the actions of one turn concurrently and batch their results.
+
+    Args:
+        actions (list): (tool, args) pairs from `parse_actions`.
+
+    Returns:
+        str: One observation message; with several actions each result is
+        numbered in the order the actions were written.
+    """
+    if len(actions) > MAX_ACTIONS_PER_TURN:
+        logger.warning(f"{len(actions)} actions in one turn, running the first {MAX_ACTIONS_PER_TURN}")
+        actions = actions[:MAX_ACTIONS_PER_TURN]
+    futures = [submit_tool_action(tool, args) for tool, args in actions]
+    results = [future.result() for future in futures]
+    if len(results) == 1:
+        return f"Observation: {results[0]}"
+    parts = [f"[{i}] {tool}: {args}\n{result}" for i, ((tool, args), result) in enumerate(zip(actions, results), 1)]
+    return "Observation:\n" + "\n\n".join(parts)
+
+
+ANSWER_PATTERN = re.compile(r'(?:\*\*Answer\*\*|Answer)\s*:\s*', re.IGNORECASE)
+ANSWER_MARKERS = ("**answer**:", "answer:")
+
+
+def _partial_marker_len(text: str) -> int:
+    """Length of the longest suffix of `text` that could still grow into an Answer marker."""
+    tail = text[-len(ANSWER_MARKERS[0]):].lower()
+    for size in range(len(tail), 0, -1):
+        if any(marker.startswith(tail[-size:]) for marker in ANSWER_MARKERS):
+            return size
+    return 0
+
+
+def agent_loop_stream(max_iterations, system_prompt, query):
+    """
+    Execute the agent loop, yielding progress events as the model streams.
+
+    Events are dicts with a "type" key:
+        - "step_token": {"iteration", "text"}, a piece of a Thought/Action turn
+        - "observation": {"iteration", "text"}, the batched tool results sent back
+        - "answer_token": {"text"}, a piece of the final Answer section
+        - "done": {"final_answer", "observations", "trace"}, always the last event
 
     Args:
         max_iterations (int): Maximum number of interaction iterations
         system_prompt (str): Initial system prompt for agent guidance
         query (str): Initial user query
 
-    Returns:
-        None: Prints analysis results
+    Yields:
+        dict: Progress events
     """
     # Initialize Groq client
     api_key=os.getenv('GROQ_API_KEY')
     if not api_key:
         logger.error("GROQ_API_KEY is not set in environment variables.")
+        yield {"type": "done", "final_answer": "", "observations": [], "trace": ""}
         return
 
     client = Groq(api_key=api_key)
@@ -119,15 +228,36 @@ def agent_loop(max_iterations, system_prompt, query):
     full_trace = []
     observations = []
     final_answer = ""
-    
+
     for iteration in range(max_iterations):
-        result = agent(next_prompt)
+        result = ""
+        step_sent = 0
+        answer_start = None
+        for delta in agent.stream(next_prompt):
+            result += delta
+            if answer_start is None:
+                # Chưa thấy "Answer:" -> đang là Thought/Action; giữ lại phần cuối có thể là đầu marker
+                ans_match = ANSWER_PATTERN.search(result)
+                step_end = ans_match.start() if ans_match else len(result) - _partial_marker_len(result)
+                if step_end > step_sent:
+                    yield {"type": "step_token", "iteration": iteration + 1, "text": result[step_sent:step_end]}
+                    step_sent = step_end
+                if ans_match is None:
+                    continue
+                answer_start = ans_match.end()
+                delta = result[answer_start:]
+            # bỏ khoảng trắng đầu câu trả lời, kể cả khi nó đến ở chunk sau
+            if not result[answer_start:len(result) - len(delta)].strip():
+                delta = delta.lstrip()
+            if delta:
+                yield {"type": "answer_token", "text": delta}
+        if answer_start is None and len(result) > step_sent:
+            yield {"type": "step_token", "iteration": iteration + 1, "text": result[step_sent:]}
         full_trace.append(f"Iteration {iteration+1}:\n{result}")
 
         # Kiểm tra Answer
-        ans_match = re.search(r'(?:\*\*Answer\*\*|Answer)\s*:\s*(.*)', result, re.DOTALL | re.IGNORECASE)
-        if ans_match:
-            final_answer = ans_match.group(1).strip()
+        if answer_start is not None:
+            final_answer = result[answer_start:].strip()
             break
 
         # Lấy Observation
@@ -138,18 +268,41 @@ def agent_loop(max_iterations, system_prompt, query):
 
         # Tool Action
         if "PAUSE" in result and "Action" in result:
-            action_match = re.search(r"Action: ([a-z_]+): (.+)", result, re.IGNORECASE)
-            if action_match:
-                chosen_tool, args_str = action_match.groups()
-                observation = execute_tool_action(chosen_tool, args_str)
-                next_prompt = f"Observation: {observation}"
+            # Một lượt có thể chứa nhiều Action độc lập, chạy song song rồi gộp kết quả
+            actions = parse_actions(result)
+            if actions:
+                next_prompt = execute_tool_actions(actions)
+                yield {"type": "observation", "iteration": iteration + 1, "text": next_prompt}
                 continue
 
-    return final_answer, observations, "\n".join(full_trace)
-            
-def ask_agent(user_id: str, user_input: str, system_prompt: str = None, recent_limit: int = 4, conversation_id: int = None):
+    usage = agent.usage_summary()
+    logger.info(f"Agent used {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens "
+                f"over {len(usage['calls'])} calls")
+    yield {"type": "done", "final_answer": final_answer, "observations": observations,
+           "trace": "\n".join(full_trace), "usage": usage}
+
+
+def agent_loop(max_iterations, system_prompt, query):
     """
-    Lưu message -> build context (summary + recent) -> gọi agent_loop (1 iteration) -> lưu reply
+    Execute agent interaction loop for portfolio analysis.
+
+    Args:
+        max_iterations (int): Maximum number of interaction iterations
+        system_prompt (str): Initial system prompt for agent guidance
+        query (str): Initial user query
+
+    Returns:
+        tuple: (final_answer, observations, trace)
+    """
+    for event in agent_loop_stream(max_iterations, system_prompt, query):
+        if event["type"] == "done":
+            return event["final_answer"], event["observations"], event["trace"]
+
+
+def ask_agent_stream(user_id: str, user_input: str, system_prompt: str = None, recent_limit: int = 4, conversation_id: int = None):
+    """
+    Như ask_agent nhưng yield các event của agent_loop_stream khi model đang sinh;
+    event "done" cuối cùng có thêm conversation_id.
     """
     if conversation_id is None:
         conversation_id = memory.create_conversation(user_id, title=user_input[:50])
@@ -170,15 +323,28 @@ def ask_agent(user_id: str, user_input: str, system_prompt: str = None, recent_l
 
     full_context = "\n".join(context_parts)
 
-    # 3) call agent_loop for single iteration (agent_loop prints output; we capture if needed)
     # use provided system_prompt if given, otherwise load default
     sp = system_prompt if system_prompt is not None else load_system_prompt()
 
-    # Because your agent_loop expects (max_iterations, system_prompt, query), pass 1 iteration
-    final_answer, observations, trace = agent_loop(max_iterations=5, system_prompt=sp, query=full_context)
+    final_answer = ""
+    for event in agent_loop_stream(max_iterations=5, system_prompt=sp, query=full_context):
+        if event["type"] == "done":
+            final_answer = event["final_answer"]
+            event = {**event, "conversation_id": conversation_id}
+        yield event
 
     memory.add_message(user_id, "assistant", final_answer, conversation_id)
-    return final_answer, observations, trace, conversation_id
+
+
+def ask_agent(user_id: str, user_input: str, system_prompt: str = None, recent_limit: int = 4, conversation_id: int = None):
+    """
+    Lưu message -> build context (summary + recent) -> gọi agent_loop -> lưu reply
+    """
+    result = ("", [], "", conversation_id)
+    for event in ask_agent_stream(user_id, user_input, system_prompt, recent_limit, conversation_id):
+        if event["type"] == "done":
+            result = (event["final_answer"], event["observations"], event["trace"], event["conversation_id"])
+    return result
 
 def main():
     """
@@ -0,0 +1,97 @@
+# benchmark_backends.py
+"""
+Compare the SQLite and DuckDB backends of VNStockQueryTool on queries shaped
+like the ones the agent writes (point lookups, date-range scans, market-wide
+aggregations, screener filters and joins).
+
+Usage: python -m src.tools.benchmark_backends [db_path] [repeat]
+"""
+import statistics
+import sys
+import time
+
+from src.tools.query_guard import QueryGuard
+from src.tools.vnstockquery_tool import VNStockQueryTool
+
+QUERIES = {
+    "latest close": "SELECT ticker, close, time FROM vnstock_prices WHERE ticker = '{ticker}' ORDER BY time DESC LIMIT 1",
+    "ticker range max": "SELECT MAX(close), MIN(close) FROM vnstock_prices "
+                        "WHERE ticker = '{ticker}' AND time >= '{year}-01-01' AND time <= '{year}-12-31'",
+    "company join": "SELECT s.organ_short_name, MAX(p.close) FROM vnstock_prices p "
+                    "JOIN vnstock_symbols s ON s.symbol = p.ticker "
+                    "WHERE s.organ_short_name LIKE '%{name}%' AND p.time >= '{year}-01-01' "
+                    "GROUP BY s.organ_short_name ORDER BY s.organ_short_name",
+    "avg volume by ticker": "SELECT ticker, AVG(volume) AS avg_volume FROM vnstock_prices "
+                            "WHERE time >= '{year}-01-01' AND time <= '{year}-12-31' "
+                            "GROUP BY ticker ORDER BY avg_volume DESC, ticker LIMIT 10",
+    "market volume by day": "SELECT time, SUM(volume) FROM vnstock_prices GROUP BY time ORDER BY time DESC LIMIT 20",
+    "yearly range all tickers": "SELECT ticker, MAX(high) - MIN(low) AS spread FROM vnstock_prices "
+                                "WHERE time >= '{year}-01-01' GROUP BY ticker ORDER BY spread DESC, ticker LIMIT 10",
+    "screener filter": "SELECT ticker, pe, pb, roe FROM vnstock_screeners WHERE pe < 15 AND roe > 10 "
+                       "ORDER BY roe DESC, ticker LIMIT 20",
+    "screener by industry": "SELECT industry, COUNT(*), AVG(pe), AVG(roe) FROM vnstock_screeners "
+                            "GROUP BY industry ORDER BY industry",
+    "prices x screener": "SELECT sc.industry, AVG(p.close), SUM(p.volume) FROM vnstock_prices p "
+                         "JOIN vnstock_screeners sc ON sc.ticker = p.ticker WHERE p.time >= '{year}-01-01' "
+                         "GROUP BY sc.industry ORDER BY sc.industry",
+}
+
+
+def _sample(tool: VNStockQueryTool) -> dict:
+    with tool.pool.connection() as conn:
+        ticker, last_time = conn.execute(
+            "SELECT ticker, MAX(time) FROM vnstock_prices WHERE ticker = (SELECT MIN(ticker) FROM vnstock_prices)"
+        ).fetchone()
+        try:
+            name = conn.execute("SELECT organ_short_name FROM vnstock_symbols WHERE symbol = ?",
+                                (ticker,)).fetchone()
+        except Exception:
+            name = None
+    return {"ticker": ticker, "year": last_time[:4], "name": name[0] if name else ticker}
+
+
+def _time(tool: VNStockQueryTool, query: str, repeat: int) -> tuple:
+    timings = []
+    output = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = tool.query_vnstock_data(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), output
+
+
+def benchmark(db_path: str = 'vnstock_data.db', repeat: int = 5) -> None:
+    # guard rộng tay: đo tốc độ engine, không đo giới hạn thời gian
+    sqlite_tool = VNStockQueryTool(db_path, use_cache=False, guard=QueryGuard(timeout=120, scan_row_cap=10**9))
+    started = time.perf_counter()
+    duckdb_tool = VNStockQueryTool(db_path, use_cache=False, guard=QueryGuard(timeout=120), backend="duckdb",
+                                   fallback=False)
+    if duckdb_tool.backend != "duckdb":
+        print("duckdb is not installed: pip install duckdb")
+        return
+
+    # Bản DuckDB nạp nền từ lúc tạo tool; chờ xong để không đo nhầm SQLite
+    if not duckdb_tool.engine.wait_loaded():
+        print("DuckDB failed to load the database")
+        return
+    print(f"DuckDB load: {time.perf_counter() - started:.2f}s")
+    params = _sample(sqlite_tool)
+
+    print(f"{'query':<28}{'sqlite ms':>12}{'duckdb ms':>12}{'speedup':>10}  output")
+    for name, template in QUERIES.items():
+        query = template.format(**params)
+        sqlite_ms, sqlite_out = _time(sqlite_tool, query, repeat)
+        duckdb_ms, duckdb_out = _time(duckdb_tool, query, repeat)
+        if sqlite_out.startswith("Error:") and duckdb_out.startswith("Error:"):
+            print(f"{name:<28}{'skipped':>12}  {sqlite_out[:80]}")
+            continue
+        same = "same" if sqlite_out == duckdb_out else "DIFFERENT"
+        print(f"{name:<28}{sqlite_ms:>12.2f}{duckdb_ms:>12.2f}{sqlite_ms / duckdb_ms:>9.1f}x  {same}")
+        if same != "same":
+            print(f"  sqlite: {sqlite_out[:200]!r}\n  duckdb: {duckdb_out[:200]!r}")
+
+# Main execution
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'vnstock_data.db'
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    benchmark(db_path, repeat)
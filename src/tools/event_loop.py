@@ -0,0 +1,104 @@
+# event_loop.py
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEventLoop:
+    """
+    One asyncio event loop running forever in a daemon thread.
+
+    Synchronous code (the agent loop, Streamlit callbacks) submits coroutines
+    to it instead of creating a loop per call with `asyncio.run`. Objects bound
+    to a loop, such as the aiohttp session of SerperDevToolAsync, live as long
+    as the process, and calls from concurrent sessions overlap their I/O on
+    the same loop instead of serializing.
+    """
+
+    def __init__(self, name: str = "tool-event-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._loop, ready),
+                                                name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._ensure_started()
+
+    def submit_async(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Schedule `coro` on the background loop and return a thread-safe future."""
+        loop = self._ensure_started()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("submit() called from the background loop itself; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def submit(self, coro: Awaitable, timeout: Optional[float] = 30.0) -> Any:
+        """
+        Run `coro` on the background loop and wait for its result.
+
+        Args:
+            coro (Awaitable): Coroutine to run.
+            timeout (float): Seconds to wait; None waits forever.
+
+        Returns:
+            Any: The coroutine's result. Its exception is re-raised here.
+
+        Raises:
+            TimeoutError: The coroutine did not finish in time; it is cancelled.
+        """
+        future = self.submit_async(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            # Hủy coroutine trên loop để không chạy ngầm sau khi đã trả lỗi
+            future.cancel()
+            raise TimeoutError(f"Tool call did not finish within {timeout} seconds")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the loop, wait for its thread and close it."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout)
+        if not loop.is_running():
+            loop.close()
+        else:
+            logger.warning("Background event loop did not stop in time")
+
+
+_background_loop: Optional[BackgroundEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """Return the process-wide background event loop."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundEventLoop()
+        return _background_loop
@@ -0,0 +1,161 @@
+# pricematrix_tool.py
+import json
+import logging
+import time
+
+import numpy as np
+
+from data.price_matrix import PriceMatrixNotReady, get_price_matrix
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ("returns", "rolling_max", "rolling_min", "streak", "correlation")
+
+
+class PriceMatrixTool:
+    """
+    Agent tool answering cross-sectional price questions (top returns, N-day
+    highs/lows, up/down streaks, correlations) from the in-memory price matrix
+    instead of window-function SQL over `vnstock_prices`.
+    """
+
+    def __init__(self, db_path: str = 'vnstock_data.db', matrix_dir: str = 'price_matrix',
+                 default_top: int = 20, max_top: int = 200, preload: bool = True):
+        """
+        Args:
+            db_path (str): Database file, relative to the `data` folder.
+            matrix_dir (str): Memmap folder, relative to the `data` folder; rebuilt in the background when stale.
+            default_top (int): Rows returned when the request gives no `top`.
+            max_top (int): Upper bound on `top` and on listed tickers.
+            preload (bool): Load the matrix (starting a build if it is stale) at construction.
+        """
+        self.db_path = db_path
+        self.matrix_dir = matrix_dir
+        self.default_top = default_top
+        self.max_top = max_top
+        if preload:
+            try:
+                get_price_matrix(db_path, matrix_dir)
+            except (FileNotFoundError, PriceMatrixNotReady) as e:
+                logger.info(f"Price matrix not loaded at startup: {e}")
+
+    def query_price_matrix(self, args) -> str:
+        """
+        Run one operation described by a JSON object, e.g.
+        {"op": "returns", "days": 20, "top": 10}.
+
+        Returns:
+            str: One line per ticker (`col: val, ...`) or an `Error: ...` message.
+        """
+        started = time.perf_counter()
+        try:
+            params = json.loads(args) if isinstance(args, str) else dict(args)
+            if not isinstance(params, dict):
+                raise ValueError("arguments must be a JSON object")
+            op = params.get("op")
+            if op not in OPERATIONS:
+                return f"Error: Unknown op {op!r}. Must be one of: {', '.join(OPERATIONS)}"
+            matrix = get_price_matrix(self.db_path, self.matrix_dir)
+            output = getattr(self, f"_{op}")(matrix, params)
+        except FileNotFoundError as e:
+            logger.error(f"Price matrix unavailable: {e}")
+            return "Error: No database connection. Please check the database file."
+        except PriceMatrixNotReady as e:
+            logger.warning(f"Price matrix unavailable: {e}")
+            return "Error: The price matrix is still being built. Use query_vnstock_data for this question."
+        except (ValueError, TypeError, KeyError) as e:
+            return f"Error: Invalid price matrix request - {e}"
+        except Exception as e:
+            logger.error(f"Error in query_price_matrix: {e}")
+            return f"Error: Unable to run price matrix request - {e}"
+        logger.info(f"Price matrix {op} answered in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return output
+
+    def _top(self, params: dict) -> int:
+        return max(1, min(int(params.get("top", self.default_top)), self.max_top))
+
+    def _rows(self, matrix, params: dict):
+        tickers = params.get("tickers")
+        if tickers is not None:
+            if isinstance(tickers, str):
+                tickers = [tickers]
+            tickers = [t.upper() for t in tickers][:self.max_top]
+        return matrix.rows(tickers), tickers is not None
+
+    def _format(self, matrix, rows, columns: dict, order, end_index: int) -> str:
+        date = matrix.dates[end_index]
+        lines = []
+        for i in order:
+            values = ", ".join(f"{name}: {_fmt(col[i])}" for name, col in columns.items())
+            lines.append(f"ticker: {matrix.tickers[rows[i]]}, {values}")
+        if not lines:
+            return "No data found for the given query."
+        return "\n".join([f"as_of: {date}"] + lines)
+
+    def _ranked(self, matrix, params, rows, explicit, key, default_ascending=False):
+        # có danh sách mã cụ thể -> giữ thứ tự; không thì xếp hạng toàn thị trường
+        if explicit and "top" not in params:
+            return np.arange(len(rows))
+        return matrix.rank(key, self._top(params), bool(params.get("ascending", default_ascending)))
+
+    def _returns(self, matrix, params):
+        days = int(params.get("days", 20))
+        rows, explicit = self._rows(matrix, params)
+        values = matrix.returns(days, params.get("end"), rows)
+        order = self._ranked(matrix, params, rows, explicit, values)
+        return self._format(matrix, rows, {f"return_{days}d": values}, order, matrix.day_index(params.get("end")))
+
+    def _rolling(self, matrix, params, which):
+        window = int(params.get("window", 20))
+        field = params.get("field", "close")
+        end = params.get("end")
+        rows, explicit = self._rows(matrix, params)
+        extreme = (matrix.rolling_max if which == "max" else matrix.rolling_min)(field, window, end, rows)
+        current = matrix.field(field)[rows, matrix.day_index(end)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = current / extreme - 1
+        # mặc định: mã gần đỉnh / đáy nhất lên đầu
+        key = -np.abs(distance)
+        order = self._ranked(matrix, params, rows, explicit, key if "ascending" not in params else distance)
+        return self._format(matrix, rows, {f"{field}": current, f"{which}_{window}d": extreme,
+                                           f"pct_from_{which}": distance}, order, matrix.day_index(end))
+
+    def _rolling_max(self, matrix, params):
+        return self._rolling(matrix, params, "max")
+
+    def _rolling_min(self, matrix, params):
+        return self._rolling(matrix, params, "min")
+
+    def _streak(self, matrix, params):
+        direction = params.get("direction", "up")
+        min_days = int(params.get("min_days", 1))
+        rows, explicit = self._rows(matrix, params)
+        lengths = matrix.streaks(direction, params.get("end"), int(params.get("lookback", 60)), rows)
+        key = np.where(lengths >= min_days, lengths, np.nan).astype(np.float64)
+        order = self._ranked(matrix, params, rows, explicit, key)
+        if explicit and "top" not in params:
+            order = order[~np.isnan(key[order])]
+        return self._format(matrix, rows, {f"{direction}_streak_days": lengths}, order,
+                            matrix.day_index(params.get("end")))
+
+    def _correlation(self, matrix, params):
+        tickers = params.get("tickers")
+        if not tickers or len(tickers) < 2:
+            raise ValueError("correlation needs at least two tickers")
+        rows, _ = self._rows(matrix, params)
+        days = int(params.get("days", 60))
+        corr = matrix.correlation(rows, days, params.get("end"))
+        names = [matrix.tickers[r] for r in rows]
+        lines = [f"as_of: {matrix.dates[matrix.day_index(params.get('end'))]}, days: {days}"]
+        for i, name in enumerate(names):
+            lines.append(f"ticker: {name}, " + ", ".join(f"{other}: {_fmt(corr[i, j])}" for j, other in enumerate(names)))
+        return "\n".join(lines)
+
+
+def _fmt(value) -> str:
+    value = float(value)
+    if np.isnan(value):
+        return "None"
+    if value.is_integer():
+        return str(int(value))
+    return f"{value:.4f}"
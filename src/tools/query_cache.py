@@ -0,0 +1,151 @@
+# query_cache.py
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^\s'\"]+")
+_WORD_RE = re.compile(r"[A-Za-z_]+")
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+SQL_KEYWORDS = {
+    "select", "distinct", "from", "where", "and", "or", "not", "in", "is", "null",
+    "like", "glob", "between", "exists", "join", "inner", "left", "right", "full",
+    "outer", "cross", "natural", "on", "using", "as", "group", "by", "having",
+    "order", "asc", "desc", "limit", "offset", "union", "all", "intersect",
+    "except", "with", "recursive", "case", "when", "then", "else", "end", "cast",
+    "collate", "escape", "over", "partition", "rows", "range", "preceding",
+    "following", "unbounded", "current", "row", "filter", "window", "nulls",
+    "first", "last",
+}
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Canonical form of a SQL statement for use as a cache key.
+
+    Collapses whitespace, upper-cases keywords and drops a trailing semicolon
+    outside string literals. Double-quoted plain identifiers ("ticker") are
+    unquoted; string literals are kept byte for byte.
+    """
+    parts = []
+    for token in _TOKEN_RE.findall(query.strip().rstrip(";").strip()):
+        if token.isspace():
+            parts.append(" ")
+        elif token.startswith("'"):
+            parts.append(token)
+        elif token.startswith('"'):
+            inner = token[1:-1]
+            if _IDENTIFIER_RE.fullmatch(inner) and inner.lower() not in SQL_KEYWORDS:
+                parts.append(inner)
+            else:
+                parts.append(token)
+        else:
+            parts.append(_WORD_RE.sub(
+                lambda m: m.group(0).upper() if m.group(0).lower() in SQL_KEYWORDS else m.group(0),
+                token,
+            ))
+    return "".join(parts)
+
+
+class QueryResultCache:
+    """
+    Bounded LRU cache with TTL for formatted query results.
+
+    Every entry is tied to the data generation it was computed on; `get`
+    drops an entry whose generation differs from the one passed in (its
+    database was re-imported). Generations are kept per entry, so results of
+    several databases can share the cache as long as their keys differ.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024, ttl: float = 600.0):
+        """
+        Args:
+            max_entries (int): Maximum number of cached results.
+            max_bytes (int): Maximum total size of cached keys and results.
+            ttl (float): Seconds an entry stays valid.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _size(key: Hashable, value: str) -> int:
+        return len(repr(key).encode("utf-8")) + len(value.encode("utf-8"))
+
+    def _pop(self, key: Hashable) -> None:
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, generation=None) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at, _, entry_generation = entry
+            if entry_generation != generation:
+                logger.debug("Database generation changed, dropping cached query result")
+                self._pop(key)
+                self._stats["invalidations"] += 1
+                self._stats["misses"] += 1
+                return None
+            if time.monotonic() >= expires_at:
+                self._pop(key)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value: str, generation=None) -> None:
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size, generation)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for sizing the cache: hits, misses, hit_rate, entries, bytes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_query_cache: Optional[QueryResultCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache(**kwargs) -> QueryResultCache:
+    """Return the process-wide result cache. Keyword arguments apply on first call only."""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryResultCache(**kwargs)
+        return _query_cache
@@ -0,0 +1,261 @@
+# query_guard.py
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_TABLE_REF_RE = re.compile(r"(?:\bFROM|\bJOIN|,)\s*([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+_AGGREGATE_RE = re.compile(r"\b(?:COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT)\s*\(|\bGROUP\s+BY\b", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\bLIMIT\s+\d+", re.IGNORECASE)
+
+# Authorizer actions a read-only SELECT needs; everything else is denied
+_ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, "SQLITE_RECURSIVE", 33),
+}
+
+
+class QueryRejected(Exception):
+    """Raised when the guard refuses to run a query."""
+
+    def __init__(self, status: str, reason: str, hint: str = ""):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.hint = hint
+
+    def to_observation(self) -> str:
+        """Structured observation the agent can read and act on."""
+        payload = {"status": self.status, "reason": self.reason}
+        if self.hint:
+            payload["hint"] = self.hint
+        return f"Error: {json.dumps(payload, ensure_ascii=False)}"
+
+
+@dataclass
+class GuardDecision:
+    query: str
+    rewritten: bool = False
+    row_cap: Optional[int] = None
+    notes: List[str] = field(default_factory=list)
+
+
+class QueryGuard:
+    """
+    Checks LLM-written SQL before it reaches the shared connections.
+
+    - Only a single SELECT (or WITH ... SELECT) statement is accepted.
+    - `EXPLAIN QUERY PLAN` is inspected: joins that full-scan two large tables
+      (cartesian or self-joins) are rejected, a lone unbounded full scan is
+      rewritten with a row cap.
+    - Execution runs under a wall-clock budget enforced by SQLite's progress
+      handler and an authorizer that only permits reads.
+    """
+
+    def __init__(self, timeout: float = 5.0, large_table_rows: int = 50000,
+                 scan_row_cap: int = 10000, progress_steps: int = 10000):
+        """
+        Args:
+            timeout (float): Wall-clock budget per query in seconds.
+            large_table_rows (int): Tables with at least this many rows count as large.
+            scan_row_cap (int): LIMIT added to unbounded full scans of large tables.
+            progress_steps (int): SQLite VM instructions between deadline checks.
+        """
+        self.timeout = timeout
+        self.large_table_rows = large_table_rows
+        self.scan_row_cap = scan_row_cap
+        self.progress_steps = progress_steps
+
+        self._lock = threading.Lock()
+        self._row_counts: Dict[str, int] = {}
+        self._row_counts_generation = object()
+        self._stats = {"checked": 0, "rejected": 0, "rewritten": 0, "aborted": 0}
+
+    def check_statement(self, query: str) -> str:
+        """
+        Reject anything that is not a single read-only SELECT.
+
+        Returns:
+            str: The query without comments and trailing semicolon.
+        """
+        stripped = _COMMENT_RE.sub(" ", query).strip().rstrip(";").strip()
+        without_strings = _STRING_RE.sub("''", stripped)
+        if ";" in without_strings:
+            raise QueryRejected("rejected", "Only one SQL statement is allowed per call.",
+                                "Send a single SELECT statement.")
+        first_word = without_strings.split(None, 1)[0].upper() if without_strings else ""
+        if first_word not in ("SELECT", "WITH"):
+            raise QueryRejected("rejected", f"Only SELECT queries are allowed, got '{first_word or 'empty'}'.",
+                                "The database is read-only; rewrite the request as a SELECT.")
+        return stripped
+
+    def _table_row_counts(self, conn: sqlite3.Connection, generation) -> Dict[str, int]:
+        with self._lock:
+            if generation == self._row_counts_generation:
+                return self._row_counts
+
+        counts: Dict[str, int] = {}
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        has_stat = "sqlite_stat1" in tables
+        for table in tables:
+            if table.startswith("sqlite_"):
+                continue
+            rows = None
+            if has_stat:
+                stat_rows = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ?", (table,)).fetchall()
+                if stat_rows:
+                    rows = max(int(r[0].split()[0]) for r in stat_rows)
+            if rows is None:
+                try:
+                    rows = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+                except sqlite3.OperationalError:
+                    rows = 0
+            counts[table.lower()] = rows
+
+        with self._lock:
+            self._row_counts = counts
+            self._row_counts_generation = generation
+        return counts
+
+    def _is_large(self, name: str, aliases: Dict[str, str], counts: Dict[str, int]) -> Optional[str]:
+        table = aliases.get(name.lower(), name.lower())
+        if counts.get(table, 0) >= self.large_table_rows:
+            return table
+        return None
+
+    def check_plan(self, conn: sqlite3.Connection, query: str, generation=None) -> GuardDecision:
+        """
+        Inspect `EXPLAIN QUERY PLAN` and reject or rewrite expensive plans.
+
+        Raises:
+            QueryRejected: If the plan full-scans large tables inside a join
+                or correlated subquery.
+        """
+        counts = self._table_row_counts(conn, generation)
+        aliases = {}
+        for table, alias in _TABLE_REF_RE.findall(_STRING_RE.sub("''", query)):
+            if table.lower() in counts and alias:
+                aliases[alias.lower()] = table.lower()
+
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+        nodes = {row[0]: (row[1], row[3]) for row in plan}
+
+        def inside_correlated(node_id: int) -> bool:
+            parent = nodes[node_id][0]
+            while parent in nodes:
+                if nodes[parent][1].upper().startswith("CORRELATED"):
+                    return True
+                parent = nodes[parent][0]
+            return False
+
+        large_scans = []
+        for node_id, parent, _, detail in plan:
+            parts = detail.split()
+            if len(parts) >= 2 and parts[0] == "SCAN":
+                table = self._is_large(parts[1], aliases, counts)
+                if table:
+                    large_scans.append((node_id, parent, table))
+
+        by_parent: Dict[int, List[str]] = {}
+        for _, parent, table in large_scans:
+            by_parent.setdefault(parent, []).append(table)
+        for tables in by_parent.values():
+            if len(tables) >= 2:
+                raise QueryRejected(
+                    "rejected",
+                    f"Query plan joins full scans of large tables ({', '.join(tables)}), "
+                    "which is a cartesian-size join.",
+                    "Join on indexed keys (ticker, time) and filter by ticker and a date range first.",
+                )
+        correlated = [table for node_id, _, table in large_scans if inside_correlated(node_id)]
+        if correlated and len(large_scans) > len(correlated):
+            raise QueryRejected(
+                "rejected",
+                f"Correlated subquery full-scans large table {correlated[0]} once per outer row.",
+                "Replace the correlated subquery with a JOIN or GROUP BY, or filter by ticker and date.",
+            )
+
+        decision = GuardDecision(query=query)
+        if large_scans and not _LIMIT_RE.search(query) and not _AGGREGATE_RE.search(query):
+            decision.query = f"SELECT * FROM ({query}) LIMIT {self.scan_row_cap}"
+            decision.rewritten = True
+            decision.row_cap = self.scan_row_cap
+            decision.notes.append(
+                f"[note: full scan of {large_scans[0][2]} capped at {self.scan_row_cap} rows]"
+            )
+        return decision
+
+    def prepare(self, conn: sqlite3.Connection, query: str, generation=None) -> GuardDecision:
+        """Run statement and plan checks, updating the guard counters."""
+        with self._lock:
+            self._stats["checked"] += 1
+        try:
+            decision = self.check_plan(conn, self.check_statement(query), generation)
+        except QueryRejected:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+        except sqlite3.DatabaseError as e:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise QueryRejected("rejected", f"Invalid SQL: {e}", "Check table and column names against the schema.")
+        if decision.rewritten:
+            with self._lock:
+                self._stats["rewritten"] += 1
+            logger.info(f"Rewrote unbounded full scan: {decision.query}")
+        return decision
+
+    @staticmethod
+    def _authorizer(action, arg1, arg2, db_name, trigger):
+        if action in _ALLOWED_ACTIONS:
+            return sqlite3.SQLITE_OK
+        return sqlite3.SQLITE_DENY
+
+    @contextmanager
+    def limits(self, conn: sqlite3.Connection):
+        """
+        Apply the read-only authorizer and wall-clock budget to `conn` for the
+        duration of the block, translating an interrupt into QueryRejected.
+        """
+        deadline = time.monotonic() + self.timeout
+        conn.set_authorizer(self._authorizer)
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, self.progress_steps)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                raise self.timed_out()
+            if "not authorized" in str(e):
+                with self._lock:
+                    self._stats["rejected"] += 1
+                raise QueryRejected("rejected", "Query tried a non-read operation.",
+                                    "Only plain SELECT queries on the vnstock tables are allowed.")
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+            conn.set_authorizer(None)
+
+    def timed_out(self) -> QueryRejected:
+        """Count a query stopped at the time budget and build its rejection."""
+        with self._lock:
+            self._stats["aborted"] += 1
+        return QueryRejected(
+            "aborted",
+            f"Query exceeded the {self.timeout:g}s time budget and was stopped.",
+            "Use a cheaper query: filter by ticker and date range, aggregate, or add LIMIT.",
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,183 @@
+# search_cache.py
+import atexit
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# TTL theo loại tìm kiếm: tin tức cũ đi rất nhanh, khái niệm thì gần như không đổi
+DEFAULT_TTLS = {
+    "news": 60 * 60,
+    "search": 7 * 24 * 60 * 60,
+}
+
+
+class CachedSearch(NamedTuple):
+    value: dict
+    fresh: bool
+    age: float
+
+
+def normalize_query(query: str) -> str:
+    """Unicode-normalized, lower-cased query with collapsed whitespace and no trailing punctuation."""
+    query = unicodedata.normalize("NFC", query).lower()
+    query = re.sub(r"\s+", " ", query).strip()
+    return query.strip(" ?!.,;:\"'")
+
+
+class SearchResultCache:
+    """
+    Disk-backed (SQLite) cache for Serper search results.
+
+    Entries are keyed on the normalized query plus search type, number of
+    results, country, location and locale. Each search type has its own TTL.
+    Expired entries are kept up to `stale_max_age` so they can still be served
+    when the API fails. Credits saved by cache hits are counted persistently:
+    counters accumulate in memory and are written with the next `put`, by
+    `stats`, or at least every `stats_flush_interval` seconds.
+
+    Every method does blocking SQLite I/O except `record_hit`; call them
+    from a worker thread (`asyncio.to_thread`) when on an event loop.
+    """
+
+    def __init__(self, db_path: str, ttls: Dict[str, float] = None, stale_max_age: float = 30 * 24 * 60 * 60,
+                 stats_flush_interval: float = 60.0):
+        """
+        Args:
+            db_path (str): SQLite file for the cache.
+            ttls (dict): Seconds an entry is fresh, per search type.
+            stale_max_age (float): Seconds after which an entry is deleted outright.
+            stats_flush_interval (float): Maximum seconds counters stay in memory only.
+        """
+        self.db_path = db_path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stale_max_age = stale_max_age
+        self.stats_flush_interval = stats_flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._last_flush = time.monotonic()
+        self._init_db()
+        atexit.register(self.flush_stats)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                cache_key TEXT PRIMARY KEY,
+                search_type TEXT,
+                query TEXT,
+                result TEXT,
+                credits INTEGER DEFAULT 1,
+                created_at REAL
+            )
+        """)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER DEFAULT 0
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def make_key(search_query: str, search_type: str = "search", n_results: int = 10,
+                 country: str = "", locale: str = "", location: str = "") -> str:
+        parts = [normalize_query(search_query), search_type, int(n_results), country or "", locale or "",
+                 location or ""]
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str, search_type: str) -> Optional[CachedSearch]:
+        """Return the cached result (fresh or stale), or None if there is nothing usable."""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("SELECT result, created_at FROM search_cache WHERE cache_key=?", (cache_key,))
+        row = c.fetchone()
+        conn.close()
+        if row is None:
+            self._incr("misses")
+            return None
+        age = time.time() - row["created_at"]
+        if age > self.stale_max_age:
+            self._incr("misses")
+            return None
+        fresh = age <= self.ttls.get(search_type, DEFAULT_TTLS["search"])
+        if not fresh:
+            self._incr("misses")
+        if time.monotonic() - self._last_flush >= self.stats_flush_interval:
+            self.flush_stats()
+        return CachedSearch(json.loads(row["result"]), fresh, age)
+
+    def put(self, cache_key: str, search_type: str, query: str, result: dict) -> None:
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO search_cache (cache_key, search_type, query, result, credits, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                result = excluded.result, credits = excluded.credits, created_at = excluded.created_at
+        """, (cache_key, search_type, query, json.dumps(result, ensure_ascii=False),
+              int(result.get("credits", 1)), time.time()))
+        # dọn các entry quá cũ, kể cả để phục vụ khi API lỗi
+        c.execute("DELETE FROM search_cache WHERE created_at < ?", (time.time() - self.stale_max_age,))
+        # ghi luôn các bộ đếm đang chờ trong cùng transaction
+        self._write_stats(conn)
+        conn.commit()
+        conn.close()
+
+    def record_hit(self, credits: int, stale: bool = False) -> None:
+        """Count a served cache entry and the API credits it saved (in memory, no I/O)."""
+        self._incr("stale_served" if stale else "hits")
+        self._incr("saved_credits", int(credits or 0))
+
+    def _incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+
+    def _write_stats(self, conn: sqlite3.Connection) -> None:
+        """Add the pending counters to search_cache_stats on `conn`; the caller commits."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if pending:
+            conn.executemany("""
+                INSERT INTO search_cache_stats (name, value) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+            """, pending.items())
+
+    def flush_stats(self) -> None:
+        """Write the counters accumulated in memory to disk."""
+        if not self._pending:
+            return
+        conn = self._connect()
+        self._write_stats(conn)
+        conn.commit()
+        conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        """hits, stale_served, misses, saved_credits, entries and hit_rate."""
+        self.flush_stats()
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("SELECT name, value FROM search_cache_stats")
+        stats = {"hits": 0, "stale_served": 0, "misses": 0, "saved_credits": 0}
+        stats.update({r["name"]: r["value"] for r in c.fetchall()})
+        c.execute("SELECT COUNT(1) AS cnt FROM search_cache")
+        stats["entries"] = c.fetchone()["cnt"]
+        conn.close()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -3,12 +3,15 @@ import datetime
 import json
 import logging
 import os
+import time
 from typing import Any, Optional
 
 import aiohttp
 import asyncio
 from pydantic import BaseModel, Field
 
+from src.tools.search_cache import SearchResultCache
+
 logging.basicConfig(
     level=logging.DEBUG,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -43,9 +46,123 @@ class SerperDevToolConfig(BaseModel):
 
 
 class SerperDevToolAsync:
-    def __init__(self, api_key: str, base_url: str = "https://google.serper.dev"):
+    def __init__(self, api_key: str, base_url: str = "https://google.serper.dev",
+                 connector_limit: int = 10, keepalive_timeout: float = 60.0, request_timeout: float = 10.0,
+                 cache: Optional[SearchResultCache] = None):
+        """
+        Args:
+            api_key (str): Serper API key.
+            base_url (str): API root, overridable for a local stub server.
+            connector_limit (int): Maximum simultaneous connections in the pool.
+            keepalive_timeout (float): Seconds an idle keep-alive connection is kept.
+            request_timeout (float): Total timeout per request in seconds.
+            cache (SearchResultCache): Optional disk cache consulted before calling the API.
+        """
         self.api_key = api_key
         self.base_url = base_url
+        self.connector_limit = connector_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.cache = cache
+
+        # Session tạo lazy, dùng lại giữa các lần gọi (keep-alive, không bắt tay TLS lại)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._metrics = {
+            "requests": 0,
+            "errors": 0,
+            "new_connections": 0,
+            "reused_connections": 0,
+            "connect_ms_total": 0.0,
+            "response_ms_total": 0.0,
+        }
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """Collect connect time (TCP+TLS) separately from request/response time."""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.start = time.perf_counter()
+            ctx.connect_ms = 0.0
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_start = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx, params):
+            ctx.connect_ms = (time.perf_counter() - ctx.connect_start) * 1000
+            self._metrics["new_connections"] += 1
+            self._metrics["connect_ms_total"] += ctx.connect_ms
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self._metrics["reused_connections"] += 1
+
+        async def on_request_end(session, ctx, params):
+            total_ms = (time.perf_counter() - ctx.start) * 1000
+            self._metrics["requests"] += 1
+            self._metrics["response_ms_total"] += total_ms - ctx.connect_ms
+
+        async def on_request_exception(session, ctx, params):
+            self._metrics["errors"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._session_loop is loop:
+            return self._session
+        if self._session is not None and not self._session.closed:
+            # Session gắn với event loop cũ, không thể dùng trên loop hiện tại
+            logger.warning("Serper session belongs to another event loop, creating a new one")
+            await self._close_stale_session(self._session, self._session_loop)
+        connector = aiohttp.TCPConnector(limit=self.connector_limit, keepalive_timeout=self.keepalive_timeout)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            trace_configs=[self._trace_config()],
+        )
+        self._session_loop = loop
+        return self._session
+
+    @staticmethod
+    async def _close_stale_session(session: aiohttp.ClientSession, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """
+        Close a session created on another event loop. Its connections belong
+        to that loop, so while it still runs (another thread) the close is
+        scheduled there; once it has stopped, the session is closed here.
+        """
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        try:
+            await session.close()
+        except Exception as e:
+            logger.warning(f"Error closing Serper session of a stopped event loop: {e}")
+
+    async def close(self) -> None:
+        """Close the shared session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def metrics(self) -> dict:
+        """Request counts and average connect / response latency in milliseconds."""
+        m = dict(self._metrics)
+        m["avg_connect_ms"] = m["connect_ms_total"] / m["new_connections"] if m["new_connections"] else 0.0
+        m["avg_response_ms"] = m["response_ms_total"] / m["requests"] if m["requests"] else 0.0
+        return m
 
     def _get_search_url(self, search_type: str) -> str:
         allowed_search_types = ["search", "news"]
@@ -137,21 +254,21 @@ class SerperDevToolAsync:
 
         headers = {"X-API-KEY": self.api_key, "content-type": "application/json"}
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(search_url, headers=headers, json=payload, timeout=10) as resp:
-                    if resp.status != 200:
-                        raise ValueError(f"Serper API request failed with status {resp.status}")
-                    results = await resp.json()
-                    if not results:
-                        raise ValueError("Empty response from Serper API")
-                    return results
-            except asyncio.TimeoutError:
-                logger.error("Serper API request timed out")
-                raise
-            except aiohttp.ClientError as e:
-                logger.error(f"HTTP error calling Serper API: {e}")
-                raise
+        session = await self._get_session()
+        try:
+            async with session.post(search_url, headers=headers, json=payload) as resp:
+                if resp.status != 200:
+                    raise ValueError(f"Serper API request failed with status {resp.status}")
+                results = await resp.json()
+                if not results:
+                    raise ValueError("Empty response from Serper API")
+                return results
+        except asyncio.TimeoutError:
+            logger.error("Serper API request timed out")
+            raise
+        except aiohttp.ClientError as e:
+            logger.error(f"HTTP error calling Serper API: {e}")
+            raise
 
     def _process_search_results(self, results: dict, cfg: SerperDevToolConfig) -> dict:
         formatted_results = {}
@@ -174,7 +291,27 @@ class SerperDevToolAsync:
     async def run(self, **kwargs: Any) -> dict:
         """Main function to execute search asynchronously."""
         cfg = SerperDevToolConfig(**kwargs)
-        results = await self._make_api_request(cfg)
+
+        cached = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(cfg.search_query, cfg.search_type, cfg.n_results, cfg.country,
+                                            cfg.locale, cfg.location)
+            # Cache nằm trên SQLite: đọc/ghi đĩa trên thread riêng, không chặn event loop
+            cached = await asyncio.to_thread(self.cache.get, cache_key, cfg.search_type)
+            if cached is not None and cached.fresh:
+                logger.info(f"Serper cache hit for '{cfg.search_query}' ({cfg.search_type})")
+                self.cache.record_hit(cached.value.get("credits", 1))
+                return cached.value
+
+        try:
+            results = await self._make_api_request(cfg)
+        except Exception as e:
+            if cached is None:
+                raise
+            # API lỗi: trả kết quả cũ còn hơn không có gì
+            logger.warning(f"Serper API failed ({e}), serving cached result {cached.age / 3600:.1f}h old")
+            self.cache.record_hit(cached.value.get("credits", 1), stale=True)
+            return cached.value
 
         formatted_results = {
             "searchParameters": {"q": cfg.search_query, "type": cfg.search_type, **results.get("searchParameters", {})}
@@ -182,6 +319,9 @@ class SerperDevToolAsync:
         formatted_results.update(self._process_search_results(results, cfg))
         formatted_results["credits"] = results.get("credits", 1)
 
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, cache_key, cfg.search_type, cfg.search_query, formatted_results)
+
         if cfg.save_file:
             _save_results_to_file(json.dumps(formatted_results, indent=2, ensure_ascii=False))
 
@@ -191,14 +331,15 @@ class SerperDevToolAsync:
 # Example usage
 async def main():
     api_key = os.environ.get("SERPER_API_KEY", "YOUR_API_KEY_HERE")
-    tool = SerperDevToolAsync(api_key)
 
-    # Run multiple queries in parallel
-    tasks = [
-        tool.run(search_query="AI news", search_type="news", n_results=5, save_file=True),
-        tool.run(search_query="Machine learning trends", search_type="search", n_results=5),
-    ]
-    results = await asyncio.gather(*tasks)
+    async with SerperDevToolAsync(api_key) as tool:
+        # Run multiple queries in parallel over the same connection pool
+        tasks = [
+            tool.run(search_query="AI news", search_type="news", n_results=5, save_file=True),
+            tool.run(search_query="Machine learning trends", search_type="search", n_results=5),
+        ]
+        results = await asyncio.gather(*tasks)
+        print(f"Latency metrics: {tool.metrics()}")
 
     for idx, res in enumerate(results):
         print(f"\n--- Result {idx+1} ---")
@@ -1,6 +1,13 @@
 # vnstockquery_tool.py
+import csv
+import io
+import json
 import logging
-from data.stock import VNStockData
+import re
+import threading
+from data.stock import get_connection_pool
+from src.tools.query_cache import QueryResultCache, get_query_cache, normalize_sql
+from src.tools.query_guard import QueryGuard, QueryRejected
 
 # Configure logging
 logging.basicConfig(
@@ -14,30 +21,295 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+OUTPUT_FORMATS = ("rows", "csv")
+BACKENDS = ("sqlite", "duckdb")
+_PLAIN_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# SQLite column names of DuckDB queries, keyed by normalized SQL (shared by every tool in the process)
+_header_cache = QueryResultCache(max_entries=1024, max_bytes=1024 * 1024, ttl=3600.0)
+
+
 class VNStockQueryTool:
-    def __init__(self):
-        self.db = VNStockData()
+    def __init__(self, db_path: str = 'vnstock_data.db', use_cache: bool = True,
+                 max_rows: int = 200, max_output_bytes: int = 16000,
+                 output_format: str = "rows", fetch_size: int = 100, count_limit: int = 100000,
+                 guard: QueryGuard = None, backend: str = "sqlite", parquet_root: str = None,
+                 fallback: bool = True):
+        """
+        Args:
+            db_path (str): Database file, relative to the `data` folder.
+            use_cache (bool): Serve repeated queries from the shared result cache.
+            max_rows (int): Maximum rows included in the output.
+            max_output_bytes (int): Maximum size of the output string (UTF-8 bytes).
+            output_format (str): "rows" (`col: val, ...` per row) or "csv" (header once, compact).
+            fetch_size (int): Rows pulled from SQLite per `fetchmany` call.
+            count_limit (int): Maximum rows counted past the limit to estimate the total.
+            guard (QueryGuard): Read-only, cost and timeout checks; a default guard if None.
+            backend (str): "sqlite" (row store, pooled connections) or "duckdb" (columnar copy
+                of the same data, vectorized and multi-threaded for scans and aggregations).
+            parquet_root (str): With duckdb, read `vnstock_prices` from this Parquet dataset
+                (relative to the `data` folder) instead of copying it from SQLite.
+            fallback (bool): With duckdb, run queries DuckDB cannot parse or bind on SQLite.
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Invalid output format: {output_format}. Must be one of: {', '.join(OUTPUT_FORMATS)}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Invalid backend: {backend}. Must be one of: {', '.join(BACKENDS)}")
+        # Shared across every tool instance and Streamlit session in the process
+        self.pool = get_connection_pool(db_path)
+        self.cache = get_query_cache() if use_cache else None
+        self.max_rows = max_rows
+        self.max_output_bytes = max_output_bytes
+        self.output_format = output_format
+        self.fetch_size = fetch_size
+        self.count_limit = count_limit
+        self.guard = guard or QueryGuard()
+        self.fallback = fallback
+        self.parquet_root = parquet_root
+        self.engine = None
+        if backend == "duckdb":
+            try:
+                from data.duckdb_engine import get_duckdb_engine
+                self.engine = get_duckdb_engine(db_path, parquet_root)
+            except ImportError as e:
+                logger.warning(f"DuckDB backend unavailable ({e}); using SQLite")
+        self.backend = "duckdb" if self.engine is not None else "sqlite"
+
+    def pool_stats(self) -> dict:
+        return self.pool.stats()
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache else {}
+
+    def guard_stats(self) -> dict:
+        return self.guard.stats()
+
+    def query_vnstock_data(self, query: str, output_format: str = None,
+                           max_rows: int = None, max_output_bytes: int = None) -> str:
+        output_format = output_format or self.output_format
+        max_rows = self.max_rows if max_rows is None else max_rows
+        max_output_bytes = self.max_output_bytes if max_output_bytes is None else max_output_bytes
+        if output_format not in OUTPUT_FORMATS:
+            return f"Error: Invalid output format {output_format}. Must be one of: {', '.join(OUTPUT_FORMATS)}"
+
+        if self.cache is None:
+            return self._run_query(query, output_format, max_rows, max_output_bytes)[0]
+
+        # The cache is process-wide: key by backend and data source too, not only by generation
+        key = (self.backend, str(self.pool.db_path), self.parquet_root if self.engine else None,
+               normalize_sql(query), output_format, max_rows, max_output_bytes)
+        generation = self.engine.data_generation() if self.engine else self.pool.data_generation()
+        cached = self.cache.get(key, generation)
+        if cached is not None:
+            logger.debug(f"Query result cache hit: {key[3]}")
+            return cached
+
+        result, served_generation = self._run_query(query, output_format, max_rows, max_output_bytes)
+        if not result.startswith("Error:"):
+            # Kết quả từ bản DuckDB cũ (đang nạp lại) gắn với generation cũ -> không bị trả lại sau này
+            self.cache.put(key, result, generation if served_generation is None else served_generation)
+        return result
+
+    def _run_query(self, query: str, output_format: str, max_rows: int, max_output_bytes: int) -> tuple:
+        """
+        Returns:
+            tuple: (output, generation of the data it was computed on, or None
+                when it was read from the current database file).
+        """
+        if self.engine is not None:
+            output, generation = self._run_duckdb(query, output_format, max_rows, max_output_bytes)
+            if output is not None:
+                return output, generation
+        return self._run_sqlite(query, output_format, max_rows, max_output_bytes), None
+
+    def _run_duckdb(self, query: str, output_format: str, max_rows: int, max_output_bytes: int) -> tuple:
+        """
+        Run `query` on the DuckDB copy under the guard's statement check and
+        time budget. Returns (output, generation of the copy); output is None
+        when the query should run on SQLite instead: the first copy is still
+        loading, or DuckDB cannot handle the SQLite dialect of the query and
+        `fallback` is set.
+        """
+        import duckdb
+        from data.duckdb_engine import DuckDBNotReady, sqlite_dialect
 
-    def query_vnstock_data(self, query: str) -> str:
-        if not self.db.conn:
-            logger.error("Cannot execute query: database connection is not established")
-            return "Error: No database connection. Please check the database file."
         try:
-            logger.debug(f"Executing SQL query: {query}")
-            cursor = self.db.conn.cursor()
-            cursor.execute(query)
-            result = cursor.fetchall()
-            logger.debug(f"Query result: {result}")
-            if not result:
-                logger.info("Query returned empty result")
-                return "No data found for the given query."
-
-            headers = [desc[0] for desc in cursor.description]
-            formatted_rows = []
-            for row in result:
-                row_str = ", ".join([f"{col}: {val}" for col, val in zip(headers, row)])
-                formatted_rows.append(row_str)
-            return "\n".join(formatted_rows)
+            statement = self.guard.check_statement(query)
+            with self.engine.cursor() as (cursor, generation):
+                # DuckDB không có progress handler: ngắt truy vấn khi hết thời gian
+                timer = threading.Timer(self.guard.timeout, cursor.interrupt)
+                timer.start()
+                try:
+                    logger.debug(f"Executing SQL query on DuckDB: {statement}")
+                    cursor.execute(sqlite_dialect(statement))
+                    headers = self._sqlite_headers(statement, cursor.description)
+                    return self._format_result(cursor, output_format, max_rows, max_output_bytes, headers), generation
+                finally:
+                    timer.cancel()
+        except DuckDBNotReady as e:
+            logger.info(f"{e}; running query on SQLite")
+            return None, None
+        except QueryRejected as e:
+            logger.warning(f"Query {e.status}: {e.reason} - {query}")
+            return e.to_observation(), None
+        except duckdb.InterruptException:
+            e = self.guard.timed_out()
+            logger.warning(f"Query {e.status}: {e.reason} - {query}")
+            return e.to_observation(), None
+        except (duckdb.ParserException, duckdb.BinderException, duckdb.CatalogException,
+                duckdb.NotImplementedException) as e:
+            if self.fallback:
+                logger.info(f"DuckDB cannot run query, falling back to SQLite: {e}")
+                return None, None
+            logger.error(f"Error executing SQL query: {e}")
+            return f"Error: Unable to execute query - {str(e)}", None
+        except FileNotFoundError as e:
+            logger.error(f"Cannot execute query: {e}")
+            return "Error: No database connection. Please check the database file.", None
         except Exception as e:
             logger.error(f"Error executing SQL query: {e}")
-            return f"Error: Unable to execute query - {str(e)}"
\ No newline at end of file
+            return f"Error: Unable to execute query - {str(e)}", None
+
+    def _sqlite_headers(self, query: str, description) -> list:
+        """
+        Column names SQLite gives `query`, or None to keep DuckDB's.
+
+        Both engines name plain column references alike; only unaliased
+        expressions differ (`max(close)` vs `max("close")`). For those, the
+        names come from a zero-row SQLite probe, cached by normalized SQL and
+        database generation so a repeated query does not touch SQLite again.
+        """
+        names = [desc[0] for desc in description] if description else []
+        if all(_PLAIN_NAME_RE.fullmatch(name) for name in names):
+            return None
+        key = (str(self.pool.db_path), normalize_sql(query))
+        generation = self.pool.data_generation()
+        cached = _header_cache.get(key, generation)
+        if cached is not None:
+            return json.loads(cached)
+        try:
+            with self.pool.connection() as conn:
+                with self.guard.limits(conn):
+                    cursor = conn.execute(f"SELECT * FROM ({query}) WHERE 0")
+                    try:
+                        headers = [desc[0] for desc in cursor.description]
+                    finally:
+                        cursor.close()
+        except Exception as e:
+            logger.debug(f"Cannot read SQLite column names: {e}")
+            return None
+        _header_cache.put(key, json.dumps(headers), generation)
+        return headers
+
+    def _run_sqlite(self, query: str, output_format: str, max_rows: int, max_output_bytes: int) -> str:
+        try:
+            with self.pool.connection() as conn:
+                decision = self.guard.prepare(conn, query, self.pool.data_generation())
+                logger.debug(f"Executing SQL query: {decision.query}")
+                cursor = conn.cursor()
+                try:
+                    with self.guard.limits(conn):
+                        cursor.execute(decision.query)
+                        output = self._format_result(cursor, output_format, max_rows, max_output_bytes,
+                                                     row_cap=decision.row_cap)
+                finally:
+                    cursor.close()
+            if decision.notes:
+                output = "\n".join([output] + decision.notes)
+            return output
+        except QueryRejected as e:
+            logger.warning(f"Query {e.status}: {e.reason} - {query}")
+            return e.to_observation()
+        except FileNotFoundError as e:
+            logger.error(f"Cannot execute query: {e}")
+            return "Error: No database connection. Please check the database file."
+        except TimeoutError as e:
+            logger.error(f"Cannot execute query: {e}")
+            return "Error: Database is busy. Please try again."
+        except Exception as e:
+            logger.error(f"Error executing SQL query: {e}")
+            return f"Error: Unable to execute query - {str(e)}"
+
+    def _format_result(self, cursor, output_format: str, max_rows: int, max_output_bytes: int,
+                       headers: list = None, row_cap: int = None) -> str:
+        """
+        Stream rows from `cursor` into the output string with `fetchmany`,
+        stopping as soon as `max_rows` or `max_output_bytes` is reached.
+        `headers` overrides the cursor's column names when the counts match.
+        `row_cap` is the LIMIT the guard added to the query, if any: a count
+        that reaches it is only a lower bound.
+        """
+        described = [desc[0] for desc in cursor.description] if cursor.description else []
+        if not headers or len(headers) != len(described):
+            headers = described
+        lines = []
+        used_bytes = 0
+        if output_format == "csv" and headers:
+            lines.append(self._csv_line(headers))
+            used_bytes = len(lines[0].encode("utf-8")) + 1
+
+        shown = 0
+        truncated = False
+        while not truncated:
+            batch = cursor.fetchmany(self.fetch_size)
+            if not batch:
+                break
+            for i, row in enumerate(batch):
+                if shown >= max_rows:
+                    truncated = True
+                else:
+                    line = self._format_row(headers, row, output_format)
+                    line_bytes = len(line.encode("utf-8")) + 1
+                    if used_bytes + line_bytes > max_output_bytes and shown > 0:
+                        truncated = True
+                    else:
+                        if used_bytes + line_bytes > max_output_bytes:
+                            # A single huge row: cut it rather than flood the context
+                            budget = max(max_output_bytes - used_bytes, 0)
+                            line = line.encode("utf-8")[:budget].decode("utf-8", errors="ignore") + " ... [truncated]"
+                            line_bytes = budget
+                        lines.append(line)
+                        used_bytes += line_bytes
+                        shown += 1
+                if truncated:
+                    remaining = len(batch) - i
+                    break
+
+        if shown == 0 and not truncated:
+            logger.info("Query returned empty result")
+            return "No data found for the given query."
+
+        if truncated:
+            total, exact = self._estimate_total(cursor, shown + remaining)
+            if row_cap is not None and total >= row_cap:
+                exact = False
+            total_str = f"{total}" if exact else f"at least {total}"
+            lines.append(
+                f"... [truncated: showing {shown} of {total_str} rows. "
+                f"Use WHERE, aggregates or LIMIT to narrow the query]"
+            )
+            logger.info(f"Query output truncated at {shown} rows ({total_str} total)")
+
+        return "\n".join(lines)
+
+    def _estimate_total(self, cursor, seen: int) -> tuple:
+        """Count the rows left in `cursor` up to `count_limit`. Returns (count, exact)."""
+        total = seen
+        while total < self.count_limit:
+            batch = cursor.fetchmany(max(self.fetch_size, 1000))
+            if not batch:
+                return total, True
+            total += len(batch)
+        return total, False
+
+    @staticmethod
+    def _format_row(headers: list, row: tuple, output_format: str) -> str:
+        if output_format == "csv":
+            return VNStockQueryTool._csv_line(row)
+        return ", ".join([f"{col}: {val}" for col, val in zip(headers, row)])
+
+    @staticmethod
+    def _csv_line(values) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="").writerow(["" if v is None else v for v in values])
+        return buffer.getvalue()
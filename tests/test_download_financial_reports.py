@@ -0,0 +1,119 @@
+import sys
+import types
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+AUTO_DOWN_DATA = Path(__file__).resolve().parent.parent / "data" / "auto_down_data"
+
+
+def _report(symbol: str, items: list, years: int = 3) -> pd.DataFrame:
+    rows = [[year, 4] + [(len(item) * year + ord(symbol[0])) % 1000 / 10 for item in items]
+            for year in range(2020, 2020 + years)]
+    return pd.DataFrame(rows, columns=["yearReport", "lengthReport"] + items)
+
+
+def _ratio(symbol: str) -> pd.DataFrame:
+    df = _report(symbol, ["ROE (%)", "P/E"])
+    df.columns = pd.MultiIndex.from_tuples(
+        [("Meta", "yearReport"), ("Meta", "lengthReport"),
+         ("Chỉ tiêu khả năng sinh lợi", "ROE (%)"), ("Chỉ tiêu định giá", "P/E")])
+    return df
+
+
+# Ngân hàng và doanh nghiệp thường có bộ chỉ tiêu khác nhau
+COMPANY_ITEMS = ["Revenue (Bn. VND)", "Net Profit For the Year", "Inventories"]
+BANK_ITEMS = ["Net Interest Income", "Net Profit For the Year", "Loans and advances to customers"]
+
+INPUTS = {
+    "EMPTY": {report: pd.DataFrame(columns=["yearReport"]) for report in
+              ("income_statement", "balance_sheet", "cash_flow", "ratio")},
+    "AAA": {"income_statement": _report("AAA", COMPANY_ITEMS), "balance_sheet": _report("AAA", COMPANY_ITEMS),
+            "cash_flow": _report("AAA", ["Operating cash flow"]), "ratio": _ratio("AAA")},
+    "BNK": {"income_statement": _report("BNK", BANK_ITEMS), "balance_sheet": _report("BNK", BANK_ITEMS),
+            "cash_flow": _report("BNK", ["Operating cash flow"], years=2), "ratio": _ratio("BNK")},
+    "CCC": {"income_statement": _report("CCC", COMPANY_ITEMS[:2]), "balance_sheet": _report("CCC", BANK_ITEMS),
+            "cash_flow": _report("CCC", ["Operating cash flow", "Capex"]), "ratio": _ratio("CCC")},
+}
+
+
+class FakeFinance:
+    def __init__(self, symbol: str, source: str):
+        self.reports = INPUTS[symbol]
+
+    def _get(self, report: str) -> pd.DataFrame:
+        return self.reports[report].copy()
+
+    def income_statement(self, period, lang):
+        return self._get("income_statement")
+
+    def balance_sheet(self, period, lang):
+        return self._get("balance_sheet")
+
+    def cash_flow(self, period, lang):
+        return self._get("cash_flow")
+
+    def ratio(self, period, lang):
+        return self._get("ratio")
+
+
+class Crash(BaseException):
+    """Stands in for the process dying; not caught by the downloader."""
+
+
+@pytest.fixture
+def downloader(monkeypatch):
+    monkeypatch.setitem(sys.modules, "vnstock", types.SimpleNamespace(Finance=FakeFinance))
+    monkeypatch.syspath_prepend(str(AUTO_DOWN_DATA))
+    for name in ("download_financial_reports", "download_symbol_screener"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import download_financial_reports
+    return download_financial_reports
+
+
+def _expected(module, report: str) -> pd.DataFrame:
+    frames = []
+    for symbol, reports in INPUTS.items():
+        df = module.flatten_columns(reports[report].assign(ticker=symbol))
+        if len(df):
+            frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _assert_output_matches_input(module, output_dir: Path) -> None:
+    for report, file_name in module.REPORT_FILES.items():
+        expected = _expected(module, report)
+        actual = pd.read_csv(output_dir / file_name)
+        assert len(actual) == len(expected), file_name
+        assert sorted(actual.columns) == sorted(expected.columns), file_name
+        pd.testing.assert_frame_equal(actual[expected.columns], expected, check_dtype=False, obj=file_name)
+    assert module.verify_financial_reports(output_dir)
+
+
+def test_output_rows_and_columns_match_input(downloader, tmp_path):
+    totals = downloader.download_vnstock_financial_reports(list(INPUTS), "year", tmp_path, batch_size=len(INPUTS))
+
+    _assert_output_matches_input(downloader, tmp_path)
+    assert totals == {file_name: len(_expected(downloader, report))
+                      for report, file_name in downloader.REPORT_FILES.items()}
+
+
+def test_resume_after_crash_writes_every_row_once(downloader, tmp_path, monkeypatch):
+    append_report = downloader._append_report
+
+    def crash_after_bank_balance_sheet(df, path):
+        written = append_report(df, path)
+        # BNK vừa mở rộng header của income_statements và balance_sheets
+        if path.name == "balance_sheets.csv" and (df["ticker"] == "BNK").any():
+            raise Crash()
+        return written
+
+    monkeypatch.setattr(downloader, "_append_report", crash_after_bank_balance_sheet)
+    with pytest.raises(Crash):
+        downloader.download_vnstock_financial_reports(list(INPUTS), "year", tmp_path, batch_size=len(INPUTS))
+
+    monkeypatch.setattr(downloader, "_append_report", append_report)
+    downloader.download_vnstock_financial_reports(list(INPUTS), "year", tmp_path, batch_size=len(INPUTS))
+
+    _assert_output_matches_input(downloader, tmp_path)
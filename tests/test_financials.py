@@ -0,0 +1,50 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+AUTO_DOWN_DATA = Path(__file__).resolve().parent.parent / "data" / "auto_down_data"
+
+
+@pytest.fixture
+def modules(monkeypatch):
+    monkeypatch.syspath_prepend(str(AUTO_DOWN_DATA))
+    import financials
+    import import_to_sql
+    import parquet_store
+    return financials, import_to_sql, parquet_store
+
+
+def _items(conn: sqlite3.Connection, ticker: str) -> set:
+    return {row[0] for row in conn.execute("""
+        SELECT DISTINCT i.item FROM vnstock_financial_values v
+        JOIN vnstock_financial_items i ON i.item_id = v.item_id
+        WHERE v.ticker = ? AND i.report = 'income_statement'
+    """, (ticker,))}
+
+
+def test_parquet_import_keeps_columns_of_every_file(modules, tmp_path):
+    financials, import_to_sql, parquet_store = modules
+    # Ngân hàng có chỉ tiêu riêng; file doanh nghiệp thường có thể được đọc trước
+    company = pd.DataFrame({"yearReport": [2023, 2024], "lengthReport": [4, 4],
+                            "Revenue (Bn. VND)": [100, 120], "Net Profit For the Year": [10, 12]})
+    bank = pd.DataFrame({"yearReport": [2023, 2024], "lengthReport": [4, 4],
+                         "Net Interest Income": [50.5, 60.5], "Net Profit For the Year": [20.0, 25.0],
+                         "Loans and advances to customers": [900.0, 950.0]})
+    root = tmp_path / "income_statements"
+    parquet_store.write_report_parquet(company, root, "AAA")
+    parquet_store.write_report_parquet(bank, root, "VCB")
+
+    conn = sqlite3.connect(tmp_path / "test.db")
+    try:
+        conn.execute(import_to_sql.PRICES_SQL)
+        written = financials.import_financial_reports(conn, tmp_path, source="parquet")
+
+        assert _items(conn, "AAA") == {"Revenue (Bn. VND)", "Net Profit For the Year"}
+        assert _items(conn, "VCB") == {"Net Interest Income", "Net Profit For the Year",
+                                       "Loans and advances to customers"}
+        assert written["income_statement"] == 2 * 2 + 2 * 3
+    finally:
+        conn.close()